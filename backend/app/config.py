@@ -0,0 +1,106 @@
+"""
+Application configuration read from environment variables (or a .env file)
+"""
+import os
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Extractive reader model (loaded in the background after startup)
+MODEL_NAME = os.getenv("QA_MODEL_NAME", "deepset/roberta-base-squad2")
+# Run one dummy inference after loading so the first request does not pay for it
+MODEL_WARMUP = os.getenv("QA_MODEL_WARMUP", "true").lower() in ("1", "true", "yes")
+
+# Reader token budget for question + passage
+READER_MAX_SEQ_LENGTH = int(os.getenv("QA_READER_MAX_SEQ_LENGTH", "384"))
+
+# Passage chunking at ingest: "sentences" (sliding sentence windows) or "tokens"
+# (chunks sized with the reader's tokenizer to fill its token budget)
+CHUNKING = os.getenv("QA_CHUNKING", "sentences")
+# Token chunking: tokens reserved for the question, tokens shared by consecutive
+# chunks, and an explicit chunk size (0 derives it from the budget; stride = size - overlap)
+CHUNK_QUESTION_TOKENS = int(os.getenv("QA_CHUNK_QUESTION_TOKENS", "64"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("QA_CHUNK_OVERLAP_TOKENS", "64"))
+CHUNK_MAX_TOKENS = int(os.getenv("QA_CHUNK_MAX_TOKENS", "0"))
+
+# Retrieval backend used for uploaded documents and direct text: "tfidf" or "bm25"
+RETRIEVER = os.getenv("QA_RETRIEVER", "tfidf")
+
+# Shards of the lexical index, searched in parallel on a thread pool (1 disables sharding)
+INDEX_SHARDS = int(os.getenv("QA_INDEX_SHARDS", "1"))
+
+# Maximum (question, passage) pairs scored in one padded reader forward pass
+READER_BATCH_SIZE = int(os.getenv("QA_READER_BATCH_SIZE", "8"))
+
+# Early exit: read passages best-first in rounds and stop once an answer's
+# reader score reaches the threshold or the unread passages cannot reach the top-k.
+# Off by default: rounds run one after another, and a round smaller than the
+# reader batch gives up part of the batched forward pass
+EARLY_EXIT = os.getenv("QA_EARLY_EXIT", "false").lower() in ("1", "true", "yes")
+EARLY_EXIT_THRESHOLD = float(os.getenv("QA_EARLY_EXIT_THRESHOLD", "0.9"))
+EARLY_EXIT_ROUND_SIZE = int(os.getenv("QA_EARLY_EXIT_ROUND_SIZE", str(READER_BATCH_SIZE)))
+
+# Passages retrieved per question as a multiple of top_k (more candidates for the reader)
+RETRIEVAL_CANDIDATE_FACTOR = int(os.getenv("QA_RETRIEVAL_CANDIDATE_FACTOR", "1"))
+
+# Most questions accepted by one /api/qa/ask-batch request
+ASK_BATCH_MAX_QUESTIONS = int(os.getenv("QA_ASK_BATCH_MAX_QUESTIONS", "256"))
+
+# Cross-request micro-batching of reader calls
+BATCH_MAX_SIZE = int(os.getenv("QA_BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.getenv("QA_BATCH_MAX_WAIT_MS", "5"))
+
+# Executor pools for blocking work (0 process workers parses documents in threads)
+THREAD_POOL_WORKERS = int(os.getenv("QA_THREAD_POOL_WORKERS", "4"))
+PROCESS_POOL_WORKERS = int(os.getenv("QA_PROCESS_POOL_WORKERS", "2"))
+
+# Background ingestion jobs (POST /api/documents/upload?background=true)
+INGESTION_WORKERS = int(os.getenv("QA_INGESTION_WORKERS", "2"))
+INGESTION_MAX_PENDING = int(os.getenv("QA_INGESTION_MAX_PENDING", "100"))
+
+# Uploads are streamed to unique temporary files in UPLOAD_DIR
+UPLOAD_DIR = os.getenv("QA_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "qa_uploads"))
+MAX_UPLOAD_BYTES = int(os.getenv("QA_MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("QA_UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+
+# Answer cache for /api/qa/ask (0 entries disables it; 0 TTL never expires)
+ANSWER_CACHE_SIZE = int(os.getenv("QA_ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("QA_ANSWER_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("QA_ANSWER_CACHE_TTL_SECONDS", "300"))
+
+# Reader cache: memoized reader outputs and passage tokenizations (0 entries disables a table)
+READER_CACHE_SIZE = int(os.getenv("QA_READER_CACHE_SIZE", "4096"))
+READER_CACHE_MAX_BYTES = int(os.getenv("QA_READER_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+ENCODING_CACHE_SIZE = int(os.getenv("QA_ENCODING_CACHE_SIZE", "2048"))
+ENCODING_CACHE_MAX_BYTES = int(os.getenv("QA_ENCODING_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Durable corpus store (SQLite); empty keeps documents in memory only
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+CORPUS_STORE_PATH = os.getenv("QA_CORPUS_STORE", os.path.join(DATA_DIR, "corpus.db"))
+# Newly indexed passages after which the retrieval index is snapshotted to the store
+INDEX_SNAPSHOT_EVERY = int(os.getenv("QA_INDEX_SNAPSHOT_EVERY", "50000"))
+# Milliseconds between polls for changes other worker processes made to the store
+# (set it when running several uvicorn workers; 0 disables polling)
+CORPUS_SYNC_INTERVAL_MS = int(os.getenv("QA_CORPUS_SYNC_INTERVAL_MS", "0"))
+
+# Reader forward pass: "pytorch", "onnx" or "onnx-int8" (ONNX Runtime on CPU, needs onnxruntime)
+READER_BACKEND = os.getenv("QA_READER_BACKEND", "pytorch")
+ONNX_DIR = os.getenv("QA_ONNX_DIR", os.path.join(DATA_DIR, "onnx"))
+ONNX_THREADS = int(os.getenv("QA_ONNX_THREADS", "0"))
+
+# Dense retrieval fused with the lexical retriever (embeddings computed once per passage at ingest)
+DENSE_RETRIEVAL = os.getenv("QA_DENSE_RETRIEVAL", "false").lower() in ("1", "true", "yes")
+DENSE_MODEL = os.getenv("QA_DENSE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# Vector matrix file (empty keeps vectors in memory), stored as "float16" or "int8"
+DENSE_VECTORS_PATH = os.getenv("QA_DENSE_VECTORS_PATH", os.path.join(DATA_DIR, "vectors.bin") if CORPUS_STORE_PATH else "")
+DENSE_VECTOR_DTYPE = os.getenv("QA_DENSE_VECTOR_DTYPE", "float16")
+DENSE_NPROBE = int(os.getenv("QA_DENSE_NPROBE", "16"))
+# Share of the dense score in the fused retrieval score
+DENSE_WEIGHT = float(os.getenv("QA_DENSE_WEIGHT", "0.5"))
+
+# Document text storage: "memory" (Python strings) or "mmap" (shared UTF-8 segment file)
+TEXT_STORE = os.getenv("QA_TEXT_STORE", "memory")
+TEXT_SEGMENT_PATH = os.getenv("QA_TEXT_SEGMENT_PATH", os.path.join(DATA_DIR, "text.seg"))
+# Share of the segment file taken by deleted text that triggers a compaction (0 disables it)
+TEXT_COMPACT_RATIO = float(os.getenv("QA_TEXT_COMPACT_RATIO", "0.5"))
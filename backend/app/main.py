@@ -7,7 +7,9 @@ from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 import os
 
+from app import config
 from app.routes import documents, qa
+from app.utils.uploads import UploadSizeLimit
 
 
 # Create FastAPI app
@@ -26,6 +28,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Cap upload bodies while they arrive (the route checks the exact file size)
+app.add_middleware(
+    UploadSizeLimit,
+    paths=["/api/documents/upload"],
+    max_bytes=config.MAX_UPLOAD_BYTES + 64 * 1024
+)
+
 # Include routers
 app.include_router(documents.router)
 app.include_router(qa.router)
@@ -40,7 +49,8 @@ async def root():
             "docs": "/docs",
             "redoc": "/redoc",
             "documents": "/api/documents",
-            "qa": "/api/qa"
+            "qa": "/api/qa",
+            "metrics": "/api/metrics"
         }
     }
 
@@ -51,6 +61,35 @@ async def health_check():
     return {"status": "ok", "message": "API is running"}
 
 
+@app.get("/api/metrics")
+async def metrics():
+    """Executor pool, inference batching and cache metrics"""
+    return {
+        "executor": documents.get_executor().get_statistics(),
+        "scheduler": qa.scheduler.get_statistics(),
+        "answer_cache": qa.answer_cache.get_statistics(),
+        "reader_cache": qa.reader_cache.get_statistics(),
+        "qa_engine": qa.qa_engine.get_status(),
+        "ingestion": documents.get_ingestion_queue().get_statistics()
+    }
+
+
+@app.on_event("startup")
+async def startup():
+    """Start loading the QA model without blocking the server from accepting requests"""
+    qa.start_model_loading()
+    documents.start_corpus_sync()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop worker pools and snapshot the retrieval index"""
+    documents.get_executor().shutdown()
+    documents.get_ingestion_queue().shutdown()
+    documents.get_indexer().stop_sync()
+    documents.get_indexer().save_snapshot()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -14,12 +14,32 @@ class AnswerResult(BaseModel):
     source_text: str
     start_position: int
     end_position: int
+    passage_id: Optional[int] = None
+
+
+class DocumentFilter(BaseModel):
+    """Model for metadata filters on the documents a question searches"""
+    filename: Optional[str] = None  # Glob pattern, e.g. "*.pdf"
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
 
 
 class QuestionRequest(BaseModel):
     """Model for question requests"""
     question: str
     top_k: int = 3
+    use_cache: bool = True
+    doc_ids: Optional[List[str]] = None
+    filters: Optional[DocumentFilter] = None
+
+
+class BatchQuestionRequest(BaseModel):
+    """Model for batched question requests (doc_ids and filters apply to every question)"""
+    questions: List[str]
+    top_k: int = 3
+    use_cache: bool = True
+    doc_ids: Optional[List[str]] = None
+    filters: Optional[DocumentFilter] = None
 
 
 class DocumentMetadata(BaseModel):
@@ -29,6 +49,7 @@ class DocumentMetadata(BaseModel):
     upload_time: datetime
     text_length: int
     num_sentences: int
+    sha256: Optional[str] = None
 
 
 class DocumentResponse(BaseModel):
@@ -38,6 +59,37 @@ class DocumentResponse(BaseModel):
     filename: str
 
 
+class IngestionJobResponse(BaseModel):
+    """Response model for uploads queued as background ingestion jobs"""
+    message: str
+    job_id: str
+    filename: str
+    status_url: str
+
+
+class IngestionJobTiming(BaseModel):
+    """Model for ingestion job timing (seconds, None until the stage starts)"""
+    queued_seconds: Optional[float] = None
+    extraction_seconds: Optional[float] = None
+    indexing_seconds: Optional[float] = None
+    total_seconds: Optional[float] = None
+
+
+class IngestionJobStatus(BaseModel):
+    """Model for ingestion job status"""
+    job_id: str
+    filename: str
+    state: str
+    doc_id: Optional[str] = None
+    error: Optional[str] = None
+    pages_done: int
+    pages_total: int
+    passages_done: int
+    passages_total: int
+    submitted_at: datetime
+    timing: IngestionJobTiming
+
+
 class DocumentListResponse(BaseModel):
     """Response model for listing documents"""
     documents: List[DocumentMetadata]
@@ -49,6 +101,18 @@ class QAResponse(BaseModel):
     question: str
     answers: List[AnswerResult]
     processing_time: float
+    cached: bool = False
+    reader_calls_skipped: int = 0
+
+
+class BatchQAResponse(BaseModel):
+    """Response model for batched QA queries"""
+    results: List[QAResponse]
+    processing_time: float
+    retrieval_time: float
+    reader_time: float
+    cached_count: int = 0
+    reader_calls_skipped: int = 0
 
 
 class DirectTextRequest(BaseModel):
@@ -3,23 +3,78 @@ Document upload and management routes
 """
 import os
 import time
+from typing import Union
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.models.schemas import DocumentResponse, DocumentListResponse, DocumentMetadata, ErrorResponse
+from app import config
+from app.models.schemas import (
+    DocumentResponse, DocumentListResponse, DocumentMetadata, ErrorResponse,
+    IngestionJobResponse, IngestionJobStatus
+)
+from app.services.corpus_store import CorpusStore
 from app.services.document_indexer import DocumentIndexer
+from app.services.executor import ExecutorPool
+from app.services.ingestion_queue import IngestionQueue, IngestionQueueFull
+from app.services.text_store import TextSegmentFile
 from app.utils.document_processor import DocumentProcessor
+from app.utils.token_chunker import TokenChunker
+from app.utils.uploads import save_upload, UploadTooLarge
 
 router = APIRouter(prefix="/api/documents", tags=["documents"])
 
+# Token-aware chunking with the reader's tokenizer (None keeps sentence windows)
+chunker = TokenChunker(
+    config.MODEL_NAME,
+    max_seq_length=config.READER_MAX_SEQ_LENGTH,
+    question_tokens=config.CHUNK_QUESTION_TOKENS,
+    overlap_tokens=config.CHUNK_OVERLAP_TOKENS,
+    max_tokens=config.CHUNK_MAX_TOKENS
+) if config.CHUNKING == "tokens" else None
+
 # Initialize the document indexer
-indexer = DocumentIndexer()
+indexer = DocumentIndexer(
+    retriever=f"{config.RETRIEVER}+dense" if config.DENSE_RETRIEVAL else config.RETRIEVER,
+    store=CorpusStore(config.CORPUS_STORE_PATH) if config.CORPUS_STORE_PATH else None,
+    snapshot_every=config.INDEX_SNAPSHOT_EVERY,
+    text_store=TextSegmentFile(config.TEXT_SEGMENT_PATH) if config.TEXT_STORE == "mmap" else None,
+    chunker=chunker,
+    text_compact_ratio=config.TEXT_COMPACT_RATIO,
+    index_options={
+        "shards": config.INDEX_SHARDS,
+        "dense_options": {
+            "model_name": config.DENSE_MODEL,
+            # Workers sharing a store cannot share one vector file; each keeps its own in memory
+            "path": (config.DENSE_VECTORS_PATH or None) if config.CORPUS_SYNC_INTERVAL_MS <= 0 else None,
+            "dtype": config.DENSE_VECTOR_DTYPE,
+            "nprobe": config.DENSE_NPROBE,
+            "dense_weight": config.DENSE_WEIGHT
+        } if config.DENSE_RETRIEVAL else None
+    }
+)
+
+# Pools for blocking work so the event loop keeps serving other requests
+executor = ExecutorPool(
+    thread_workers=config.THREAD_POOL_WORKERS,
+    process_workers=config.PROCESS_POOL_WORKERS
+)
+
+# Bounded worker pool for uploads processed as background jobs
+ingestion = IngestionQueue(
+    indexer,
+    executor=executor,
+    max_workers=config.INGESTION_WORKERS,
+    max_pending=config.INGESTION_MAX_PENDING
+)
 
 
-@router.post("/upload", response_model=DocumentResponse)
-async def upload_document(file: UploadFile = File(...)):
+@router.post("/upload", response_model=Union[DocumentResponse, IngestionJobResponse])
+async def upload_document(file: UploadFile = File(...), background: bool = False):
     """
     Upload and process a document
     
     Supported formats: PDF, DOCX, TXT
+    
+    With ``background=true`` the upload returns a job id immediately and the
+    document is processed by the ingestion queue; poll /jobs/{job_id}.
     """
     try:
         # Validate file extension
@@ -29,21 +84,54 @@ async def upload_document(file: UploadFile = File(...)):
                 detail=f"Unsupported file format. Allowed: PDF, DOCX, TXT"
             )
         
-        # Save uploaded file temporarily
-        upload_dir = "/tmp/qa_uploads"
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        file_path = os.path.join(upload_dir, file.filename)
-        contents = await file.read()
-        
-        with open(file_path, 'wb') as f:
-            f.write(contents)
+        # Stream the upload to a unique temporary file
+        try:
+            file_path, file_size, content_hash = await save_upload(
+                file,
+                config.UPLOAD_DIR,
+                max_bytes=config.MAX_UPLOAD_BYTES,
+                chunk_size=config.UPLOAD_CHUNK_BYTES
+            )
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
         
-        # Process document
-        doc_id, text_length, num_passages = indexer.add_document(file_path, file.filename)
+        if background:
+            try:
+                job_id = ingestion.submit(file_path, file.filename, content_hash=content_hash)
+            except Exception as e:
+                # The queue never took the file, so nothing else will remove it
+                os.remove(file_path)
+                if isinstance(e, IngestionQueueFull):
+                    raise HTTPException(status_code=503, detail=str(e))
+                raise
+            
+            return IngestionJobResponse(
+                message="Document queued for processing",
+                job_id=job_id,
+                filename=file.filename,
+                status_url=f"/api/documents/jobs/{job_id}"
+            )
         
-        # Clean up temporary file
-        os.remove(file_path)
+        try:
+            # Parse page ranges in the process pool, then split and index in the thread pool
+            try:
+                text, page_starts = await executor.run_in_thread(
+                    DocumentProcessor.extract_text_with_pages,
+                    file_path,
+                    executor=executor.get_process_pool()
+                )
+            except Exception as e:
+                raise ValueError(f"Error processing document: {str(e)}")
+            doc_id, text_length, num_passages = await executor.run_in_thread(
+                indexer.add_text,
+                text,
+                file.filename,
+                page_starts=page_starts,
+                content_hash=content_hash
+            )
+        finally:
+            # Clean up temporary file
+            os.remove(file_path)
         
         return DocumentResponse(
             message="Document uploaded and processed successfully",
@@ -57,6 +145,15 @@ async def upload_document(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/jobs/{job_id}", response_model=IngestionJobStatus)
+async def get_ingestion_job(job_id: str):
+    """Get state, progress and timing of a background ingestion job"""
+    job = ingestion.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return IngestionJobStatus(**job)
+
+
 @router.get("/list", response_model=DocumentListResponse)
 async def list_documents():
     """Get list of all uploaded documents"""
@@ -74,7 +171,7 @@ async def list_documents():
 async def delete_document(doc_id: str):
     """Delete a document by ID"""
     try:
-        if indexer.delete_document(doc_id):
+        if await executor.run_in_thread(indexer.delete_document, doc_id):
             return {"message": "Document deleted successfully", "doc_id": doc_id}
         else:
             raise HTTPException(status_code=404, detail="Document not found")
@@ -88,7 +185,7 @@ async def delete_document(doc_id: str):
 async def get_statistics():
     """Get indexing statistics"""
     try:
-        stats = indexer.get_statistics()
+        stats = await executor.run_in_thread(indexer.get_statistics)
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -98,12 +195,33 @@ async def get_statistics():
 async def clear_all_documents():
     """Clear all documents (for testing)"""
     try:
-        indexer.clear_all()
+        await executor.run_in_thread(indexer.clear_all)
         return {"message": "All documents cleared"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def start_corpus_sync() -> None:
+    """Poll the corpus store for uploads and deletes made by other worker processes"""
+    if config.CORPUS_SYNC_INTERVAL_MS > 0:
+        indexer.start_sync(config.CORPUS_SYNC_INTERVAL_MS / 1000)
+
+
 def get_indexer():
     """Get the document indexer instance (for use in other routes)"""
     return indexer
+
+
+def get_chunker():
+    """Get the token chunker, or None with sentence-window passages (for use in other routes)"""
+    return chunker
+
+
+def get_executor():
+    """Get the executor pools (for use in other routes)"""
+    return executor
+
+
+def get_ingestion_queue():
+    """Get the ingestion job queue (for use in other routes)"""
+    return ingestion
@@ -1,18 +1,198 @@
 """
 Question answering routes
 """
+import asyncio
+import json
 import time
-from fastapi import APIRouter, HTTPException
-from app.models.schemas import QuestionRequest, DirectTextRequest, QAResponse, AnswerResult
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from app import config
+from app.models.schemas import (
+    QuestionRequest, BatchQuestionRequest, DirectTextRequest, QAResponse, BatchQAResponse, AnswerResult,
+    DocumentFilter
+)
 from app.services.qa_engine import QAEngine
+from app.services.cache import AnswerCache, ReaderCache
+from app.services.inference_scheduler import InferenceScheduler
 from app.services.document_indexer import DocumentIndexer
 from app.utils.document_processor import DocumentProcessor
-from app.routes.documents import get_indexer
+from app.routes.documents import get_indexer, get_executor, get_chunker
 
 router = APIRouter(prefix="/api/qa", tags=["qa"])
 
-# Initialize QA engine
-qa_engine = QAEngine()
+# Reader outputs and passage tokenizations shared across questions
+reader_cache = ReaderCache(
+    max_results=config.READER_CACHE_SIZE,
+    max_result_bytes=config.READER_CACHE_MAX_BYTES,
+    max_encodings=config.ENCODING_CACHE_SIZE,
+    max_encoding_bytes=config.ENCODING_CACHE_MAX_BYTES
+)
+
+# QA engine; the model is loaded in the background once the app starts (see main.py)
+qa_engine = QAEngine(
+    model_name=config.MODEL_NAME,
+    retriever=config.RETRIEVER,
+    batch_size=config.READER_BATCH_SIZE,
+    max_seq_length=config.READER_MAX_SEQ_LENGTH,
+    reader_cache=reader_cache,
+    load_model=False,
+    backend=config.READER_BACKEND,
+    onnx_dir=config.ONNX_DIR,
+    onnx_threads=config.ONNX_THREADS,
+    early_exit=config.EARLY_EXIT,
+    early_exit_threshold=config.EARLY_EXIT_THRESHOLD,
+    early_exit_round_size=config.EARLY_EXIT_ROUND_SIZE
+)
+
+# Formatted /ask answers, invalidated whenever the corpus version changes
+answer_cache = AnswerCache(
+    max_entries=config.ANSWER_CACHE_SIZE,
+    max_bytes=config.ANSWER_CACHE_MAX_BYTES,
+    ttl_seconds=config.ANSWER_CACHE_TTL_SECONDS
+)
+
+# Reader calls from concurrent requests are micro-batched together
+scheduler = InferenceScheduler(
+    qa_engine,
+    max_batch_size=config.BATCH_MAX_SIZE,
+    max_wait_ms=config.BATCH_MAX_WAIT_MS
+)
+
+
+def start_model_loading() -> None:
+    """Load the QA model on a background thread so the API can serve meanwhile"""
+    qa_engine.load_in_background(warmup=config.MODEL_WARMUP)
+
+
+def require_model() -> None:
+    """Reject a request with 503 until the QA model is ready"""
+    if qa_engine.is_ready:
+        return
+    if qa_engine.status == "failed":
+        raise HTTPException(
+            status_code=503,
+            detail=f"QA model failed to load: {qa_engine.load_error}"
+        )
+    raise HTTPException(
+        status_code=503,
+        detail="QA model is still loading. Please retry shortly.",
+        headers={"Retry-After": "5"}
+    )
+
+
+async def read_passages(
+    question: str,
+    relevant: List[Tuple[str, float, int]],
+    top_k: int,
+    indexed: bool = True
+) -> Tuple[List[Dict], int]:
+    """
+    Run the reader over retrieved passages through the scheduler, with early exit
+    
+    The awaiting counterpart of QAEngine.read_with_early_exit: rounds go
+    through the micro-batching scheduler without holding a worker thread.
+    ``indexed`` is False for positions in ad-hoc text, which must not be used
+    as reader cache keys (they collide with corpus passage ids).
+    
+    Returns:
+        Tuple of (ranked answers, reader calls skipped)
+    """
+    return (await read_passages_batch([question], [relevant], top_k, indexed))[0]
+
+
+async def read_passages_batch(
+    questions: Sequence[str],
+    relevants: Sequence[List[Tuple[str, float, int]]],
+    top_k: int,
+    indexed: bool = True
+) -> List[Tuple[List[Dict], int]]:
+    """
+    Run the reader for several questions together, with early exit per question
+    
+    Each round takes the next passages of every question that is not
+    settled yet and submits all of their (question, passage) pairs to the
+    scheduler at once, so they fill reader batches together.
+    
+    Returns:
+        One (ranked answers, reader calls skipped) tuple per question
+    """
+    ordered = [qa_engine.reading_order(relevant) for relevant in relevants]
+    qa_results: List[List[Dict]] = [[] for _ in questions]
+    answers: List[List[Dict]] = [[] for _ in questions]
+    while True:
+        rounds = []
+        for i in range(len(questions)):
+            batch = qa_engine.next_reading_round(ordered[i], answers[i], len(qa_results[i]), top_k)
+            if batch:
+                rounds.append((i, batch))
+        if not rounds:
+            break
+        
+        results = await scheduler.answer(
+            [(questions[i], passage) for i, batch in rounds for passage, _, _ in batch],
+            passage_ids=[passage_id for _, batch in rounds for _, _, passage_id in batch] if indexed else None
+        )
+        position = 0
+        for i, batch in rounds:
+            qa_results[i].extend(results[position:position + len(batch)])
+            position += len(batch)
+            answers[i] = qa_engine.rank_answers(ordered[i][:len(qa_results[i])], qa_results[i], len(qa_results[i]))
+    
+    return [
+        (answers[i][:top_k], qa_engine.record_skipped(len(ordered[i]) - len(qa_results[i])))
+        for i in range(len(questions))
+    ]
+
+
+def resolve_scope(
+    indexer: DocumentIndexer,
+    doc_ids: Optional[List[str]],
+    filters: Optional[DocumentFilter]
+) -> Optional[Tuple[str, ...]]:
+    """
+    Documents a question is limited to (None searches every document)
+    
+    Raises:
+        HTTPException: 404 for an unknown doc_id, 400 if nothing matches
+    """
+    if doc_ids is None and filters is None:
+        return None
+    missing = [doc_id for doc_id in doc_ids or [] if doc_id not in indexer.documents]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Document not found: {missing[0]}")
+    scope = indexer.select_documents(doc_ids, **(filters.model_dump() if filters else {}))
+    if not scope:
+        raise HTTPException(
+            status_code=400,
+            detail="No documents match the given doc_ids and filters."
+        )
+    return tuple(sorted(scope))
+
+
+def format_answers(indexer: DocumentIndexer, answers: List[Dict]) -> List[Dict]:
+    """Resolve ranked answers to their source documents and offsets"""
+    answer_dicts = []
+    for answer in answers:
+        # Passage ids resolve straight to their document and offsets
+        source = indexer.get_passage_source(answer["passage_id"])
+        if source is None:
+            # Document was deleted while the question was being answered
+            continue
+        source_doc_id, start_pos, end_pos = source
+        source_doc = indexer.get_document(source_doc_id)
+        source_filename = source_doc["filename"] if source_doc else "Unknown"
+        
+        answer_dicts.append({
+            "answer": answer["answer"],
+            "confidence_score": round(answer["confidence_score"], 4),
+            "source_document": source_filename,
+            "source_text": answer["source_text"],
+            "start_position": start_pos,
+            "end_position": end_pos,
+            "passage_id": answer["passage_id"]
+        })
+    return answer_dicts
 
 
 @router.post("/ask", response_model=QAResponse)
@@ -24,58 +204,290 @@ async def ask_question(request: QuestionRequest):
     """
     try:
         indexer = get_indexer()
+        executor = get_executor()
         
-        # Get all passages from uploaded documents
-        all_passages = indexer.get_all_passages()
-        
-        if not all_passages:
+        if not indexer.documents:
             raise HTTPException(
                 status_code=400,
                 detail="No documents uploaded. Please upload documents first."
             )
+        require_model()
         
         start_time = time.time()
         
-        # Process question
-        passages_only = [p[0] for p in all_passages]
-        answers = qa_engine.process_question(
+        # Questions limited to some documents only search those documents' passages
+        corpus_version = indexer.version
+        scope = resolve_scope(indexer, request.doc_ids, request.filters)
+        
+        # Repeated questions against an unchanged corpus are served from the cache
+        use_cache = request.use_cache and answer_cache.enabled
+        cached = answer_cache.get(request.question, request.top_k, corpus_version, scope) if use_cache else None
+        
+        reader_calls_skipped = 0
+        if cached is not None:
+            answer_dicts = cached
+        else:
+            # Retrieve from the persistent index, then run the reader
+            relevant = await executor.run_in_thread(
+                indexer.search,
+                request.question,
+                top_k=request.top_k * config.RETRIEVAL_CANDIDATE_FACTOR,
+                doc_ids=scope
+            )
+            answers, reader_calls_skipped = await read_passages(request.question, relevant, request.top_k)
+            answer_dicts = format_answers(indexer, answers)
+            
+            if use_cache:
+                answer_cache.put(request.question, request.top_k, corpus_version, answer_dicts, scope)
+        
+        processing_time = time.time() - start_time
+        
+        return QAResponse(
+            question=request.question,
+            answers=[AnswerResult(**answer) for answer in answer_dicts],
+            processing_time=round(processing_time, 3),
+            cached=cached is not None,
+            reader_calls_skipped=reader_calls_skipped
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def stream_answers(
+    http_request: Request,
+    request: QuestionRequest,
+    indexer: DocumentIndexer,
+    scope: Optional[Tuple[str, ...]]
+) -> AsyncIterator[Dict]:
+    """
+    Answer a question and yield events as the work progresses
+    
+    Passages are read in the same early-exit rounds as /ask, but every
+    reader result is reported as soon as it arrives. When the client goes
+    away (checked before each round, or the stream is closed), pairs still
+    queued in the scheduler are cancelled and never reach the reader.
+    
+    Yields:
+        "retrieval", "answer" and "done" events (or "error")
+    """
+    start_time = time.time()
+    corpus_version = indexer.version
+    use_cache = request.use_cache and answer_cache.enabled
+    top_k = request.top_k
+    
+    def done(answer_dicts: List[Dict], cached: bool, reader_calls_skipped: int) -> Dict:
+        response = QAResponse(
+            question=request.question,
+            answers=[AnswerResult(**answer) for answer in answer_dicts],
+            processing_time=round(time.time() - start_time, 3),
+            cached=cached,
+            reader_calls_skipped=reader_calls_skipped
+        )
+        return {"event": "done", **response.model_dump()}
+    
+    try:
+        cached = answer_cache.get(request.question, top_k, corpus_version, scope) if use_cache else None
+        if cached is not None:
+            yield {"event": "answer", "answers": cached, "passages_read": 0}
+            yield done(cached, True, 0)
+            return
+        
+        relevant = await get_executor().run_in_thread(
+            indexer.search,
             request.question,
-            [(p[0], p[2], p[3]) for p in all_passages],
-            top_k=request.top_k
+            top_k=top_k * config.RETRIEVAL_CANDIDATE_FACTOR,
+            doc_ids=scope
         )
+        passages = []
+        for _, score, passage_id in relevant:
+            source = indexer.get_passage_source(passage_id)
+            source_doc = indexer.get_document(source[0]) if source else None
+            passages.append({
+                "passage_id": passage_id,
+                "source_document": source_doc["filename"] if source_doc else "Unknown",
+                "similarity_score": round(score, 4)
+            })
+        yield {"event": "retrieval", "passages": passages}
         
-        # Format results
-        answer_results = []
-        for answer in answers:
-            # Find source document for this passage
-            passage_text = answer["source_text"]
-            source_doc_id = None
-            
-            for passage, doc_id, start_pos, end_pos in all_passages:
-                if passage == passage_text:
-                    source_doc_id = doc_id
+        ordered = qa_engine.reading_order(relevant)
+        qa_results = []
+        answers = []
+        futures = []
+        try:
+            while True:
+                batch = qa_engine.next_reading_round(ordered, answers, len(qa_results), top_k)
+                if not batch:
                     break
-            
-            source_doc = indexer.get_document(source_doc_id) if source_doc_id else None
-            source_filename = source_doc["filename"] if source_doc else "Unknown"
-            
-            answer_results.append(
-                AnswerResult(
-                    answer=answer["answer"],
-                    confidence_score=round(answer["confidence_score"], 4),
-                    source_document=source_filename,
-                    source_text=answer["source_text"],
-                    start_position=answer["source_position"],
-                    end_position=answer["source_position"] + 1
+                if await http_request.is_disconnected():
+                    return
+                futures = scheduler.submit(
+                    [(request.question, passage) for passage, _, _ in batch],
+                    passage_ids=[passage_id for _, _, passage_id in batch]
                 )
+                for future in futures:
+                    qa_results.append(await asyncio.wrap_future(future))
+                    answers = qa_engine.rank_answers(ordered[:len(qa_results)], qa_results, len(qa_results))
+                    yield {
+                        "event": "answer",
+                        "answers": format_answers(indexer, answers[:top_k]),
+                        "passages_read": len(qa_results)
+                    }
+        finally:
+            # The scheduler drops cancelled pairs before they reach the reader
+            for future in futures:
+                future.cancel()
+        
+        answer_dicts = format_answers(indexer, answers[:top_k])
+        reader_calls_skipped = qa_engine.record_skipped(len(ordered) - len(qa_results))
+        if use_cache:
+            answer_cache.put(request.question, top_k, corpus_version, answer_dicts, scope)
+        yield done(answer_dicts, False, reader_calls_skipped)
+    
+    except Exception as e:
+        yield {"event": "error", "detail": str(e)}
+
+
+def encode_event(event: Dict, sse: bool) -> str:
+    """Serialize an event as one NDJSON line or one Server-Sent Event"""
+    data = json.dumps(event)
+    if sse:
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+async def encode_events(events: AsyncIterator[Dict], sse: bool) -> AsyncIterator[str]:
+    """Serialize events, closing the event source (and its reader work) when the stream ends"""
+    try:
+        async for event in events:
+            yield encode_event(event, sse)
+    finally:
+        await events.aclose()
+
+
+@router.post("/ask-stream")
+async def ask_question_stream(request: QuestionRequest, http_request: Request):
+    """
+    Ask a question and stream the answers as each reader pass completes
+    
+    The response is newline-delimited JSON, or Server-Sent Events if the
+    client sends ``Accept: text/event-stream``. A ``retrieval`` event lists
+    the retrieved passages right away, an ``answer`` event carries the ranked
+    answers so far after every reader pass, and ``done`` carries the same
+    fields as /ask. Reader work stops when the client disconnects.
+    """
+    try:
+        indexer = get_indexer()
+        
+        if not indexer.documents:
+            raise HTTPException(
+                status_code=400,
+                detail="No documents uploaded. Please upload documents first."
             )
+        require_model()
+        scope = resolve_scope(indexer, request.doc_ids, request.filters)
         
-        processing_time = time.time() - start_time
+        sse = "text/event-stream" in http_request.headers.get("accept", "")
+        events = stream_answers(http_request, request, indexer, scope)
+        return StreamingResponse(
+            encode_events(events, sse),
+            media_type="text/event-stream" if sse else "application/x-ndjson",
+            # Proxies must pass events through instead of buffering the response
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/ask-batch", response_model=BatchQAResponse)
+async def ask_questions_batch(request: BatchQuestionRequest):
+    """
+    Ask many questions about the uploaded documents in one request
+    
+    All questions are retrieved with one batched index search (a sparse
+    matrix product for TF-IDF) and their reader rounds share reader
+    batches. Answers are cached per question, like /ask.
+    """
+    try:
+        indexer = get_indexer()
+        executor = get_executor()
         
-        return QAResponse(
-            question=request.question,
-            answers=answer_results,
-            processing_time=round(processing_time, 3)
+        if not request.questions:
+            raise HTTPException(status_code=400, detail="At least one question is required.")
+        if len(request.questions) > config.ASK_BATCH_MAX_QUESTIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {config.ASK_BATCH_MAX_QUESTIONS} questions per batch."
+            )
+        if not indexer.documents:
+            raise HTTPException(
+                status_code=400,
+                detail="No documents uploaded. Please upload documents first."
+            )
+        require_model()
+        
+        start_time = time.time()
+        corpus_version = indexer.version
+        scope = resolve_scope(indexer, request.doc_ids, request.filters)
+        
+        use_cache = request.use_cache and answer_cache.enabled
+        answered: Dict[str, Tuple[List[Dict], int]] = {}
+        cached = set()
+        if use_cache:
+            for question in request.questions:
+                hit = answer_cache.get(question, request.top_k, corpus_version, scope)
+                if hit is not None:
+                    answered[question] = (hit, 0)
+                    cached.add(question)
+        # Each distinct question is retrieved and read once
+        pending = [question for question in dict.fromkeys(request.questions) if question not in answered]
+        
+        retrieval_time = 0.0
+        reader_time = 0.0
+        if pending:
+            retrieval_start = time.time()
+            relevants = await executor.run_in_thread(
+                indexer.search_batch,
+                pending,
+                top_k=request.top_k * config.RETRIEVAL_CANDIDATE_FACTOR,
+                doc_ids=scope
+            )
+            retrieval_time = time.time() - retrieval_start
+            
+            reader_start = time.time()
+            read = await read_passages_batch(pending, relevants, request.top_k)
+            reader_time = time.time() - reader_start
+            
+            for question, (answers, skipped) in zip(pending, read):
+                answer_dicts = format_answers(indexer, answers)
+                answered[question] = (answer_dicts, skipped)
+                if use_cache:
+                    answer_cache.put(question, request.top_k, corpus_version, answer_dicts, scope)
+        
+        processing_time = round(time.time() - start_time, 3)
+        results = []
+        for question in request.questions:
+            answer_dicts, skipped = answered[question]
+            results.append(QAResponse(
+                question=question,
+                answers=[AnswerResult(**answer) for answer in answer_dicts],
+                processing_time=processing_time,
+                cached=question in cached,
+                reader_calls_skipped=skipped
+            ))
+        
+        return BatchQAResponse(
+            results=results,
+            processing_time=processing_time,
+            retrieval_time=round(retrieval_time, 3),
+            reader_time=round(reader_time, 3),
+            cached_count=sum(result.cached for result in results),
+            reader_calls_skipped=sum(skipped for _, skipped in answered.values())
         )
     
     except HTTPException:
@@ -97,31 +509,47 @@ async def ask_question_direct(request: DirectTextRequest):
                 status_code=400,
                 detail="Both text and question fields are required"
             )
+        require_model()
         
         start_time = time.time()
+        executor = get_executor()
         
         # Clean and process text
         text = DocumentProcessor.clean_text(request.text)
-        passages = DocumentProcessor.split_into_passages(text, window_size=3)
+        chunker = get_chunker()
+        if chunker is not None:
+            passages = await executor.run_in_thread(chunker.chunk, text)
+        else:
+            passages = await executor.run_in_thread(
+                DocumentProcessor.split_into_passages, text, window_size=3
+            )
         
         # Process question
-        answers = qa_engine.process_question(
-            request.question,
-            passages,
-            top_k=request.top_k
-        )
+        answers = []
+        reader_calls_skipped = 0
+        if passages:
+            relevant = await executor.run_in_thread(
+                qa_engine.select_passages,
+                request.question,
+                passages,
+                top_k=request.top_k * config.RETRIEVAL_CANDIDATE_FACTOR
+            )
+            answers, reader_calls_skipped = await read_passages(
+                request.question, relevant, request.top_k, indexed=False
+            )
         
         # Format results
         answer_results = []
         for answer in answers:
+            start_pos, end_pos = passages.span(answer["source_position"])
             answer_results.append(
                 AnswerResult(
                     answer=answer["answer"],
                     confidence_score=round(answer["confidence_score"], 4),
                     source_document="Direct Input",
                     source_text=answer["source_text"],
-                    start_position=answer["source_position"],
-                    end_position=answer["source_position"] + 1
+                    start_position=start_pos,
+                    end_position=end_pos
                 )
             )
         
@@ -130,7 +558,8 @@ async def ask_question_direct(request: DirectTextRequest):
         return QAResponse(
             question=request.question,
             answers=answer_results,
-            processing_time=round(processing_time, 3)
+            processing_time=round(processing_time, 3),
+            reader_calls_skipped=reader_calls_skipped
         )
     
     except HTTPException:
@@ -139,11 +568,33 @@ async def ask_question_direct(request: DirectTextRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/cache/stats")
+async def cache_statistics():
+    """Answer cache and reader cache statistics"""
+    return {
+        "answer_cache": answer_cache.get_statistics(),
+        "reader_cache": reader_cache.get_statistics()
+    }
+
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "qa_engine": "ready",
+        "qa_engine": qa_engine.status,
         "model": qa_engine.model_name
     }
+
+
+@router.get("/live")
+async def liveness():
+    """Liveness probe: the process is up and serving, whether or not the model is loaded"""
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def readiness():
+    """Readiness probe: 200 once the QA model is loaded and warmed up, 503 before that or if loading failed"""
+    state = qa_engine.get_status()
+    return JSONResponse(status_code=200 if qa_engine.is_ready else 503, content=state)
@@ -0,0 +1,510 @@
+"""
+BM25 retrieval over an inverted index with MaxScore top-k pruning
+"""
+import heapq
+import math
+import pickle
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from app.services.retrieval_index import tokenize
+
+
+class _PostingList:
+    """Passage ids (ascending) and term frequencies for one term"""
+    
+    __slots__ = ("ids", "tfs", "max_tf", "min_len")
+    
+    def __init__(self):
+        self.ids = array('q')
+        self.tfs = array('l')
+        self.max_tf = 0
+        self.min_len = math.inf
+
+
+class BM25Statistics:
+    """
+    Corpus-wide BM25 statistics: document frequencies and passage lengths
+    
+    Every BM25Index has one. The shards of a ShardedIndex share a single
+    instance (and its lock), so IDF, average length and the score scale are
+    corpus-wide and each shard scores passages exactly like one unsharded
+    index would. ``indexes`` lists the shards, whose posting lists bound the
+    best attainable score of each term.
+    """
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.indexes: List["BM25Index"] = []
+        self.clear()
+    
+    def clear(self) -> None:
+        """Forget every passage"""
+        self.doc_freq: Counter = Counter()
+        self.num_passages = 0
+        self.total_len = 0
+    
+    def __getstate__(self) -> Dict:
+        state = dict(self.__dict__)
+        del state["lock"]
+        return state
+    
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+    
+    def idf(self, term: str) -> float:
+        """Non-negative BM25 inverse document frequency"""
+        n = self.num_passages
+        df = self.doc_freq[term]
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+    
+    def term_bound(self, term: str) -> Tuple[int, float]:
+        """Largest term frequency and shortest passage length in any shard's posting list"""
+        max_tf, min_len = 0, math.inf
+        for index in self.indexes:
+            posting = index._postings.get(term)
+            if posting is not None:
+                max_tf = max(max_tf, posting.max_tf)
+                min_len = min(min_len, posting.min_len)
+        return max_tf, min_len
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an appendable inverted index
+    
+    Each term keeps a posting list sorted by passage id together with the
+    largest term frequency and the shortest passage length seen in it. Those
+    two numbers give a per-term upper bound on the BM25 contribution, which
+    MaxScore uses to skip postings that cannot lift a passage into the
+    current top-k. Deletes are tombstones until compaction rewrites the lists.
+    
+    A search limited to passage id ranges bisects each posting list to the
+    window of every range, so only postings of passages in scope are read.
+    
+    The corpus-wide statistics are guarded by their lock, which shards share,
+    and the posting lists by a lock of their own. A search reads the
+    statistics it needs under the shared lock and scores under the posting
+    lock only, so searches on different shards run at the same time. No
+    thread waits for the shared lock while it holds a posting lock.
+    """
+    
+    def __init__(
+        self,
+        k1: float = 1.5,
+        b: float = 0.75,
+        tombstone_ratio: float = 0.25,
+        background_compaction: bool = True,
+        statistics: Optional[BM25Statistics] = None
+    ):
+        """
+        Initialize an empty index
+        
+        Args:
+            k1: Term frequency saturation
+            b: Passage length normalization
+            tombstone_ratio: Fraction of deleted passages that triggers compaction
+            background_compaction: Run compaction on a daemon thread instead of inline
+            statistics: Statistics shared with other shards (None keeps private ones)
+        """
+        self.k1 = k1
+        self.b = b
+        self.tombstone_ratio = tombstone_ratio
+        self.background_compaction = background_compaction
+        self.statistics = statistics or BM25Statistics()
+        self.statistics.indexes.append(self)
+        
+        self._postings_lock = threading.RLock()
+        self._compacting = False
+        self._generation = 0
+        self.clear()
+    
+    @property
+    def _lock(self) -> threading.RLock:
+        return self.statistics.lock
+    
+    def clear(self) -> None:
+        """Remove every passage (statistics shared with other shards are reset too)"""
+        with self._lock, self._postings_lock:
+            self.statistics.clear()
+            self._postings: Dict[str, _PostingList] = {}
+            self._passage_terms: Dict[int, Tuple[str, ...]] = {}
+            self._passage_len: Dict[int, int] = {}
+            self._dead: Set[int] = set()
+            self._last_id = -1
+            # Bumped whenever posting lists change other than by appending
+            self._generation += 1
+            self.postings_scored = 0
+            self.postings_total = 0
+    
+    def __len__(self) -> int:
+        return len(self._passage_terms)
+    
+    def __getstate__(self) -> Dict:
+        """Pickle everything except the locks (used for on-disk snapshots)"""
+        with self._lock, self._postings_lock:
+            state = dict(self.__dict__)
+        del state["_postings_lock"]
+        state["_compacting"] = False
+        return state
+    
+    def __setstate__(self, state: Dict) -> None:
+        if "statistics" not in state:
+            # Snapshot from before statistics were split out
+            statistics = BM25Statistics()
+            statistics.doc_freq = state.pop("_doc_freq")
+            statistics.total_len = state.pop("_total_len")
+            statistics.num_passages = len(state["_passage_terms"])
+            statistics.indexes.append(self)
+            state.pop("_lock", None)
+            state["statistics"] = statistics
+        state.setdefault("_generation", 0)
+        self.__dict__.update(state)
+        self._postings_lock = threading.RLock()
+    
+    def dumps(self) -> bytes:
+        """Serialize a consistent snapshot of the index (restore with pickle.loads)"""
+        with self._lock, self._postings_lock:
+            return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    def add(self, ids: Sequence[int], texts: Sequence[str]) -> None:
+        """
+        Add passages to the index
+        
+        Ids above every id added so far are appended to the posting lists;
+        lower ids (passages moved in from another shard) are inserted in order.
+        
+        Args:
+            ids: Caller-assigned integer ids, never reused
+            texts: Passage texts
+        """
+        added = []
+        try:
+            with self._postings_lock:
+                for passage_id, text in zip(ids, texts):
+                    passage_id = int(passage_id)
+                    if passage_id in self._passage_len:
+                        raise ValueError(f"Passage id {passage_id} is already indexed")
+                    appending = passage_id > self._last_id
+                    self._last_id = max(self._last_id, passage_id)
+                    if not appending:
+                        self._generation += 1
+                    
+                    tokens = tokenize(text)
+                    counts = Counter(tokens)
+                    length = len(tokens)
+                    for term, tf in counts.items():
+                        posting = self._postings.get(term)
+                        if posting is None:
+                            posting = self._postings[term] = _PostingList()
+                        if appending:
+                            posting.ids.append(passage_id)
+                            posting.tfs.append(tf)
+                        else:
+                            position = bisect_left(posting.ids, passage_id)
+                            posting.ids.insert(position, passage_id)
+                            posting.tfs.insert(position, tf)
+                        posting.max_tf = max(posting.max_tf, tf)
+                        posting.min_len = min(posting.min_len, length)
+                    
+                    self._passage_terms[passage_id] = tuple(counts.keys())
+                    self._passage_len[passage_id] = length
+                    added.append((counts.keys(), length))
+        finally:
+            # Statistics of the passages indexed before any error, so they match the postings
+            with self._lock:
+                for terms, length in added:
+                    self.statistics.doc_freq.update(terms)
+                    self.statistics.num_passages += 1
+                    self.statistics.total_len += length
+    
+    def remove(self, ids: Iterable[int]) -> None:
+        """
+        Tombstone passages so they are no longer returned
+        
+        Args:
+            ids: Ids previously passed to add()
+        """
+        removed = []
+        with self._postings_lock:
+            for passage_id in ids:
+                passage_id = int(passage_id)
+                terms = self._passage_terms.pop(passage_id, None)
+                if terms is None:
+                    continue
+                removed.append((terms, self._passage_len[passage_id]))
+                self._dead.add(passage_id)
+        with self._lock:
+            for terms, length in removed:
+                self.statistics.doc_freq.subtract(terms)
+                self.statistics.num_passages -= 1
+                self.statistics.total_len -= length
+        self._maybe_compact()
+    
+    def _maybe_compact(self) -> None:
+        """Schedule compaction when too many postings belong to deleted passages"""
+        with self._postings_lock:
+            total = len(self._passage_terms) + len(self._dead)
+            if total == 0 or len(self._dead) / total <= self.tombstone_ratio or self._compacting:
+                return
+            self._compacting = True
+        
+        if self.background_compaction:
+            threading.Thread(target=self.compact, daemon=True).start()
+        else:
+            self.compact()
+    
+    def compact(self) -> None:
+        """
+        Drop tombstoned passages from every posting list
+        
+        The compacted lists are built from a copy of the current ones without
+        holding any lock, so searches and adds go on meanwhile. They are
+        swapped in under the locks: postings appended since the copy are
+        carried over, and passages deleted since stay tombstoned. If the lists
+        changed in any other way (an insert below the last id, a clear or
+        another compaction), the compaction starts over.
+        """
+        try:
+            while True:
+                with self._postings_lock:
+                    dead = set(self._dead)
+                    if not dead:
+                        return
+                    generation = self._generation
+                    postings = self._postings
+                    snapshot = {
+                        term: (posting.ids[:], posting.tfs[:])
+                        for term, posting in postings.items()
+                    }
+                    passage_len = dict(self._passage_len)
+                
+                compacted: Dict[str, _PostingList] = {}
+                for term, (ids, tfs) in snapshot.items():
+                    new = _PostingList()
+                    for passage_id, tf in zip(ids, tfs):
+                        if passage_id in dead:
+                            continue
+                        new.ids.append(passage_id)
+                        new.tfs.append(tf)
+                        new.max_tf = max(new.max_tf, tf)
+                        new.min_len = min(new.min_len, passage_len[passage_id])
+                    compacted[term] = new
+                
+                with self._lock, self._postings_lock:
+                    if self._generation != generation or self._postings is not postings:
+                        continue
+                    for term, posting in postings.items():
+                        new = compacted.get(term)
+                        if new is None:
+                            # Term first seen after the copy
+                            compacted[term] = posting
+                            continue
+                        for position in range(len(snapshot[term][0]), len(posting.ids)):
+                            passage_id = posting.ids[position]
+                            tf = posting.tfs[position]
+                            new.ids.append(passage_id)
+                            new.tfs.append(tf)
+                            new.max_tf = max(new.max_tf, tf)
+                            new.min_len = min(new.min_len, self._passage_len[passage_id])
+                        if not new.ids:
+                            del compacted[term]
+                            if self.statistics.doc_freq[term] <= 0:
+                                del self.statistics.doc_freq[term]
+                    for passage_id in dead:
+                        del self._passage_len[passage_id]
+                    self._postings = compacted
+                    self._dead -= dead
+                    self._generation += 1
+                    return
+        finally:
+            self._compacting = False
+    
+    def search(
+        self,
+        query: str,
+        top_k: int = 3,
+        id_ranges: Optional[Sequence[range]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Rank live passages by BM25 score using MaxScore pruning
+        
+        Args:
+            query: Question text
+            top_k: Number of results to return
+            id_ranges: Only rank passages whose ids fall in these ranges
+        
+        Returns:
+            List of (passage_id, normalized_bm25_score) tuples, best first
+        """
+        if top_k <= 0:
+            return []
+        
+        k1, b = self.k1, self.b
+        # (term, weight) per query term and the corpus-wide average length,
+        # read once so the scoring below holds only this index's lock
+        with self._lock:
+            stats = self.statistics
+            avg_len = stats.total_len / max(stats.num_passages, 1) or 1.0
+            weights = []
+            max_score = 0.0
+            for term, qtf in Counter(tokenize(query)).items():
+                if stats.doc_freq[term] <= 0:
+                    continue
+                weight = qtf * stats.idf(term) * (k1 + 1)
+                # Best score over the whole corpus, so every shard uses the same scale
+                max_tf, min_len = stats.term_bound(term)
+                norm = k1 * (1 - b + b * min_len / avg_len)
+                max_score += weight * max_tf / (max_tf + norm)
+                weights.append((term, weight))
+        
+        with self._postings_lock:
+            if not self._passage_terms:
+                return []
+            
+            passage_len = self._passage_len
+            dead = self._dead
+            
+            # (upper_bound, ids, tfs, weight) per query term, cheapest bound first
+            terms = []
+            for term, weight in weights:
+                posting = self._postings.get(term)
+                if posting is None:
+                    continue
+                norm = k1 * (1 - b + b * posting.min_len / avg_len)
+                upper_bound = weight * posting.max_tf / (posting.max_tf + norm)
+                terms.append((upper_bound, posting.ids, posting.tfs, weight))
+            terms.sort(key=lambda t: t[0])
+            
+            cumulative = []
+            running = 0.0
+            for upper_bound, _, _, _ in terms:
+                running += upper_bound
+                cumulative.append(running)
+            
+            num_terms = len(terms)
+            heap: List[Tuple[float, int]] = []
+            threshold = 0.0
+            first_essential = 0
+            scored = 0
+            in_scope = 0
+            
+            def contribution(i: int, pos: int, passage_id: int) -> float:
+                tf = terms[i][2][pos]
+                norm = k1 * (1 - b + b * passage_len[passage_id] / avg_len)
+                return terms[i][3] * tf / (tf + norm)
+            
+            # The heap and threshold carry over from one range to the next
+            windows = [None] if id_ranges is None else id_ranges
+            for window in windows:
+                if window is None:
+                    cursors = [0] * num_terms
+                    lengths = [len(t[1]) for t in terms]
+                else:
+                    cursors = [bisect_left(t[1], window.start) for t in terms]
+                    lengths = [bisect_left(t[1], window.stop, lo) for t, lo in zip(terms, cursors)]
+                in_scope += sum(lengths) - sum(cursors)
+                
+                while True:
+                    if len(heap) >= top_k:
+                        threshold = heap[0][0]
+                        # Terms whose combined bound cannot beat the threshold become non-essential
+                        while first_essential < num_terms and cumulative[first_essential] <= threshold:
+                            first_essential += 1
+                        if first_essential == num_terms:
+                            break
+                    
+                    candidate = None
+                    for i in range(first_essential, num_terms):
+                        if cursors[i] < lengths[i]:
+                            passage_id = terms[i][1][cursors[i]]
+                            if candidate is None or passage_id < candidate:
+                                candidate = passage_id
+                    if candidate is None:
+                        break
+                    
+                    is_dead = candidate in dead
+                    score = 0.0
+                    for i in range(first_essential, num_terms):
+                        pos = cursors[i]
+                        if pos < lengths[i] and terms[i][1][pos] == candidate:
+                            if not is_dead:
+                                score += contribution(i, pos, candidate)
+                                scored += 1
+                            cursors[i] = pos + 1
+                    if is_dead:
+                        continue
+                    
+                    # Probe non-essential lists only while they can still matter
+                    for i in range(first_essential - 1, -1, -1):
+                        if score + cumulative[i] <= threshold:
+                            break
+                        pos = bisect_left(terms[i][1], candidate, cursors[i], lengths[i])
+                        cursors[i] = pos
+                        if pos < lengths[i] and terms[i][1][pos] == candidate:
+                            score += contribution(i, pos, candidate)
+                            scored += 1
+                            cursors[i] = pos + 1
+                    
+                    if len(heap) < top_k:
+                        heapq.heappush(heap, (score, -candidate))
+                    elif score > threshold:
+                        heapq.heapreplace(heap, (score, -candidate))
+            
+            self.postings_scored += scored
+            self.postings_total += in_scope
+            
+            # Scale by the best attainable score so results sit in [0, 1] like cosine similarities
+            max_score = max_score or 1.0
+            results = [(-neg_id, score / max_score) for score, neg_id in heap]
+            results.sort(key=lambda r: (-r[1], r[0]))
+            
+            # Fill up with unmatched passages like the TF-IDF retriever does
+            if len(results) < top_k:
+                seen = {passage_id for passage_id, _ in results}
+                if id_ranges is None:
+                    fill = self._passage_terms
+                else:
+                    fill = (
+                        passage_id for id_range in id_ranges for passage_id in id_range
+                        if passage_id in self._passage_terms
+                    )
+                for passage_id in fill:
+                    if len(results) >= top_k:
+                        break
+                    if passage_id not in seen:
+                        results.append((passage_id, 0.0))
+            
+            return results
+    
+    def search_batch(
+        self,
+        queries: Sequence[str],
+        top_k: int = 3,
+        id_ranges: Optional[Sequence[range]] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Rank live passages for several queries
+        
+        MaxScore prunes each query's postings against its own running top-k,
+        so there is no shared product to vectorize; queries run one by one.
+        
+        Returns:
+            One list of (passage_id, normalized_bm25_score) tuples per query
+        """
+        return [self.search(query, top_k, id_ranges) for query in queries]
+    
+    def get_statistics(self) -> Dict:
+        """Get index size and pruning statistics"""
+        with self._postings_lock:
+            return {
+                "live_passages": len(self._passage_terms),
+                "tombstones": len(self._dead),
+                "vocabulary_size": len(self._postings),
+                "postings_scored": self.postings_scored,
+                "postings_total": self.postings_total
+            }
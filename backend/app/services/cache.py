@@ -0,0 +1,294 @@
+"""
+In-memory caches for answers and reader results
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Union
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with a time-to-live and a memory cap
+    
+    Entries are evicted least recently used first once either ``max_entries``
+    or ``max_bytes`` would be exceeded. Entry sizes come from the ``sizeof``
+    callable, so the byte cap is an estimate of the cached payload rather
+    than an exact measurement.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl_seconds: float = 300.0,
+        sizeof: Callable[[Any], int] = lambda value: 1
+    ):
+        """
+        Initialize the cache
+        
+        Args:
+            max_entries: Maximum number of entries (0 disables the cache)
+            max_bytes: Maximum estimated size of all entries
+            ttl_seconds: Seconds an entry stays valid (0 means no expiry)
+            sizeof: Estimates the size of a value in bytes
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sizeof = sizeof
+        
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # {key: (value, size, expires_at)}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get a value, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting older entries to make room"""
+        if not self.enabled:
+            return
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+    
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Remove every entry whose key matches a predicate
+        
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                self._drop(key)
+            return len(stale)
+    
+    def _drop(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+    
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get_statistics(self) -> Dict:
+        """Get hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question for cache lookups (case and whitespace insensitive)"""
+    return re.sub(r'\s+', ' ', question).strip().lower()
+
+
+def _answers_size(answers: List[Dict]) -> int:
+    """Rough size of a list of answer dictionaries"""
+    # Fixed overhead per answer for the dict, floats and ints
+    return sum(
+        256 + sum(len(value) for value in answer.values() if isinstance(value, str))
+        for answer in answers
+    )
+
+
+class AnswerCache:
+    """
+    Cache of formatted /ask answers keyed on question, top_k, corpus version and scope
+    
+    DocumentIndexer bumps its corpus version whenever a document is added,
+    deleted or everything is cleared. The version is part of every key, so
+    answers computed against an older corpus are never returned. When a
+    newer version is seen, entries for older versions are dropped right away
+    instead of waiting for LRU eviction. The scope tells apart questions
+    limited to different documents.
+    """
+    
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024, ttl_seconds: float = 300.0):
+        """
+        Initialize the cache
+        
+        Args:
+            max_entries: Maximum number of cached answer lists (0 disables caching)
+            max_bytes: Maximum estimated size of all cached answers
+            ttl_seconds: Seconds an answer stays valid (0 means no expiry)
+        """
+        self._cache = LRUCache(max_entries, max_bytes, ttl_seconds, sizeof=_answers_size)
+        self._version = 0
+        self._version_lock = threading.Lock()
+    
+    @property
+    def enabled(self) -> bool:
+        return self._cache.enabled
+    
+    def _observe_version(self, corpus_version: int) -> bool:
+        """
+        Drop entries for older corpus versions the first time a newer one shows up
+        
+        Returns:
+            False if corpus_version is already outdated
+        """
+        with self._version_lock:
+            if corpus_version < self._version:
+                return False
+            if corpus_version == self._version:
+                return True
+            self._version = corpus_version
+        self._cache.discard_where(lambda key: key[2] < corpus_version)
+        return True
+    
+    def get(
+        self,
+        question: str,
+        top_k: int,
+        corpus_version: int,
+        scope: Optional[Hashable] = None
+    ) -> Optional[List[Dict]]:
+        """Get cached answers for a question, or None"""
+        if not self.enabled:
+            return None
+        self._observe_version(corpus_version)
+        return self._cache.get((normalize_question(question), top_k, corpus_version, scope))
+    
+    def put(
+        self,
+        question: str,
+        top_k: int,
+        corpus_version: int,
+        answers: List[Dict],
+        scope: Optional[Hashable] = None
+    ) -> None:
+        """Cache the answers computed for a question against a corpus version"""
+        if not self.enabled:
+            return
+        if not self._observe_version(corpus_version):
+            # The corpus changed while these answers were computed
+            return
+        self._cache.put((normalize_question(question), top_k, corpus_version, scope), answers)
+    
+    def clear(self) -> None:
+        """Remove all cached answers"""
+        self._cache.clear()
+    
+    def get_statistics(self) -> Dict:
+        """Get hit/miss counters and current size"""
+        return self._cache.get_statistics()
+
+
+def _result_size(result: Dict) -> int:
+    """Rough size of one reader result"""
+    return 200 + len(result["answer"])
+
+
+def _encoding_size(encoding: Tuple[List[int], List[Tuple[int, int]]]) -> int:
+    """Rough size of a cached passage tokenization (ints in lists and tuples)"""
+    input_ids, offsets = encoding
+    return 100 + 36 * len(input_ids) + 120 * len(offsets)
+
+
+class ReaderCache:
+    """
+    Memoized reader outputs and passage tokenizations
+    
+    Reader results are keyed on (question hash, passage key, model name,
+    max answer length). Passage tokenizations are keyed on (passage key,
+    model name) and shared by every question that reads the passage. A
+    passage key is the passage id for indexed passages (ids are never
+    reused) or a hash of the passage text otherwise. Both tables are plain
+    LRU with their own entry and byte caps and no expiry, because a reader
+    output only depends on its key.
+    """
+    
+    def __init__(
+        self,
+        max_results: int = 4096,
+        max_result_bytes: int = 8 * 1024 * 1024,
+        max_encodings: int = 2048,
+        max_encoding_bytes: int = 64 * 1024 * 1024
+    ):
+        """
+        Initialize the cache
+        
+        Args:
+            max_results: Maximum cached reader results (0 disables them)
+            max_result_bytes: Maximum estimated size of cached results
+            max_encodings: Maximum cached passage tokenizations (0 disables them)
+            max_encoding_bytes: Maximum estimated size of cached tokenizations
+        """
+        self.results = LRUCache(max_results, max_result_bytes, ttl_seconds=0, sizeof=_result_size)
+        self.encodings = LRUCache(max_encodings, max_encoding_bytes, ttl_seconds=0, sizeof=_encoding_size)
+    
+    @staticmethod
+    def passage_key(context: str, passage_id: Optional[int] = None) -> Union[int, str]:
+        """Key a passage by id when it has one, otherwise by its text"""
+        if passage_id is not None:
+            return passage_id
+        return hashlib.sha1(context.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def result_key(question: str, passage_key: Union[int, str], model_name: str, max_answer_length: int) -> Tuple:
+        question_hash = hashlib.sha1(question.encode("utf-8")).hexdigest()
+        return (question_hash, passage_key, model_name, max_answer_length)
+    
+    def clear(self) -> None:
+        """Remove all cached results and tokenizations"""
+        self.results.clear()
+        self.encodings.clear()
+    
+    def get_statistics(self) -> Dict:
+        """Get hit/miss counters and sizes of both tables"""
+        return {
+            "results": self.results.get_statistics(),
+            "encodings": self.encodings.get_statistics()
+        }
@@ -0,0 +1,451 @@
+"""
+Durable SQLite storage for documents, passage offsets and index snapshots
+"""
+import os
+import sqlite3
+import threading
+from array import array
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.services.text_store import MmapText
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    upload_time TEXT NOT NULL,
+    text_length INTEGER NOT NULL,
+    num_sentences INTEGER NOT NULL,
+    num_passages INTEGER NOT NULL,
+    sha256 TEXT,
+    window_size INTEGER NOT NULL,
+    first_passage_id INTEGER NOT NULL,
+    sentence_starts BLOB NOT NULL,
+    sentence_ends BLOB NOT NULL,
+    page_starts BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS document_text (
+    doc_id TEXT PRIMARY KEY,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS document_segments (
+    doc_id TEXT PRIMARY KEY,
+    byte_offset INTEGER NOT NULL,
+    byte_length INTEGER NOT NULL,
+    char_length INTEGER NOT NULL,
+    checkpoints BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS index_snapshots (
+    retriever TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    doc_id TEXT
+);
+"""
+
+# Corpus changes kept in the log; a worker further behind reloads the whole corpus
+CHANGE_LOG_SIZE = 10000
+
+_DOCUMENT_COLUMNS = (
+    "doc_id, filename, upload_time, text_length, num_sentences, num_passages,"
+    " sha256, window_size, first_passage_id, sentence_starts, sentence_ends, page_starts"
+)
+
+
+def _pack(values) -> bytes:
+    """Store int arrays as 64-bit regardless of the platform's C long"""
+    return array('q', values).tobytes()
+
+
+def _unpack(blob: bytes) -> array:
+    values = array('q')
+    values.frombytes(blob)
+    return array('l', values)
+
+
+class CorpusStore:
+    """
+    SQLite file that keeps the corpus across restarts
+    
+    Document metadata and sentence offsets live in one table and document
+    text in another, so startup can read every document's metadata without
+    reading any text. Text kept in a TextSegmentFile is recorded by its
+    location in that file instead. Index snapshots are pickled retrieval indexes, one per
+    retriever backend. The counters (corpus version, next passage id) are
+    kept in a small key/value table.
+    
+    Several processes (uvicorn workers) can share one store. Every add,
+    delete and clear is appended to a change log under the corpus version it
+    produced, so a worker brings its in-memory view up to date by replaying
+    the changes after its own version (load_changes). Corpus writes go
+    through a second connection inside write_transaction(), which holds
+    SQLite's write lock across processes, so versions and passage ids are
+    handed out in one order for every worker. Reads go through the first
+    connection and never wait for a write in progress (WAL mode).
+    """
+    
+    def __init__(self, path: str):
+        """
+        Open (or create) a store
+        
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        # Other workers can hold the write lock while they index a large document
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+        
+        self._write_lock = threading.RLock()
+        self._writer = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._write_depth = 0
+    
+    @contextmanager
+    def write_transaction(self) -> Iterator[None]:
+        """
+        Group corpus writes into one transaction that holds the database write lock
+        
+        The lock is taken when the transaction begins (BEGIN IMMEDIATE), so
+        writes from other threads and other processes wait until it commits,
+        and anything read meanwhile is the latest committed state. Nested
+        calls join the outer transaction. The transaction is rolled back if
+        the block raises.
+        """
+        with self._write_lock:
+            if self._write_depth:
+                self._write_depth += 1
+                try:
+                    yield
+                finally:
+                    self._write_depth -= 1
+                return
+            
+            self._writer.execute("BEGIN IMMEDIATE")
+            self._write_depth = 1
+            try:
+                yield
+            except BaseException:
+                self._writer.rollback()
+                raise
+            else:
+                self._writer.commit()
+            finally:
+                self._write_depth = 0
+    
+    def get_counter(self, key: str, default: int = 0) -> int:
+        """Read a counter from the meta table"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+    
+    def _set_counters(self, **counters: int) -> None:
+        self._writer.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            list(counters.items())
+        )
+    
+    def save_document(
+        self,
+        doc_id: str,
+        doc: Dict,
+        first_passage_id: int,
+        version: int
+    ) -> None:
+        """
+        Persist a newly indexed document
+        
+        Args:
+            doc_id: Document ID
+            doc: DocumentIndexer entry (metadata, text, passages, page_starts)
+            first_passage_id: Id of the document's first passage (from reserve_passage_ids)
+            version: Corpus version after adding the document
+        """
+        passages = doc["passages"]
+        with self.write_transaction():
+            self._writer.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    doc_id,
+                    doc["filename"],
+                    doc["upload_time"],
+                    doc["text_length"],
+                    doc["num_sentences"],
+                    doc["num_passages"],
+                    doc["sha256"],
+                    passages.window_size,
+                    first_passage_id,
+                    _pack(passages.sentence_starts),
+                    _pack(passages.sentence_ends),
+                    _pack(doc["page_starts"])
+                )
+            )
+            text = doc["text"]
+            if isinstance(text, MmapText):
+                byte_offset, byte_length, char_length, checkpoints = text.location
+                self._writer.execute(
+                    "INSERT OR REPLACE INTO document_segments VALUES (?, ?, ?, ?, ?)",
+                    (doc_id, byte_offset, byte_length, char_length, _pack(checkpoints))
+                )
+            else:
+                self._writer.execute(
+                    "INSERT OR REPLACE INTO document_text VALUES (?, ?)",
+                    (doc_id, text)
+                )
+            self._set_counters(version=version)
+            self._log_change(version, "add", doc_id)
+    
+    def reserve_passage_ids(self, count: int) -> int:
+        """
+        Hand out a range of passage ids for a document that is about to be indexed
+        
+        Ids are never handed out twice, even if the document is never saved.
+        
+        Args:
+            count: Number of passage ids
+        
+        Returns:
+            First id of the range
+        """
+        with self.write_transaction():
+            row = self._writer.execute("SELECT value FROM meta WHERE key = 'next_passage_id'").fetchone()
+            first_id = row[0] if row else 0
+            self._set_counters(next_passage_id=first_id + count)
+        return first_id
+    
+    def delete_document(self, doc_id: str, version: int) -> None:
+        """Remove a document"""
+        with self.write_transaction():
+            self._writer.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self._writer.execute("DELETE FROM document_text WHERE doc_id = ?", (doc_id,))
+            self._writer.execute("DELETE FROM document_segments WHERE doc_id = ?", (doc_id,))
+            self._set_counters(version=version)
+            self._log_change(version, "delete", doc_id)
+    
+    def clear(self, version: int) -> None:
+        """Remove every document (passage ids keep counting up)"""
+        with self.write_transaction():
+            self._writer.execute("DELETE FROM documents")
+            self._writer.execute("DELETE FROM document_text")
+            self._writer.execute("DELETE FROM document_segments")
+            self._set_counters(version=version)
+            self._log_change(version, "clear", None)
+    
+    def _log_change(self, version: int, kind: str, doc_id: Optional[str]) -> None:
+        """Append a change to the log and drop the oldest entries"""
+        self._writer.execute(
+            "INSERT OR REPLACE INTO changes VALUES (?, ?, ?)",
+            (version, kind, doc_id)
+        )
+        self._writer.execute(
+            "DELETE FROM changes WHERE version <= ?",
+            (version - CHANGE_LOG_SIZE,)
+        )
+    
+    def _select_documents(self, where: str = "", params: Tuple = ()) -> List[Dict]:
+        """Read document rows (caller holds the lock)"""
+        cursor = self._conn.execute(
+            f"SELECT {_DOCUMENT_COLUMNS} FROM documents {where} ORDER BY first_passage_id",
+            params
+        )
+        documents = []
+        for row in cursor.fetchall():
+            documents.append({
+                "doc_id": row[0],
+                "filename": row[1],
+                "upload_time": row[2],
+                "text_length": row[3],
+                "num_sentences": row[4],
+                "num_passages": row[5],
+                "sha256": row[6],
+                "window_size": row[7],
+                "first_passage_id": row[8],
+                "sentence_starts": _unpack(row[9]),
+                "sentence_ends": _unpack(row[10]),
+                "page_starts": _unpack(row[11])
+            })
+        return documents
+    
+    def load_documents(self) -> List[Dict]:
+        """
+        Read every document's metadata and offsets (no text)
+        
+        Returns:
+            Document rows ordered by first passage id
+        """
+        with self._lock:
+            return self._select_documents()
+    
+    def load_state(self) -> Tuple[int, int, List[Dict]]:
+        """
+        Read the corpus version, the next passage id and every document row together
+        
+        All three come from one read transaction, so they are consistent
+        even while another process is writing.
+        
+        Returns:
+            Tuple of (version, next_passage_id, document rows)
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                counters = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+                documents = self._select_documents()
+            finally:
+                self._conn.commit()
+        return counters.get("version", 0), counters.get("next_passage_id", 0), documents
+    
+    def load_changes(self, after_version: int) -> List[Tuple[int, str, Optional[str], Optional[Dict]]]:
+        """
+        Read the changes logged after a corpus version
+        
+        Args:
+            after_version: Version the caller's view is at
+        
+        Returns:
+            List of (version, kind, doc_id, document row) tuples in version
+            order; kind is "add", "delete", "clear" or "compact" (text moved
+            to a new segment file generation), and the row is only set
+            for added documents that still exist
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                changes = self._conn.execute(
+                    "SELECT version, kind, doc_id FROM changes WHERE version > ? ORDER BY version",
+                    (after_version,)
+                ).fetchall()
+                added = [doc_id for _, kind, doc_id in changes if kind == "add"]
+                rows = {}
+                for start in range(0, len(added), 500):
+                    batch = added[start:start + 500]
+                    where = f"WHERE doc_id IN ({', '.join('?' * len(batch))})"
+                    for row in self._select_documents(where, tuple(batch)):
+                        rows[row["doc_id"]] = row
+            finally:
+                self._conn.commit()
+        return [
+            (version, kind, doc_id, rows.get(doc_id) if kind == "add" else None)
+            for version, kind, doc_id in changes
+        ]
+    
+    def load_text(self, doc_id: str) -> Optional[str]:
+        """Read a document's text"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM document_text WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def load_text_location(self, doc_id: str) -> Optional[Tuple[int, int, int, array, int]]:
+        """
+        Read where a document's text sits in the segment file
+        
+        Returns:
+            Tuple of (byte_offset, byte_length, char_length, checkpoints,
+            generation), or None if the text is stored in the database instead
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                row = self._conn.execute(
+                    "SELECT byte_offset, byte_length, char_length, checkpoints"
+                    " FROM document_segments WHERE doc_id = ?", (doc_id,)
+                ).fetchone()
+                generation = self._conn.execute(
+                    "SELECT value FROM meta WHERE key = 'text_generation'"
+                ).fetchone()
+            finally:
+                self._conn.commit()
+        if row is None:
+            return None
+        return row[0], row[1], row[2], _unpack(row[3]), generation[0] if generation else 0
+    
+    def load_text_locations(self) -> Tuple[int, Dict[str, Tuple[int, int, int, array]]]:
+        """
+        Read where every document's text sits in the segment file
+        
+        Returns:
+            Tuple of (generation, {doc_id: (byte_offset, byte_length,
+            char_length, checkpoints)})
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                rows = self._conn.execute(
+                    "SELECT doc_id, byte_offset, byte_length, char_length, checkpoints FROM document_segments"
+                ).fetchall()
+                generation = self._conn.execute(
+                    "SELECT value FROM meta WHERE key = 'text_generation'"
+                ).fetchone()
+            finally:
+                self._conn.commit()
+        locations = {row[0]: (row[1], row[2], row[3], _unpack(row[4])) for row in rows}
+        return generation[0] if generation else 0, locations
+    
+    def text_bytes(self) -> int:
+        """Bytes of the segment file still referenced by a document"""
+        with self._lock:
+            row = self._conn.execute("SELECT SUM(byte_length) FROM document_segments").fetchone()
+        return row[0] or 0
+    
+    def save_text_locations(self, texts: Dict[str, MmapText], generation: int, version: int) -> None:
+        """
+        Point every document at its text in a compacted segment file generation
+        
+        Args:
+            texts: New view of every document's text
+            generation: Segment file generation the views belong to
+            version: Corpus version after the compaction
+        """
+        with self.write_transaction():
+            self._writer.executemany(
+                "UPDATE document_segments SET byte_offset = ? WHERE doc_id = ?",
+                [(text.byte_offset, doc_id) for doc_id, text in texts.items()]
+            )
+            self._set_counters(text_generation=generation, version=version)
+            self._log_change(version, "compact", None)
+    
+    def save_snapshot(self, retriever: str, data: bytes) -> None:
+        """Replace the stored index snapshot for a retriever backend"""
+        with self.write_transaction():
+            self._writer.execute(
+                "INSERT OR REPLACE INTO index_snapshots VALUES (?, ?)",
+                (retriever, sqlite3.Binary(data))
+            )
+    
+    def load_snapshot(self, retriever: str) -> Optional[bytes]:
+        """Read the stored index snapshot for a retriever backend"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM index_snapshots WHERE retriever = ?", (retriever,)
+            ).fetchone()
+        return bytes(row[0]) if row else None
+    
+    def get_statistics(self) -> Dict:
+        """Get the database file size"""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return {"path": self.path, "file_bytes": size}
+    
+    def close(self) -> None:
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+        with self._write_lock:
+            self._writer.close()
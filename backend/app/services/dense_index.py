@@ -0,0 +1,621 @@
+"""
+Dense passage retrieval: sentence embeddings in an on-disk IVF index
+"""
+import os
+import pickle
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Rows scored per block when searching without the IVF index
+_SCAN_BLOCK_ROWS = 65536
+
+_embedders: Dict[str, "SentenceEmbedder"] = {}
+_embedders_lock = threading.Lock()
+
+
+def get_embedder(model_name: str, max_length: int = 256, batch_size: int = 32) -> "SentenceEmbedder":
+    """Get the shared embedder for a model (indexes restored from snapshots look it up by name)"""
+    with _embedders_lock:
+        embedder = _embedders.get(model_name)
+        if embedder is None:
+            embedder = SentenceEmbedder(model_name, max_length=max_length, batch_size=batch_size)
+            _embedders[model_name] = embedder
+        return embedder
+
+
+class SentenceEmbedder:
+    """
+    Mean-pooled, L2-normalized sentence embeddings from a transformers encoder
+    
+    Works with sentence-transformers checkpoints such as all-MiniLM-L6-v2
+    without the sentence-transformers package. The model is loaded on first use.
+    """
+    
+    def __init__(self, model_name: str, max_length: int = 256, batch_size: int = 32):
+        """
+        Initialize the embedder
+        
+        Args:
+            model_name: HuggingFace encoder identifier
+            max_length: Tokens per passage (longer passages are truncated)
+            batch_size: Passages per forward pass
+        """
+        self.model_name = model_name
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self._tokenizer = None
+        self._model = None
+        self._lock = threading.Lock()
+    
+    def _load(self) -> None:
+        from transformers import AutoModel, AutoTokenizer
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self._model = AutoModel.from_pretrained(self.model_name).eval()
+        print(f"Loaded embedding model: {self.model_name}")
+    
+    @property
+    def dimension(self) -> int:
+        with self._lock:
+            if self._model is None:
+                self._load()
+        return self._model.config.hidden_size
+    
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Embed texts
+        
+        The lock is taken per batch, so a query embedded while a large
+        document is being embedded waits for one batch, not the whole document.
+        
+        Returns:
+            float32 array of shape (len(texts), dimension), rows of unit length
+        """
+        import torch
+        
+        with self._lock:
+            if self._model is None:
+                self._load()
+        blocks = []
+        for start in range(0, len(texts), self.batch_size):
+            with self._lock:
+                batch = self._tokenizer(
+                    list(texts[start:start + self.batch_size]),
+                    padding=True,
+                    truncation=True,
+                    max_length=self.max_length,
+                    return_tensors="pt"
+                )
+                with torch.no_grad():
+                    hidden = self._model(**batch).last_hidden_state
+            mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            blocks.append(torch.nn.functional.normalize(pooled, dim=1).numpy())
+        if not blocks:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return np.concatenate(blocks).astype(np.float32, copy=False)
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on unit vectors; returns unit-length centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+        counts = np.bincount(assignment, minlength=k)
+        empty = counts == 0
+        if empty.any():
+            # Restart empty clusters on random points
+            sums[empty] = data[rng.choice(len(data), size=int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+
+class DenseIndex:
+    """
+    Passage embeddings in a float16 or int8 matrix with an IVF index
+    
+    Vectors are appended row by row to a matrix that lives in a memory-mapped
+    file (or in memory without a path). float16 halves the size of float32;
+    int8 stores each unit-length component scaled by 127 and quarters it.
+    
+    Below ``ivf_min_rows`` rows a search scans every row. From then on
+    spherical k-means splits the rows into about sqrt(rows) lists, and a
+    search scores only the rows in the ``nprobe`` lists whose centroids are
+    closest to the query. The centroids are retrained on a sample whenever
+    the index has grown fourfold since the last training, on a background
+    thread: adds and searches keep using the previous lists (or a full scan)
+    until the new ones are swapped in. Deleted rows are
+    tombstoned and their space is reused only after clear().
+    
+    Exposes the same add/remove/search/clear/get_statistics/dumps interface
+    as the lexical indexes; scores are cosine similarities.
+    """
+    
+    def __init__(
+        self,
+        model_name: str,
+        path: Optional[str] = None,
+        dtype: str = "float16",
+        nprobe: int = 16,
+        ivf_min_rows: int = 4096,
+        max_length: int = 256,
+        batch_size: int = 32,
+        background_training: bool = True
+    ):
+        """
+        Initialize an empty index
+        
+        Args:
+            model_name: Sentence embedding model
+            path: File for the vector matrix (None keeps it in memory)
+            dtype: Stored component type, "float16" or "int8"
+            nprobe: IVF lists scored per search
+            ivf_min_rows: Rows needed before the IVF index is trained
+            max_length: Tokens embedded per passage
+            batch_size: Passages per embedding forward pass
+            background_training: Train the IVF index on a daemon thread instead of inline
+        """
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unknown vector dtype: {dtype}")
+        self.model_name = model_name
+        self.path = path
+        self.dtype = dtype
+        self.nprobe = nprobe
+        self.ivf_min_rows = ivf_min_rows
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.background_training = background_training
+        
+        self._lock = threading.RLock()
+        self._vectors = None
+        self._training = False
+        self._epoch = 0  # Bumped by clear(), so a training started before it is dropped
+        self.clear()
+    
+    @property
+    def embedder(self) -> SentenceEmbedder:
+        return get_embedder(self.model_name, self.max_length, self.batch_size)
+    
+    def clear(self) -> None:
+        """Remove every vector and the IVF index"""
+        with self._lock:
+            self._epoch += 1
+            self._dimension: Optional[int] = None
+            self._capacity = 0
+            self._num_rows = 0
+            self._row_ids = np.zeros(0, dtype=np.int64)
+            self._alive = np.zeros(0, dtype=bool)
+            self._locations: Dict[int, int] = {}
+            self._num_live = 0
+            self._centroids: Optional[np.ndarray] = None
+            self._lists: List[array] = []
+            self._trained_rows = 0
+            # A file-backed matrix is overwritten from row 0 by the next add
+            self._vectors = None
+    
+    def __len__(self) -> int:
+        return self._num_live
+    
+    def __getstate__(self) -> Dict:
+        """Pickle everything except the lock; a file-backed matrix stays in its file"""
+        with self._lock:
+            state = dict(self.__dict__)
+            if self.path and self._vectors is not None:
+                self._vectors.flush()
+                state["_vectors"] = None
+            elif self._vectors is not None:
+                state["_vectors"] = np.array(self._vectors[:self._num_rows])
+                state["_row_ids"] = self._row_ids[:self._num_rows]
+                state["_alive"] = self._alive[:self._num_rows]
+                state["_capacity"] = self._num_rows
+        del state["_lock"]
+        state["_training"] = False
+        return state
+    
+    def __setstate__(self, state: Dict) -> None:
+        state.setdefault("background_training", True)
+        state.setdefault("_epoch", 0)
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        if self.path and self._dimension is not None:
+            # Rows written after the snapshot are overwritten by the catch-up adds
+            self._vectors = np.memmap(
+                self.path, dtype=self.dtype, mode="r+", shape=(self._capacity, self._dimension)
+            )
+    
+    def dumps(self) -> bytes:
+        """Serialize a consistent snapshot of the index (restore with pickle.loads)"""
+        with self._lock:
+            return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Convert float32 unit vectors to the stored dtype"""
+        if self.dtype == "int8":
+            return np.clip(np.rint(vectors * 127), -127, 127).astype(np.int8)
+        return vectors.astype(np.float16)
+    
+    def _scores(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Cosine similarity of stored rows to a unit query vector"""
+        scores = self._vectors[rows].astype(np.float32) @ query
+        return scores / 127 if self.dtype == "int8" else scores
+    
+    def _ensure_capacity(self, rows: int) -> None:
+        """Grow the matrix (and its file) to hold at least ``rows`` rows"""
+        if rows <= self._capacity and self._vectors is not None:
+            return
+        capacity = max(rows, 2 * self._capacity, 1024)
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            itemsize = np.dtype(self.dtype).itemsize
+            if self._vectors is not None:
+                self._vectors.flush()
+            with open(self.path, "ab") as f:
+                f.truncate(capacity * self._dimension * itemsize)
+            self._vectors = np.memmap(
+                self.path, dtype=self.dtype, mode="r+", shape=(capacity, self._dimension)
+            )
+        else:
+            vectors = np.zeros((capacity, self._dimension), dtype=self.dtype)
+            if self._vectors is not None:
+                vectors[:self._num_rows] = self._vectors[:self._num_rows]
+            self._vectors = vectors
+        
+        self._row_ids = np.concatenate([self._row_ids, np.full(capacity - self._capacity, -1, dtype=np.int64)])
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - self._capacity, dtype=bool)])
+        self._capacity = capacity
+    
+    def add(self, ids: Sequence[int], texts: Sequence[str]) -> None:
+        """
+        Embed passages and append their vectors
+        
+        Args:
+            ids: Caller-assigned integer ids, one per passage
+            texts: Passage texts
+        """
+        if not texts:
+            return
+        # Embedding is the slow part and needs no index state
+        vectors = self.embedder.embed(texts)
+        
+        with self._lock:
+            if self._dimension is None:
+                self._dimension = vectors.shape[1]
+            first = self._num_rows
+            self._ensure_capacity(first + len(vectors))
+            self._vectors[first:first + len(vectors)] = self._encode(vectors)
+            self._row_ids[first:first + len(vectors)] = ids
+            self._alive[first:first + len(vectors)] = True
+            for offset, passage_id in enumerate(ids):
+                self._locations[int(passage_id)] = first + offset
+            self._num_rows += len(vectors)
+            self._num_live += len(vectors)
+            
+            if self._centroids is not None:
+                self._assign(np.arange(first, self._num_rows), vectors)
+            self._maybe_train()
+    
+    def remove(self, ids: Iterable[int]) -> None:
+        """Tombstone passages so they are no longer returned"""
+        with self._lock:
+            for passage_id in ids:
+                row = self._locations.pop(int(passage_id), None)
+                if row is not None:
+                    self._alive[row] = False
+                    self._num_live -= 1
+    
+    def _assign(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """Append rows to the inverted list of their nearest centroid"""
+        nearest = np.argmax(vectors @ self._centroids.T, axis=1)
+        for row, list_id in zip(rows.tolist(), nearest.tolist()):
+            self._lists[list_id].append(row)
+    
+    def _maybe_train(self) -> None:
+        """Schedule IVF (re)training once the index is big enough or has grown fourfold (caller holds the lock)"""
+        if self._num_live < self.ivf_min_rows or self._num_live < 4 * self._trained_rows or self._training:
+            return
+        
+        if self.background_training:
+            self._training = True
+            threading.Thread(target=self.train, name="qa-ivf-training", daemon=True).start()
+        else:
+            self.train()
+    
+    def train(self) -> None:
+        """
+        Train the IVF centroids on a sample of the live rows and rebuild the lists
+        
+        k-means and the assignment of every row run without the lock, on the
+        rows that existed when training started (rows are only ever appended,
+        so they do not change). Rows added meanwhile are assigned when the
+        new lists are swapped in; a clear() meanwhile discards them.
+        """
+        try:
+            with self._lock:
+                epoch = self._epoch
+                num_rows = self._num_rows
+                vectors = self._vectors
+                live = np.flatnonzero(self._alive[:num_rows])
+            if not len(live):
+                return
+            
+            num_lists = max(int(np.sqrt(len(live))), 1)
+            rng = np.random.default_rng(0)
+            sample = live if len(live) <= 64 * num_lists else rng.choice(live, size=64 * num_lists, replace=False)
+            sample_vectors = self._decode(vectors[np.sort(sample)])
+            centroids = _kmeans(sample_vectors, num_lists)
+            
+            lists = [array('q') for _ in range(num_lists)]
+            for start in range(0, len(live), _SCAN_BLOCK_ROWS):
+                rows = live[start:start + _SCAN_BLOCK_ROWS]
+                nearest = np.argmax(self._decode(vectors[rows]) @ centroids.T, axis=1)
+                for row, list_id in zip(rows.tolist(), nearest.tolist()):
+                    lists[list_id].append(row)
+            
+            with self._lock:
+                if self._epoch != epoch:
+                    return
+                self._centroids = centroids
+                self._lists = lists
+                if self._num_rows > num_rows:
+                    added = np.arange(num_rows, self._num_rows)
+                    self._assign(added, self._decode(self._vectors[added]))
+                self._trained_rows = len(live)
+        finally:
+            self._training = False
+    
+    def _decode(self, stored: np.ndarray) -> np.ndarray:
+        """Stored rows as float32 unit vectors"""
+        vectors = stored.astype(np.float32)
+        if self.dtype == "int8":
+            vectors /= 127
+        return vectors
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a question"""
+        return self.embedder.embed([query])[0]
+    
+    def search(
+        self,
+        query: str,
+        top_k: int = 3,
+        id_ranges: Optional[Sequence[range]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Rank live passages by cosine similarity to the query embedding
+        
+        Returns:
+            List of (passage_id, similarity_score) tuples, best first
+        """
+        if top_k <= 0 or self._num_live == 0:
+            return []
+        return self.search_vector(self.embed_query(query), top_k, id_ranges)
+    
+    def search_batch(
+        self,
+        queries: Sequence[str],
+        top_k: int = 3,
+        id_ranges: Optional[Sequence[range]] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Rank live passages for several queries, embedded in one encoder pass
+        
+        Returns:
+            One list of (passage_id, similarity_score) tuples per query
+        """
+        if top_k <= 0 or self._num_live == 0 or not queries:
+            return [[] for _ in queries]
+        vectors = self.embedder.embed(list(queries))
+        return [self.search_vector(vector, top_k, id_ranges) for vector in vectors]
+    
+    def search_vector(
+        self,
+        query: np.ndarray,
+        top_k: int = 3,
+        id_ranges: Optional[Sequence[range]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Rank live passages by cosine similarity to an embedded query
+        
+        Scoped searches (``id_ranges``) score every vector in scope exactly
+        instead of probing IVF lists, since the lists are global.
+        """
+        with self._lock:
+            if id_ranges is not None:
+                rows = [
+                    self._locations.get(passage_id)
+                    for id_range in id_ranges for passage_id in id_range
+                ]
+                candidates = [np.array([row for row in rows if row is not None], dtype=np.int64)]
+            elif self._centroids is None:
+                candidates = [
+                    np.arange(start, min(start + _SCAN_BLOCK_ROWS, self._num_rows))
+                    for start in range(0, self._num_rows, _SCAN_BLOCK_ROWS)
+                ]
+            else:
+                probe = min(self.nprobe, len(self._centroids))
+                closest = np.argpartition(-(self._centroids @ query), probe - 1)[:probe]
+                # Copies: a view would keep exporting the list's buffer after the
+                # lock is released, and a concurrent add could not append to it
+                candidates = [np.array(self._lists[i], dtype=np.int64) for i in closest if len(self._lists[i])]
+            
+            rows = []
+            scores = []
+            for block in candidates:
+                block = block[self._alive[block]]
+                if len(block):
+                    rows.append(block)
+                    scores.append(self._scores(block, query))
+            if not rows:
+                return []
+            rows = np.concatenate(rows)
+            scores = np.concatenate(scores)
+            row_ids = self._row_ids[rows]
+        
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(row_ids[i]), float(scores[i])) for i in top]
+    
+    def score_ids(self, query: np.ndarray, ids: Iterable[int]) -> Dict[int, float]:
+        """Cosine similarity of specific live passages to an embedded query"""
+        with self._lock:
+            found = [(passage_id, self._locations.get(int(passage_id))) for passage_id in ids]
+            found = [(passage_id, row) for passage_id, row in found if row is not None]
+            if not found:
+                return {}
+            scores = self._scores(np.array([row for _, row in found], dtype=np.int64), query)
+        return {passage_id: float(score) for (passage_id, _), score in zip(found, scores)}
+    
+    def get_statistics(self) -> Dict:
+        """Get index size and IVF statistics"""
+        itemsize = np.dtype(self.dtype).itemsize
+        return {
+            "model": self.model_name,
+            "live_passages": self._num_live,
+            "rows": self._num_rows,
+            "dimension": self._dimension,
+            "dtype": self.dtype,
+            "vector_bytes": self._num_rows * (self._dimension or 0) * itemsize,
+            "path": self.path,
+            "ivf_lists": len(self._lists),
+            "ivf_training": self._training,
+            "nprobe": self.nprobe
+        }
+
+
+class HybridIndex:
+    """
+    Lexical index and DenseIndex searched together with score fusion
+    
+    Each search takes ``candidate_factor * top_k`` candidates from both
+    indexes. A candidate's fused score is
+    ``(1 - dense_weight) * lexical + dense_weight * max(dense, 0)``. Lexical
+    scores are divided by the best lexical score when it is above 1 (BM25), so
+    both parts are on a 0-1 scale. Dense scores of lexical-only candidates are
+    computed exactly. Dense-only candidates count as lexical 0, since they
+    ranked below every lexical candidate.
+    """
+    
+    def __init__(self, lexical, dense: DenseIndex, dense_weight: float = 0.5, candidate_factor: int = 4):
+        """
+        Initialize the hybrid index
+        
+        Args:
+            lexical: TfidfIndex or BM25Index
+            dense: Dense index over the same passage ids
+            dense_weight: Share of the dense score in the fused score
+            candidate_factor: Candidates per index, as a multiple of top_k
+        """
+        self.lexical = lexical
+        self.dense = dense
+        self.dense_weight = dense_weight
+        self.candidate_factor = candidate_factor
+    
+    def __len__(self) -> int:
+        return len(self.lexical)
+    
+    def dumps(self) -> bytes:
+        """Serialize a snapshot of both indexes (restore with pickle.loads)"""
+        return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    def add(self, ids: Sequence[int], texts: Sequence[str]) -> None:
+        """Add passages to both indexes"""
+        self.dense.add(ids, texts)
+        self.lexical.add(ids, texts)
+    
+    def remove(self, ids: Iterable[int]) -> None:
+        """Remove passages from both indexes"""
+        ids = list(ids)
+        self.lexical.remove(ids)
+        self.dense.remove(ids)
+    
+    def clear(self) -> None:
+        """Remove every passage from both indexes"""
+        self.lexical.clear()
+        self.dense.clear()
+    
+    def rebalance(self, passage_texts) -> int:
+        """Rebalance the lexical index's shards, if it has any (the dense index is not sharded)"""
+        rebalance = getattr(self.lexical, "rebalance", None)
+        return rebalance(passage_texts) if rebalance is not None else 0
+    
+    def search(
+        self,
+        query: str,
+        top_k: int = 3,
+        id_ranges: Optional[Sequence[range]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Rank passages by fused lexical and dense scores
+        
+        Returns:
+            List of (passage_id, fused_score) tuples, best first
+        """
+        if top_k <= 0:
+            return []
+        candidates = top_k * self.candidate_factor
+        lexical = self.lexical.search(query, candidates, id_ranges)
+        query_vector = self.dense.embed_query(query) if len(self.dense) else None
+        return self._fuse(lexical, query_vector, top_k, id_ranges)
+    
+    def search_batch(
+        self,
+        queries: Sequence[str],
+        top_k: int = 3,
+        id_ranges: Optional[Sequence[range]] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Rank passages for several queries: one batched lexical search and one encoder pass
+        
+        Returns:
+            One list of (passage_id, fused_score) tuples per query
+        """
+        if top_k <= 0 or not queries:
+            return [[] for _ in queries]
+        candidates = top_k * self.candidate_factor
+        lexical = self.lexical.search_batch(queries, candidates, id_ranges)
+        if len(self.dense) == 0:
+            return [self._fuse(results, None, top_k, id_ranges) for results in lexical]
+        vectors = self.dense.embedder.embed(list(queries))
+        return [
+            self._fuse(results, vector, top_k, id_ranges)
+            for results, vector in zip(lexical, vectors)
+        ]
+    
+    def _fuse(
+        self,
+        lexical_results: List[Tuple[int, float]],
+        query_vector: Optional[np.ndarray],
+        top_k: int,
+        id_ranges: Optional[Sequence[range]]
+    ) -> List[Tuple[int, float]]:
+        """Combine a query's lexical candidates with its dense candidates"""
+        lexical = dict(lexical_results)
+        if query_vector is None:
+            return sorted(lexical.items(), key=lambda item: -item[1])[:top_k]
+        
+        candidates = top_k * self.candidate_factor
+        dense = dict(self.dense.search_vector(query_vector, candidates, id_ranges))
+        dense.update(self.dense.score_ids(query_vector, [pid for pid in lexical if pid not in dense]))
+        
+        scale = max(max(lexical.values(), default=0.0), 1.0)
+        fused = {
+            passage_id: (1 - self.dense_weight) * lexical.get(passage_id, 0.0) / scale
+            + self.dense_weight * max(dense.get(passage_id, 0.0), 0.0)
+            for passage_id in set(lexical) | set(dense)
+        }
+        return sorted(fused.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+    
+    def get_statistics(self) -> Dict:
+        """Get statistics of both indexes"""
+        return {
+            "lexical": self.lexical.get_statistics(),
+            "dense": self.dense.get_statistics(),
+            "dense_weight": self.dense_weight
+        }
@@ -1,20 +1,346 @@
 """
 Document indexing and storage service
 """
+import fnmatch
+import functools
+import pickle
+import threading
+import time
 import uuid
+from array import array
+from bisect import bisect_right
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Optional, Union
 from app.utils.document_processor import DocumentProcessor
+from app.utils.passages import PassageSpans
+from app.utils.sentence_segmenter import SentenceSegmenter
+from app.utils.token_chunker import TokenChunker
+from app.services.corpus_store import CorpusStore
+from app.services.passage_registry import PassageRegistry
+from app.services.text_store import MmapText, TextSegmentFile
+from app.services.retrieval_index import create_index
 from pathlib import Path
 
+# Passages handed to the retrieval index per call while ingesting a document
+INDEX_CHUNK_SIZE = 1000
+
+
+class _StoredDocument(dict):
+    """
+    Document entry restored from a CorpusStore
+    
+    Metadata and sentence offsets are loaded at startup. The text, and the
+    passages that slice it, are fetched with ``load_text`` the first time
+    they are needed.
+    """
+    
+    def __init__(self, load_text: Callable[[], Union[str, MmapText]], fields: Dict):
+        super().__init__(fields)
+        self._load_text = load_text
+    
+    def __missing__(self, key: str):
+        if key == "text":
+            value = self._load_text()
+        elif key == "passages":
+            value = PassageSpans(
+                self["text"],
+                self["sentence_starts"],
+                self["sentence_ends"],
+                self["window_size"]
+            )
+        else:
+            raise KeyError(key)
+        self[key] = value
+        return value
+
 
 class DocumentIndexer:
     """Manages document storage and indexing"""
     
-    def __init__(self):
-        """Initialize the document indexer with in-memory storage"""
-        self.documents: Dict[str, Dict] = {}  # {doc_id: {metadata, text, passages}}
+    def __init__(
+        self,
+        retriever: str = "tfidf",
+        store: Optional[CorpusStore] = None,
+        snapshot_every: int = 50000,
+        text_store: Optional[TextSegmentFile] = None,
+        chunker: Optional[TokenChunker] = None,
+        index_options: Optional[Dict] = None,
+        text_compact_ratio: float = 0.5
+    ):
+        """
+        Initialize the document indexer
+        
+        Without a store everything is kept in memory only. With a store every
+        change is written through to it, and a restart loads the corpus back:
+        document metadata right away, the retrieval index from its latest
+        snapshot (catching up on documents added or deleted since), and
+        document text lazily on first use.
+        
+        With a text store, cleaned text is appended to a memory-mapped segment
+        file and documents hold MmapText views instead of ``str`` objects;
+        passages and get_document_text decode slices on demand. Once deleted
+        documents take up ``text_compact_ratio`` of the file, the live text is
+        copied into a new file generation; clear_all starts an empty one.
+        
+        With a chunker, new documents are split into passages that fill the
+        reader's token budget instead of sentence windows. Documents already
+        stored keep the passages they were indexed with.
+        
+        Several worker processes can share one store. Each keeps its own
+        in-memory view (documents, passage ids, retrieval index), and every
+        write first replays the changes other workers logged in the store, so
+        passage ids and versions stay in one global order. sync() (or the
+        thread started by start_sync) replays them between writes, so
+        uploads and deletes on one worker show up on the others.
+        
+        Args:
+            retriever: Retrieval backend for the passage index ("tfidf" or "bm25")
+            store: Optional durable corpus store
+            snapshot_every: Newly indexed passages that trigger an index snapshot
+            text_store: Optional segment file for document text
+            chunker: Optional token-aware chunker (replaces sentence windows)
+            index_options: Extra create_index options (e.g. dense_options for
+                "+dense", shards for a sharded lexical index)
+            text_compact_ratio: Share of the segment file taken by deleted
+                text that triggers a compaction (0 disables it)
+        """
+        self.documents: Dict[str, Dict] = {}  # {doc_id: {metadata, text, passages (PassageSpans)}}
         self.doc_counter = 0
+        self.retriever = retriever
+        self.index_options = index_options or {}
+        self.index = create_index(retriever, **self.index_options)
+        # Snapshots of differently sharded indexes are not interchangeable
+        shards = self.index_options.get("shards", 1)
+        self.snapshot_key = retriever if shards <= 1 else f"{retriever}/{shards}-shards"
+        self.passages = PassageRegistry()  # {passage_id: (doc_id, start_pos, end_pos)}
+        self.version = 0  # Bumped on every corpus change; part of answer cache keys
+        self._lock = threading.RLock()
+        
+        self.store = store
+        self.text_store = text_store
+        self.chunker = chunker
+        self.text_compact_ratio = text_compact_ratio
+        self.snapshot_every = snapshot_every
+        self._passages_since_snapshot = 0
+        self._sync_thread: Optional[threading.Thread] = None
+        self._sync_stop = threading.Event()
+        self.changes_applied = 0
+        self.full_reloads = 0
+        if store is not None:
+            self._load_from_store()
+    
+    def _load_from_store(self) -> None:
+        """Restore documents, passage ids and the retrieval index from the store"""
+        started = time.time()
+        with self._lock:
+            version, next_passage_id, rows = self.store.load_state()
+            for row in rows:
+                self._restore_document(row)
+            self.passages.reserve(next_passage_id)
+            if self.text_store is not None:
+                self.text_store.switch(self.store.get_counter("text_generation"))
+            self.doc_counter = len(self.documents)
+            self.version = version
+            caught_up = self._restore_index()
+        
+        if caught_up:
+            self.save_snapshot()
+        print(f"Loaded {len(self.documents)} documents from {self.store.path} in {time.time() - started:.2f}s")
+    
+    def _restore_document(self, row: Dict) -> str:
+        """Register a stored document's passage ids and add its lazy entry (caller holds the lock)"""
+        doc_id = row.pop("doc_id")
+        first_passage_id = row.pop("first_passage_id")
+        row["passage_ids"] = self.passages.restore(
+            doc_id,
+            row["sentence_starts"],
+            row["sentence_ends"],
+            row["window_size"],
+            first_passage_id
+        )
+        self.documents[doc_id] = _StoredDocument(
+            functools.partial(self._load_text, doc_id), row
+        )
+        return doc_id
+    
+    def _index_document(self, doc_id: str) -> None:
+        """Add a stored document's passages to the retrieval index (caller holds the lock)"""
+        doc = self.documents[doc_id]
+        passages = doc["passages"]
+        passage_ids = doc["passage_ids"]
+        for start in range(0, len(passages), INDEX_CHUNK_SIZE):
+            end = start + INDEX_CHUNK_SIZE
+            self.index.add(passage_ids[start:end], passages.texts(start, end))
+    
+    def _load_text(self, doc_id: str) -> Union[str, MmapText]:
+        """Fetch a stored document's text from the segment file or the database"""
+        for _ in range(2):
+            location = self.store.load_text_location(doc_id)
+            if location is None:
+                return self.store.load_text(doc_id) or ""
+            if self.text_store is None:
+                print(f"Text of document {doc_id} is in a segment file but no text store is configured")
+                return ""
+            try:
+                return self.text_store.open(*location)
+            except FileNotFoundError:
+                # Another worker compacted the file after the location was read
+                continue
+        print(f"Text of document {doc_id} is missing from the segment file")
+        return ""
+    
+    def _restore_index(self) -> int:
+        """
+        Load the latest index snapshot and apply the changes made after it
+        
+        Returns:
+            Number of documents added to or removed from the snapshot
+        """
+        indexed: Dict[str, Tuple[int, int]] = {}
+        snapshot = self.store.load_snapshot(self.snapshot_key)
+        if snapshot:
+            try:
+                state = pickle.loads(snapshot)
+                self.index = pickle.loads(state["index"])
+                indexed = state["documents"]
+            except Exception as e:
+                print(f"Error loading index snapshot, rebuilding: {str(e)}")
+                self.index = create_index(self.retriever, **self.index_options)
+                indexed = {}
+        
+        # Documents deleted after the snapshot was taken
+        stale = [doc_id for doc_id in indexed if doc_id not in self.documents]
+        for doc_id in stale:
+            first, count = indexed[doc_id]
+            self.index.remove(range(first, first + count))
+        if stale:
+            self._rebalance_index()
+        
+        # Documents added after the snapshot was taken (ascending passage ids)
+        missing = [doc_id for doc_id in self.documents if doc_id not in indexed]
+        for doc_id in missing:
+            self._index_document(doc_id)
+        
+        return len(stale) + len(missing)
+    
+    def _apply_changes(self) -> int:
+        """
+        Replay the changes other workers logged since this view's version
+        
+        Caller holds the lock. A document added and deleted again in the
+        meantime is skipped (its row is gone). A worker so far behind that
+        the log no longer reaches its version reloads the whole corpus.
+        
+        Returns:
+            Number of changes applied
+        """
+        changes = self.store.load_changes(self.version)
+        if not changes:
+            return 0
+        if changes[0][0] != self.version + 1:
+            self._reload_from_store()
+            return len(changes)
+        
+        removed = False
+        for version, kind, doc_id, row in changes:
+            if kind == "add":
+                if row is not None and doc_id not in self.documents:
+                    self._restore_document(row)
+                    self._index_document(doc_id)
+                    self.doc_counter += 1
+            elif kind == "delete":
+                removed = self._remove_document(doc_id) or removed
+            elif kind == "clear":
+                self._clear_documents()
+            elif kind == "compact" and self.text_store is not None:
+                self._reopen_texts()
+            self.version = version
+        
+        if removed:
+            self._rebalance_index()
+        self.changes_applied += len(changes)
+        return len(changes)
+    
+    def _reload_from_store(self) -> None:
+        """Drop the in-memory view and load the corpus again (caller holds the lock)"""
+        print(f"Corpus view at version {self.version} is behind the change log, reloading")
+        self.documents = {}
+        self.passages = PassageRegistry()
+        self.index = create_index(self.retriever, **self.index_options)
+        self.full_reloads += 1
+        self._load_from_store()
+    
+    def sync(self) -> int:
+        """
+        Bring this view up to date with changes other workers made to the store
+        
+        Returns:
+            Number of changes applied
+        """
+        if self.store is None or self.store.get_counter("version") == self.version:
+            return 0
+        with self._lock:
+            return self._apply_changes()
+    
+    def start_sync(self, interval: float) -> None:
+        """
+        Poll the store for other workers' changes on a background thread
+        
+        Args:
+            interval: Seconds between polls
+        """
+        if self.store is None or self._sync_thread is not None:
+            return
+        
+        def poll():
+            while not self._sync_stop.wait(interval):
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"Error syncing corpus changes: {str(e)}")
+        
+        self._sync_thread = threading.Thread(target=poll, name="qa-corpus-sync", daemon=True)
+        self._sync_thread.start()
+    
+    def stop_sync(self) -> None:
+        """Stop the polling thread"""
+        self._sync_stop.set()
+        if self._sync_thread is not None:
+            self._sync_thread.join()
+            self._sync_thread = None
+    
+    @contextmanager
+    def _corpus_write(self) -> Iterator[None]:
+        """
+        Hold the lock, and the store's write lock, for one corpus change
+        
+        Changes other workers made are applied first, so the change gets the
+        next version and passage ids after theirs.
+        """
+        with self._lock:
+            if self.store is None:
+                yield
+                return
+            with self.store.write_transaction():
+                self._apply_changes()
+                yield
+    
+    def save_snapshot(self) -> None:
+        """Write the retrieval index to the store so a restart does not rebuild it"""
+        if self.store is None:
+            return
+        with self._lock:
+            documents = {
+                doc_id: (doc["passage_ids"].start, len(doc["passage_ids"]))
+                for doc_id, doc in self.documents.items()
+            }
+            data = pickle.dumps(
+                {"index": self.index.dumps(), "documents": documents},
+                protocol=pickle.HIGHEST_PROTOCOL
+            )
+            self._passages_since_snapshot = 0
+        self.store.save_snapshot(self.snapshot_key, data)
     
     def add_document(
         self,
@@ -29,44 +355,254 @@ class DocumentIndexer:
             file_path: Path to the uploaded document
             filename: Original filename
             passage_window: Window size for creating passages (in sentences)
-            
+        
         Returns:
             Tuple of (doc_id, text_length, num_passages)
         """
         try:
             # Extract text from document
             text = DocumentProcessor.extract_text(file_path)
-            
+        except Exception as e:
+            raise ValueError(f"Error processing document: {str(e)}")
+        
+        return self.add_text(text, filename, passage_window)
+    
+    def add_text(
+        self,
+        text: str,
+        filename: str,
+        passage_window: int = 3,
+        progress: Optional[Callable[[int, int], None]] = None,
+        page_starts: Optional[List[int]] = None,
+        content_hash: Optional[str] = None
+    ) -> Tuple[str, int, int]:
+        """
+        Add already extracted document text to the index
+        
+        The document only becomes visible (in listings, get_all_passages and
+        search results) once all of its passages are indexed.
+        
+        Args:
+            text: Raw text extracted from the document
+            filename: Original filename
+            passage_window: Window size for creating passages (in sentences;
+                ignored when the indexer has a chunker)
+            progress: Optional callback receiving (passages_done, passages_total)
+            page_starts: Character offset of each page in the cleaned text
+                (from DocumentProcessor.extract_text_with_pages)
+            content_hash: SHA-256 of the uploaded file
+        
+        Returns:
+            Tuple of (doc_id, text_length, num_passages)
+        """
+        try:
             # Clean text
             text = DocumentProcessor.clean_text(text)
             
             if not text:
                 raise ValueError("Document is empty after extraction")
             
-            # Create passages
-            passages = DocumentProcessor.split_into_passages(text, passage_window)
+            # Create passages (offsets into text, sliced on demand)
+            if self.chunker is not None:
+                passages = self.chunker.chunk(text)
+                num_sentences = SentenceSegmenter.segment(text).num_sentences
+            else:
+                passages = DocumentProcessor.split_into_passages(text, passage_window)
+                num_sentences = passages.num_sentences
             
             # Generate unique ID
             doc_id = str(uuid.uuid4())
             
-            # Store document metadata and content
-            self.documents[doc_id] = {
-                "filename": filename,
-                "upload_time": datetime.now().isoformat(),
-                "text": text,
-                "text_length": len(text),
-                "passages": passages,
-                "num_passages": len(passages),
-                "num_sentences": len(DocumentProcessor.split_into_sentences(text))
-            }
+            with self._lock:
+                # Short write: reserve passage ids and keep the text in the
+                # memory-mapped segment file instead of the heap (appended
+                # under the store's write lock, which other workers share)
+                with self._corpus_write():
+                    if self.store is not None:
+                        first_id = self.store.reserve_passage_ids(len(passages))
+                    else:
+                        first_id = len(self.passages)
+                    stored_text = self.text_store.append(text) if self.text_store is not None else text
+                
+                # Index outside the store transaction, so other workers can write meanwhile
+                try:
+                    doc = {
+                        "filename": filename,
+                        "upload_time": datetime.now().isoformat(),
+                        "text": stored_text,
+                        "text_length": len(text),
+                        "passages": passages if stored_text is text else PassageSpans(
+                            stored_text,
+                            passages.sentence_starts,
+                            passages.sentence_ends,
+                            passages.window_size
+                        ),
+                        "passage_ids": self._add_passages(doc_id, passages, first_id, progress),
+                        "num_passages": len(passages),
+                        "num_sentences": num_sentences,
+                        "page_starts": array('l', page_starts or [0]),
+                        "sha256": content_hash
+                    }
+                    self.documents[doc_id] = doc
+                    self.doc_counter += 1
+                    
+                    # Short write: record the document (after replaying what
+                    # other workers changed while it was being indexed)
+                    with self._corpus_write():
+                        if doc_id not in self.documents:
+                            # Another worker cleared the corpus (or this view was reloaded)
+                            doc["passage_ids"] = self._add_passages(doc_id, passages, first_id)
+                            self.documents[doc_id] = doc
+                            self.doc_counter += 1
+                        if isinstance(stored_text, MmapText) and stored_text.generation != self.text_store.generation:
+                            # Another worker compacted the segment file, which dropped the
+                            # not yet recorded text; write it to the new generation
+                            self._set_text(doc, self.text_store.append(text))
+                        self.version += 1
+                        if self.store is not None:
+                            self.store.save_document(doc_id, doc, first_id, self.version)
+                            self._passages_since_snapshot += len(passages)
+                except BaseException:
+                    if not self._remove_document(doc_id):
+                        self.index.remove(range(first_id, first_id + len(passages)))
+                        self.passages.release(doc_id)
+                    raise
             
-            self.doc_counter += 1
+            if self.store is not None and self._passages_since_snapshot >= self.snapshot_every:
+                self.save_snapshot()
             
             return doc_id, len(text), len(passages)
         
         except Exception as e:
             raise ValueError(f"Error processing document: {str(e)}")
     
+    def _add_passages(
+        self,
+        doc_id: str,
+        passages: PassageSpans,
+        first_id: int,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> range:
+        """Register a new document's passages under reserved ids and index them (caller holds the lock)"""
+        passage_ids = self.passages.restore(
+            doc_id,
+            passages.sentence_starts,
+            passages.sentence_ends,
+            passages.window_size,
+            first_id
+        )
+        for start in range(0, len(passages), INDEX_CHUNK_SIZE):
+            end = start + INDEX_CHUNK_SIZE
+            self.index.add(passage_ids[start:end], passages.texts(start, end))
+            if progress:
+                progress(min(end, len(passages)), len(passages))
+        return passage_ids
+    
+    @staticmethod
+    def _set_text(doc: Dict, text: MmapText) -> None:
+        """Point a document entry, and its passages, at another view of the same text"""
+        doc["text"] = text
+        if "passages" in doc:
+            passages = doc["passages"]
+            doc["passages"] = PassageSpans(
+                text,
+                passages.sentence_starts,
+                passages.sentence_ends,
+                passages.window_size
+            )
+    
+    def _reopen_texts(self) -> None:
+        """Follow another worker's compaction to the new segment file generation (caller holds the lock)"""
+        generation, locations = self.store.load_text_locations()
+        self.text_store.switch(generation)
+        for doc_id, location in locations.items():
+            doc = self.documents.get(doc_id)
+            # Text not loaded yet is opened on the new generation when first used
+            if doc is not None and "text" in doc:
+                self._set_text(doc, self.text_store.open(*location, generation))
+    
+    def _live_text_bytes(self) -> int:
+        """Bytes of the segment file still referenced by a document"""
+        if self.store is not None:
+            return self.store.text_bytes()
+        return sum(
+            doc["text"].byte_length
+            for doc in list(self.documents.values())
+            if isinstance(doc.get("text"), MmapText)
+        )
+    
+    def _compact_text(self, locations: Optional[Dict[str, Tuple[int, int, int, array]]] = None) -> None:
+        """
+        Copy live document text into a new segment file generation
+        
+        Caller holds the lock and the store's write lock. Entries are only
+        pointed at the new views once the store has recorded them; until
+        then the text store goes back to the old generation on failure.
+        
+        Args:
+            locations: Text to keep (None keeps every document's text)
+        """
+        if locations is None and self.store is not None:
+            _, locations = self.store.load_text_locations()
+        elif locations is None:
+            locations = {
+                doc_id: doc["text"].location
+                for doc_id, doc in self.documents.items()
+                if isinstance(doc.get("text"), MmapText)
+            }
+        generation = self.text_store.generation
+        texts = self.text_store.compact(locations)
+        if self.store is not None:
+            try:
+                self.store.save_text_locations(texts, generation + 1, self.version + 1)
+            except Exception:
+                self.text_store.switch(generation)
+                raise
+            self.version += 1
+        for doc_id, text in texts.items():
+            doc = self.documents.get(doc_id)
+            if doc is not None and "text" in doc:
+                self._set_text(doc, text)
+    
+    def compact_text(self, force: bool = False) -> bool:
+        """
+        Reclaim the segment file space left behind by deleted documents
+        
+        Args:
+            force: Compact even if less than ``text_compact_ratio`` of the file is dead
+        
+        Returns:
+            True if the file was compacted
+        """
+        if self.text_store is None:
+            return False
+        try:
+            with self._corpus_write():
+                file_bytes = self.text_store.file_bytes()
+                dead_bytes = file_bytes - self._live_text_bytes()
+                if not force and (
+                    self.text_compact_ratio <= 0
+                    or dead_bytes <= 0
+                    or dead_bytes < file_bytes * self.text_compact_ratio
+                ):
+                    return False
+                self._compact_text()
+        except Exception as e:
+            print(f"Error compacting text segment file: {str(e)}")
+            return False
+        self.text_store.remove_generations()
+        print(f"Compacted text segment file: {dead_bytes} bytes reclaimed")
+        return True
+    
+    def _rebalance_index(self) -> None:
+        """Even out a sharded index after deletes (no-op for unsharded indexes)"""
+        rebalance = getattr(self.index, "rebalance", None)
+        if rebalance is None:
+            return
+        moved = rebalance(lambda ids: [self.get_passage_text(passage_id) or "" for passage_id in ids])
+        if moved:
+            print(f"Rebalanced index shards: moved {moved} passages")
+    
     def get_document(self, doc_id: str) -> Optional[Dict]:
         """Get document by ID"""
         return self.documents.get(doc_id)
@@ -74,40 +610,226 @@ class DocumentIndexer:
     def get_all_documents(self) -> List[Dict]:
         """Get metadata for all documents"""
         documents_list = []
-        for doc_id, doc_data in self.documents.items():
+        for doc_id, doc_data in list(self.documents.items()):
             documents_list.append({
                 "doc_id": doc_id,
                 "filename": doc_data["filename"],
                 "upload_time": doc_data["upload_time"],
                 "text_length": doc_data["text_length"],
                 "num_sentences": doc_data["num_sentences"],
-                "num_passages": doc_data["num_passages"]
+                "num_passages": doc_data["num_passages"],
+                "sha256": doc_data["sha256"]
             })
         return documents_list
     
+    def _remove_document(self, doc_id: str) -> bool:
+        """Drop a document from the in-memory view (caller holds the lock)"""
+        if doc_id not in self.documents:
+            return False
+        passage_ids = self.documents[doc_id]["passage_ids"]
+        self.index.remove(passage_ids)
+        self.passages.release(doc_id)
+        del self.documents[doc_id]
+        self.doc_counter -= 1
+        return True
+    
     def delete_document(self, doc_id: str) -> bool:
         """Delete a document from the index"""
-        if doc_id in self.documents:
-            del self.documents[doc_id]
-            self.doc_counter -= 1
-            return True
-        return False
+        with self._corpus_write():
+            if not self._remove_document(doc_id):
+                return False
+            self._rebalance_index()
+            self.version += 1
+            if self.store is not None:
+                self.store.delete_document(doc_id, self.version)
+        self.compact_text()
+        return True
+    
+    def iter_passages(self, doc_ids: Optional[Sequence[str]] = None) -> Iterator[Tuple[str, str, int, int]]:
+        """
+        Iterate over passages document by document, slicing each one on demand
+        
+        Args:
+            doc_ids: Only these documents (None iterates over all of them)
+        
+        Yields:
+            (passage_text, doc_id, start_pos, end_pos) tuples
+        """
+        for doc_id in list(self.documents) if doc_ids is None else doc_ids:
+            doc_data = self.documents.get(doc_id)
+            if doc_data is None:
+                continue
+            for passage, start_pos, end_pos in doc_data["passages"]:
+                yield passage, doc_id, start_pos, end_pos
     
     def get_all_passages(self) -> List[Tuple[str, str, int, int]]:
         """
         Get all passages from all documents
         
+        Builds the whole list; use iter_passages to walk the corpus lazily.
+        
         Returns:
             List of (passage_text, doc_id, start_pos, end_pos) tuples
         """
-        all_passages = []
-        for doc_id, doc_data in self.documents.items():
-            for passage, start_pos, end_pos in doc_data["passages"]:
-                all_passages.append((passage, doc_id, start_pos, end_pos))
-        return all_passages
+        return list(self.iter_passages())
+    
+    def search(
+        self,
+        question: str,
+        top_k: int = 3,
+        doc_ids: Optional[Sequence[str]] = None
+    ) -> List[Tuple[str, float, int]]:
+        """
+        Retrieve the most relevant passages from the persistent index
+        
+        Each document's passages have consecutive ids, so a document-scoped
+        search hands the index one id range per document and only the
+        postings (or rows) of those documents are scored.
+        
+        Args:
+            question: User's question
+            top_k: Number of passages to return
+            doc_ids: Only search these documents (None searches all of them)
+        
+        Returns:
+            List of (passage_text, similarity_score, passage_id) tuples
+        """
+        id_ranges = self._id_ranges(doc_ids)
+        if id_ranges == []:
+            return []
+        return self._resolve(self.index.search(question, top_k, id_ranges))
     
-    def get_document_passages(self, doc_id: str) -> List[Tuple[str, int, int]]:
-        """Get passages for a specific document"""
+    def search_batch(
+        self,
+        questions: Sequence[str],
+        top_k: int = 3,
+        doc_ids: Optional[Sequence[str]] = None
+    ) -> List[List[Tuple[str, float, int]]]:
+        """
+        Retrieve passages for several questions in one batched index search
+        
+        Args:
+            questions: User questions
+            top_k: Number of passages per question
+            doc_ids: Only search these documents (None searches all of them)
+        
+        Returns:
+            One list of (passage_text, similarity_score, passage_id) tuples
+            per question, as search() returns them
+        """
+        id_ranges = self._id_ranges(doc_ids)
+        if id_ranges == []:
+            return [[] for _ in questions]
+        return [
+            self._resolve(results)
+            for results in self.index.search_batch(list(questions), top_k, id_ranges)
+        ]
+    
+    def _id_ranges(self, doc_ids: Optional[Sequence[str]]) -> Optional[List[range]]:
+        """Passage id range of each known document (None when the search is not scoped)"""
+        if doc_ids is None:
+            return None
+        return [
+            self.documents[doc_id]["passage_ids"]
+            for doc_id in doc_ids
+            if doc_id in self.documents
+        ]
+    
+    def _resolve(self, hits: List[Tuple[int, float]]) -> List[Tuple[str, float, int]]:
+        """Attach passage texts to index hits"""
+        results = []
+        for passage_id, score in hits:
+            passage_text = self.get_passage_text(passage_id)
+            if passage_text is None:
+                # Document was deleted while the search was running
+                continue
+            results.append((passage_text, score, passage_id))
+        return results
+    
+    def select_documents(
+        self,
+        doc_ids: Optional[Sequence[str]] = None,
+        filename: Optional[str] = None,
+        uploaded_after: Optional[datetime] = None,
+        uploaded_before: Optional[datetime] = None
+    ) -> List[str]:
+        """
+        Find the documents matching a set of metadata filters
+        
+        Args:
+            doc_ids: Only consider these documents (None considers all of them)
+            filename: Glob pattern the filename must match (case insensitive, e.g. "*.pdf")
+            uploaded_after: Earliest upload time (inclusive)
+            uploaded_before: Latest upload time (exclusive)
+        
+        Returns:
+            Matching document ids
+        """
+        # Upload times are stored as naive local times
+        if uploaded_after is not None and uploaded_after.tzinfo is not None:
+            uploaded_after = uploaded_after.astimezone().replace(tzinfo=None)
+        if uploaded_before is not None and uploaded_before.tzinfo is not None:
+            uploaded_before = uploaded_before.astimezone().replace(tzinfo=None)
+        
+        candidates = list(self.documents) if doc_ids is None else [d for d in doc_ids if d in self.documents]
+        selected = []
+        for doc_id in candidates:
+            doc = self.documents.get(doc_id)
+            if doc is None:
+                continue
+            if filename is not None and not fnmatch.fnmatch(doc["filename"].lower(), filename.lower()):
+                continue
+            if uploaded_after is not None or uploaded_before is not None:
+                upload_time = datetime.fromisoformat(doc["upload_time"])
+                if uploaded_after is not None and upload_time < uploaded_after:
+                    continue
+                if uploaded_before is not None and upload_time >= uploaded_before:
+                    continue
+            selected.append(doc_id)
+        return selected
+    
+    def get_passage_source(self, passage_id: int) -> Optional[Tuple[str, int, int]]:
+        """
+        Find where an indexed passage comes from
+        
+        Returns:
+            Tuple of (doc_id, start_pos, end_pos), or None if the passage's
+            document no longer exists (or is still being indexed)
+        """
+        source = self.passages.lookup(passage_id)
+        if source is None or source[0] not in self.documents:
+            return None
+        return source
+    
+    def get_passage_text(self, passage_id: int) -> Optional[str]:
+        """Get the text of an indexed passage, or None if its document is gone"""
+        source = self.passages.lookup(passage_id)
+        if source is None:
+            return None
+        doc_id, start_pos, end_pos = source
+        doc = self.documents.get(doc_id)
+        if doc is None:
+            return None
+        return doc["text"][start_pos:end_pos]
+    
+    def get_page_number(self, doc_id: str, char_offset: int) -> Optional[int]:
+        """
+        Find the page a character offset of a document falls on
+        
+        Args:
+            doc_id: Document ID
+            char_offset: Offset into the document's cleaned text
+        
+        Returns:
+            1-based page number, or None if the document does not exist
+        """
+        doc = self.get_document(doc_id)
+        if not doc:
+            return None
+        return max(bisect_right(doc["page_starts"], char_offset), 1)
+    
+    def get_document_passages(self, doc_id: str) -> Sequence[Tuple[str, int, int]]:
+        """Get passages for a specific document (built lazily from offsets)"""
         doc = self.get_document(doc_id)
         if doc:
             return doc["passages"]
@@ -118,12 +840,13 @@ class DocumentIndexer:
         results = []
         keyword_lower = keyword.lower()
         
-        for doc_id, doc_data in self.documents.items():
-            if keyword_lower in doc_data["text"].lower():
+        for doc_id, doc_data in list(self.documents.items()):
+            text_lower = str(doc_data["text"]).lower()
+            if keyword_lower in text_lower:
                 results.append({
                     "doc_id": doc_id,
                     "filename": doc_data["filename"],
-                    "matches": doc_data["text"].lower().count(keyword_lower)
+                    "matches": text_lower.count(keyword_lower)
                 })
         
         return sorted(results, key=lambda x: x["matches"], reverse=True)
@@ -132,23 +855,56 @@ class DocumentIndexer:
         """Get full text of a document"""
         doc = self.get_document(doc_id)
         if doc:
-            return doc["text"]
+            return str(doc["text"])
         return None
     
-    def clear_all(self) -> None:
-        """Clear all documents from the index"""
+    def _clear_documents(self) -> None:
+        """Drop every document from the in-memory view (caller holds the lock)"""
         self.documents.clear()
         self.doc_counter = 0
+        self.index.clear()
+        self.passages.clear()
+    
+    def clear_all(self) -> None:
+        """Clear all documents from the index"""
+        with self._corpus_write():
+            self._clear_documents()
+            self.version += 1
+            if self.store is not None:
+                self.store.clear(self.version)
+            if self.text_store is not None:
+                # Start an empty file generation in the same transaction
+                self._compact_text({})
+        if self.text_store is not None:
+            self.text_store.remove_generations()
+        self.save_snapshot()
     
     def get_statistics(self) -> Dict:
         """Get indexing statistics"""
         total_documents = len(self.documents)
-        total_text_length = sum(d["text_length"] for d in self.documents.values())
-        total_passages = sum(d["num_passages"] for d in self.documents.values())
+        total_text_length = sum(d["text_length"] for d in list(self.documents.values()))
+        total_passages = sum(d["num_passages"] for d in list(self.documents.values()))
+        # Two offsets per sentence (computed without loading stored documents' text;
+        # an upper bound for token-chunked documents, which keep two per chunk)
+        passage_offset_bytes = sum(16 * d["num_sentences"] for d in list(self.documents.values()))
         
         return {
             "total_documents": total_documents,
             "total_text_length": total_text_length,
             "total_passages": total_passages,
-            "avg_doc_size": total_text_length / total_documents if total_documents > 0 else 0
+            "avg_doc_size": total_text_length / total_documents if total_documents > 0 else 0,
+            "passage_offset_bytes": passage_offset_bytes,
+            "passage_registry": self.passages.get_statistics(),
+            "index": self.index.get_statistics(),
+            "store": self.store.get_statistics() if self.store is not None else None,
+            "sync": {
+                "version": self.version,
+                "polling": self._sync_thread is not None,
+                "changes_applied": self.changes_applied,
+                "full_reloads": self.full_reloads
+            },
+            "text_store": {
+                **self.text_store.get_statistics(),
+                "live_bytes": self._live_text_bytes()
+            } if self.text_store is not None else None
         }
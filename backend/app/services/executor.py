@@ -0,0 +1,124 @@
+"""
+Executor layer that keeps blocking work off the asyncio event loop
+"""
+import asyncio
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class _TrackedExecutor(Executor):
+    """Process pool proxy that feeds the owning ExecutorPool's counters"""
+    
+    def __init__(self, pool: ProcessPoolExecutor, owner: "ExecutorPool"):
+        self._pool = pool
+        self._owner = owner
+    
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        self._owner._count("process", "submitted")
+        future = self._pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda _: self._owner._count("process", "completed"))
+        return future
+    
+    def shutdown(self, wait: bool = True, **kwargs) -> None:
+        self._pool.shutdown(wait=wait)
+
+
+class ExecutorPool:
+    """
+    Thread and process pools for CPU-bound work called from async routes
+    
+    The thread pool serves indexing, retrieval and other calls into
+    torch/numpy that release the GIL. The process pool serves pure-Python
+    parsing (PyPDF2, python-docx) that would otherwise hold the GIL: callers
+    hand get_process_pool() to DocumentProcessor, which fans page ranges out
+    to it. Setting ``process_workers`` to 0 sends that work to the thread
+    pool instead.
+    """
+    
+    def __init__(self, thread_workers: int = 4, process_workers: int = 2):
+        """
+        Initialize the pools
+        
+        Args:
+            thread_workers: Number of worker threads
+            process_workers: Number of worker processes (0 disables the process pool)
+        """
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self._threads = ThreadPoolExecutor(
+            max_workers=thread_workers,
+            thread_name_prefix="qa-worker"
+        )
+        self._processes: Optional[_TrackedExecutor] = None
+        self._lock = threading.Lock()
+        self._counters = {
+            "thread": {"submitted": 0, "started": 0, "completed": 0},
+            "process": {"submitted": 0, "completed": 0}
+        }
+    
+    def get_process_pool(self) -> Optional[Executor]:
+        """
+        Get the process pool, creating it on first use
+        
+        Work submitted to the returned executor shows up in the metrics.
+        """
+        if self.process_workers <= 0:
+            return None
+        with self._lock:
+            if self._processes is None:
+                # spawn avoids forking a process that already holds torch threads and locks
+                pool = ProcessPoolExecutor(
+                    max_workers=self.process_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                self._processes = _TrackedExecutor(pool, self)
+        return self._processes
+    
+    def _count(self, kind: str, event: str) -> None:
+        with self._lock:
+            self._counters[kind][event] += 1
+    
+    def _tracked(self, fn: Callable, *args, **kwargs) -> Any:
+        self._count("thread", "started")
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._count("thread", "completed")
+    
+    async def run_in_thread(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking callable on the thread pool and await its result"""
+        loop = asyncio.get_running_loop()
+        self._count("thread", "submitted")
+        call = functools.partial(self._tracked, fn, *args, **kwargs)
+        return await loop.run_in_executor(self._threads, call)
+    
+    def get_statistics(self) -> Dict:
+        """Get pool sizes and queue depths"""
+        with self._lock:
+            threads = dict(self._counters["thread"])
+            processes = dict(self._counters["process"])
+        
+        process_in_flight = processes["submitted"] - processes["completed"]
+        return {
+            "thread_pool": {
+                "workers": self.thread_workers,
+                "queue_depth": threads["submitted"] - threads["started"],
+                "active": threads["started"] - threads["completed"],
+                "completed": threads["completed"]
+            },
+            "process_pool": {
+                "workers": self.process_workers,
+                "queue_depth": max(process_in_flight - self.process_workers, 0),
+                "active": min(process_in_flight, self.process_workers),
+                "completed": processes["completed"]
+            }
+        }
+    
+    def shutdown(self) -> None:
+        """Stop both pools"""
+        self._threads.shutdown(wait=False)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False)
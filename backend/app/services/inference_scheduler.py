@@ -0,0 +1,151 @@
+"""
+Dynamic micro-batching of reader calls across concurrent requests
+"""
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from app.services.qa_engine import QAEngine
+
+
+class InferenceScheduler:
+    """
+    Collects (question, passage) pairs from concurrent requests into micro-batches
+    
+    Requests enqueue their pairs and wait on futures. A single worker thread
+    takes the first waiting pair, keeps collecting until it has
+    ``max_batch_size`` pairs or ``max_wait_ms`` has passed, runs them through
+    QAEngine.answer_batch together and hands each result back to its request.
+    Pairs already in the engine's reader cache are answered on submit and
+    never enter the queue.
+    """
+    
+    def __init__(
+        self,
+        engine: QAEngine,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0
+    ):
+        """
+        Initialize the scheduler
+        
+        Args:
+            engine: QA engine whose reader runs the batches
+            max_batch_size: Maximum pairs per micro-batch
+            max_wait_ms: How long the first pair in a batch waits for company
+        """
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        
+        self._queue: "queue.Queue[Tuple[str, str, Optional[int], Future]]" = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        
+        self.batches_run = 0
+        self.pairs_processed = 0
+        self.pairs_from_cache = 0
+    
+    def _ensure_worker(self) -> None:
+        """Start the worker thread on first use"""
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+    
+    def submit(
+        self,
+        pairs: List[Tuple[str, str]],
+        passage_ids: Optional[List[Optional[int]]] = None
+    ) -> List[Future]:
+        """
+        Queue pairs for the reader
+        
+        Args:
+            pairs: List of (question, context) tuples
+            passage_ids: Passage id of each context, if it comes from the index
+        
+        Returns:
+            One future per pair, resolving to an answer dictionary
+        """
+        self._ensure_worker()
+        futures = []
+        for i, (question, context) in enumerate(pairs):
+            passage_id = passage_ids[i] if passage_ids else None
+            future: Future = Future()
+            cached = self.engine.cached_answer(question, context, passage_id)
+            if cached is not None:
+                future.set_result(cached)
+                self.pairs_from_cache += 1
+            else:
+                self._queue.put((question, context, passage_id, future))
+            futures.append(future)
+        return futures
+    
+    async def answer(
+        self,
+        pairs: List[Tuple[str, str]],
+        passage_ids: Optional[List[Optional[int]]] = None
+    ) -> List[Dict]:
+        """Await reader results for pairs without blocking the event loop"""
+        futures = self.submit(pairs, passage_ids)
+        return list(await asyncio.gather(*(asyncio.wrap_future(f) for f in futures)))
+    
+    def answer_sync(
+        self,
+        pairs: List[Tuple[str, str]],
+        passage_ids: Optional[List[Optional[int]]] = None
+    ) -> List[Dict]:
+        """Blocking variant of answer() for worker threads"""
+        return [future.result() for future in self.submit(pairs, passage_ids)]
+    
+    def _collect_batch(self) -> List[Tuple[str, str, Optional[int], Future]]:
+        """Block for the first pair, then gather more until the batch is full or the wait expires"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self) -> None:
+        """Worker loop"""
+        while True:
+            batch = self._collect_batch()
+            # Skip pairs whose requests already gave up
+            batch = [item for item in batch if item[3].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.engine.answer_batch(
+                    [(q, c) for q, c, _, _ in batch],
+                    passage_ids=[passage_id for _, _, passage_id, _ in batch],
+                    lookup_cache=False
+                )
+                for (_, _, _, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, _, _, future in batch:
+                    future.set_exception(e)
+            self.batches_run += 1
+            self.pairs_processed += len(batch)
+    
+    def get_statistics(self) -> Dict:
+        """Get batching statistics"""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches_run": self.batches_run,
+            "pairs_processed": self.pairs_processed,
+            "pairs_from_cache": self.pairs_from_cache,
+            "avg_batch_size": self.pairs_processed / self.batches_run if self.batches_run else 0
+        }
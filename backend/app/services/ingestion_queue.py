@@ -0,0 +1,186 @@
+"""
+Background ingestion jobs for document uploads
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.services.document_indexer import DocumentIndexer
+from app.services.executor import ExecutorPool
+from app.utils.document_processor import DocumentProcessor
+
+
+class IngestionQueueFull(Exception):
+    """Raised when too many ingestion jobs are already waiting"""
+
+
+class IngestionQueue:
+    """
+    Runs document extraction and indexing as jobs on a bounded worker pool
+    
+    An upload is saved to disk, submitted, and answered with a job id
+    straight away. Workers pick jobs up in order, report page and passage
+    progress while they run, and remove the uploaded file when finished.
+    """
+    
+    def __init__(
+        self,
+        indexer: DocumentIndexer,
+        executor: Optional[ExecutorPool] = None,
+        max_workers: int = 2,
+        max_pending: int = 100,
+        max_finished: int = 1000
+    ):
+        """
+        Initialize the queue
+        
+        Args:
+            indexer: Indexer that receives the extracted documents
+            executor: Pools whose process pool parses PDF page ranges in parallel
+            max_workers: Number of jobs processed concurrently
+            max_pending: Jobs allowed to wait before submissions are rejected
+            max_finished: Finished jobs kept for status polling
+        """
+        self.indexer = indexer
+        self.executor = executor
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        
+        self._workers = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="qa-ingest"
+        )
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def submit(self, file_path: str, filename: str, content_hash: Optional[str] = None) -> str:
+        """
+        Queue an uploaded file for ingestion
+        
+        Args:
+            file_path: Path to the saved upload (removed once the job finishes)
+            filename: Original filename
+            content_hash: SHA-256 of the upload, stored with the document
+        
+        Returns:
+            Job id
+        """
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job["state"] == "queued")
+            if pending >= self.max_pending:
+                raise IngestionQueueFull(f"{pending} ingestion jobs are already waiting")
+            
+            job_id = str(uuid.uuid4())
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "filename": filename,
+                "state": "queued",
+                "doc_id": None,
+                "error": None,
+                "pages_done": 0,
+                "pages_total": 0,
+                "passages_done": 0,
+                "passages_total": 0,
+                "submitted_at": datetime.now().isoformat(),
+                "_submitted": time.monotonic(),
+                "_started": None,
+                "_extracted": None,
+                "_finished": None
+            }
+            self._trim_finished()
+        
+        try:
+            self._workers.submit(self._run, job_id, file_path, filename, content_hash)
+        except Exception:
+            # The job never started (e.g. the pool is shut down); do not report it as queued
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            raise
+        return job_id
+    
+    def _trim_finished(self) -> None:
+        """Forget the oldest finished jobs beyond max_finished"""
+        finished = [
+            job_id for job_id, job in self._jobs.items()
+            if job["state"] in ("completed", "failed")
+        ]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
+    
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+    
+    def _run(self, job_id: str, file_path: str, filename: str, content_hash: Optional[str]) -> None:
+        """Worker body: extract, then index"""
+        try:
+            self._update(job_id, state="extracting", _started=time.monotonic())
+            text, page_starts = DocumentProcessor.extract_text_with_pages(
+                file_path,
+                progress=lambda done, total: self._update(job_id, pages_done=done, pages_total=total),
+                executor=self.executor.get_process_pool() if self.executor else None
+            )
+            
+            self._update(job_id, state="indexing", _extracted=time.monotonic())
+            doc_id, _, _ = self.indexer.add_text(
+                text,
+                filename,
+                progress=lambda done, total: self._update(job_id, passages_done=done, passages_total=total),
+                page_starts=page_starts,
+                content_hash=content_hash
+            )
+            self._update(job_id, state="completed", doc_id=doc_id, _finished=time.monotonic())
+        except Exception as e:
+            self._update(job_id, state="failed", error=str(e), _finished=time.monotonic())
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+    
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """
+        Get the public status of a job
+        
+        Returns:
+            Job state, progress and timing, or None if the job is unknown
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+        
+        now = time.monotonic()
+        started = job["_started"]
+        extracted = job["_extracted"]
+        finished = job["_finished"]
+        
+        def elapsed(start: Optional[float], end: Optional[float]) -> Optional[float]:
+            if start is None:
+                return None
+            return round((end or now) - start, 3)
+        
+        status = {key: value for key, value in job.items() if not key.startswith("_")}
+        status["timing"] = {
+            "queued_seconds": elapsed(job["_submitted"], started),
+            "extraction_seconds": elapsed(started, extracted or finished),
+            "indexing_seconds": elapsed(extracted, finished),
+            "total_seconds": elapsed(job["_submitted"], finished)
+        }
+        return status
+    
+    def get_statistics(self) -> Dict:
+        """Count jobs by state"""
+        with self._lock:
+            states = [job["state"] for job in self._jobs.values()]
+        return {state: states.count(state) for state in ("queued", "extracting", "indexing", "completed", "failed")}
+    
+    def shutdown(self) -> None:
+        """Stop accepting work"""
+        self._workers.shutdown(wait=False)
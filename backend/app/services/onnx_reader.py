@@ -0,0 +1,167 @@
+"""
+ONNX Runtime reader for extractive QA, optionally int8-quantized
+"""
+import os
+import re
+from typing import Dict, Tuple
+
+import numpy as np
+
+# Reader backends QAEngine accepts
+BACKENDS = ("pytorch", "onnx", "onnx-int8")
+
+
+def _model_slug(model_name: str) -> str:
+    """Directory-safe name for a model identifier or path"""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name.strip("/\\")) or "model"
+
+
+def export_onnx(model, path: str, opset: int = 17) -> None:
+    """
+    Export a question answering model's forward pass to an ONNX graph
+    
+    Batch size and sequence length are dynamic axes, so the graph runs the
+    same padded batches the PyTorch path does.
+    
+    Args:
+        model: transformers model for question answering (eval mode)
+        path: Destination .onnx file
+        opset: ONNX opset version
+    """
+    import torch
+    
+    class _Logits(torch.nn.Module):
+        """Return (start_logits, end_logits) as a plain tuple"""
+        
+        def __init__(self, wrapped):
+            super().__init__()
+            self.wrapped = wrapped
+        
+        def forward(self, input_ids, attention_mask):
+            outputs = self.wrapped(input_ids=input_ids, attention_mask=attention_mask)
+            return outputs.start_logits, outputs.end_logits
+    
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    dummy = torch.ones((2, 16), dtype=torch.long)
+    tmp_path = f"{path}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            _Logits(model.eval()),
+            (dummy, dummy),
+            tmp_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["start_logits", "end_logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "start_logits": {0: "batch", 1: "sequence"},
+                "end_logits": {0: "batch", 1: "sequence"}
+            },
+            opset_version=opset,
+            dynamo=False
+        )
+    # Readers never see a half-written graph
+    os.replace(tmp_path, path)
+
+
+def quantize_onnx(source_path: str, path: str) -> None:
+    """
+    Quantize an ONNX graph's weights to int8 (dynamic quantization)
+    
+    Weights of MatMul/Gemm nodes are stored as int8 and activations are
+    quantized on the fly, which mostly speeds up the transformer's linear
+    layers on CPU. Embeddings and layer norms stay in float32.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    
+    tmp_path = f"{path}.tmp"
+    quantize_dynamic(
+        source_path,
+        tmp_path,
+        weight_type=QuantType.QInt8,
+        op_types_to_quantize=["MatMul", "Gemm"]
+    )
+    os.replace(tmp_path, path)
+
+
+class OnnxReader:
+    """
+    Runs a reader's forward pass with ONNX Runtime on CPU
+    
+    Takes the same padded ``input_ids``/``attention_mask`` arrays as the
+    PyTorch path and returns start and end logits as numpy arrays, so
+    QAEngine's span decoding and caches are shared by both backends.
+    """
+    
+    def __init__(self, path: str, intra_op_threads: int = 0):
+        """
+        Open an exported graph
+        
+        Args:
+            path: .onnx file
+            intra_op_threads: Threads per operator (0 lets ONNX Runtime decide)
+        """
+        import onnxruntime
+        
+        self.path = path
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = onnxruntime.InferenceSession(
+            path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+    
+    @classmethod
+    def from_model(
+        cls,
+        model,
+        model_name: str,
+        cache_dir: str,
+        quantize: bool = False,
+        intra_op_threads: int = 0
+    ) -> "OnnxReader":
+        """
+        Open the exported graph for a model, exporting (and quantizing) it on first use
+        
+        Graphs are cached under ``cache_dir/<model>/`` as ``model.onnx`` and
+        ``model.int8.onnx``; delete them to re-export after changing the model.
+        
+        Args:
+            model: Loaded transformers model, used only if no graph is cached
+            model_name: Model identifier, names the cache directory
+            cache_dir: Directory for exported graphs
+            quantize: Use the int8-quantized graph
+            intra_op_threads: Threads per operator (0 lets ONNX Runtime decide)
+        """
+        model_dir = os.path.join(cache_dir, _model_slug(model_name))
+        fp32_path = os.path.join(model_dir, "model.onnx")
+        if not os.path.exists(fp32_path):
+            print(f"Exporting {model_name} to ONNX: {fp32_path}")
+            export_onnx(model, fp32_path)
+        
+        path = fp32_path
+        if quantize:
+            path = os.path.join(model_dir, "model.int8.onnx")
+            if not os.path.exists(path):
+                print(f"Quantizing ONNX graph to int8: {path}")
+                quantize_onnx(fp32_path, path)
+        
+        return cls(path, intra_op_threads=intra_op_threads)
+    
+    def forward(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Run one padded batch and return (start_logits, end_logits)"""
+        start_logits, end_logits = self.session.run(
+            ["start_logits", "end_logits"],
+            {"input_ids": input_ids, "attention_mask": attention_mask}
+        )
+        return start_logits, end_logits
+    
+    def get_statistics(self) -> Dict:
+        """Get the graph file in use"""
+        return {
+            "path": self.path,
+            "file_bytes": os.path.getsize(self.path)
+        }
@@ -0,0 +1,181 @@
+"""
+Global table of indexed passages keyed by integer passage id
+"""
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.passages import PassageSpans
+
+# Passage ids per page of the table
+PAGE_SIZE = 1024
+
+
+class _Page:
+    """Document slot, start and end offset of PAGE_SIZE consecutive passage ids"""
+    
+    __slots__ = ("doc_slots", "starts", "ends", "live")
+    
+    def __init__(self):
+        self.doc_slots = array('l', [-1]) * PAGE_SIZE
+        self.starts = array('l', [0]) * PAGE_SIZE
+        self.ends = array('l', [0]) * PAGE_SIZE
+        self.live = 0  # Ids on the page that belong to a document not yet released
+
+
+class PassageRegistry:
+    """
+    Maps passage ids to (doc_id, start_pos, end_pos) in constant time
+    
+    Passage ids are handed out consecutively from 0, so the table is three
+    parallel int arrays indexed directly by id: the owning document's slot,
+    and the passage's start and end offset in that document's text. The
+    arrays are split into pages of PAGE_SIZE ids. Document ids are stored
+    once per document. Deleting a document empties its slot, which makes all
+    of its passage ids resolve to None, and frees every page left without a
+    live passage; clear() frees them all. Ids are never reused (cached reader
+    results are keyed by them); ids that belong to no document (for example
+    those of documents deleted before a restart) resolve to None.
+    """
+    
+    def __init__(self):
+        """Initialize an empty registry"""
+        self._pages: List[Optional[_Page]] = []  # None for pages without live passages
+        self._next_id = 0
+        self._doc_ids: Dict[int, str] = {}  # {slot: doc_id}
+        self._slot_of: Dict[str, Tuple[int, range]] = {}  # {doc_id: (slot, passage ids)}
+        self._next_slot = 0
+    
+    def __len__(self) -> int:
+        return self._next_id
+    
+    def register(self, doc_id: str, passages: PassageSpans) -> range:
+        """
+        Assign ids to a document's passages
+        
+        Args:
+            doc_id: Owning document
+            passages: The document's passages
+        
+        Returns:
+            Range of the new passage ids, in passage order
+        """
+        return self.restore(
+            doc_id,
+            passages.sentence_starts,
+            passages.sentence_ends,
+            passages.window_size,
+            self._next_id
+        )
+    
+    def restore(
+        self,
+        doc_id: str,
+        sentence_starts: array,
+        sentence_ends: array,
+        window_size: int,
+        first_id: int
+    ) -> range:
+        """
+        Register a document's passages under ids assigned earlier
+        
+        Used when loading a stored corpus, so passage ids stay the same
+        across restarts.
+        
+        Args:
+            doc_id: Owning document
+            sentence_starts: Sentence start offsets of the document
+            sentence_ends: Sentence end offsets of the document
+            window_size: Sentences per passage
+            first_id: Id of the document's first passage. Ids below len(self)
+                must not belong to another document (for example a range
+                handed out earlier and filled in now)
+        
+        Returns:
+            Range of the passage ids, in passage order
+        """
+        slot = self._next_slot
+        self._next_slot += 1
+        self._doc_ids[slot] = doc_id
+        
+        count = max(len(sentence_starts) - window_size + 1, 0)
+        last_sentence = window_size - 1
+        stop = first_id + count
+        self.reserve(stop)
+        self._slot_of[doc_id] = (slot, range(first_id, stop))
+        
+        passage_id = first_id
+        while passage_id < stop:
+            number, offset = divmod(passage_id, PAGE_SIZE)
+            n = min(PAGE_SIZE - offset, stop - passage_id)
+            page = self._pages[number]
+            if page is None:
+                page = self._pages[number] = _Page()
+            index = passage_id - first_id
+            page.doc_slots[offset:offset + n] = array('l', [slot]) * n
+            page.starts[offset:offset + n] = array('l', sentence_starts[index:index + n])
+            page.ends[offset:offset + n] = array(
+                'l', sentence_ends[last_sentence + index:last_sentence + index + n]
+            )
+            page.live += n
+            passage_id += n
+        return range(first_id, stop)
+    
+    def reserve(self, next_id: int) -> None:
+        """Mark every id below next_id that is not assigned yet as used by no document"""
+        if next_id > self._next_id:
+            self._next_id = next_id
+            pages = -(-next_id // PAGE_SIZE)
+            self._pages.extend([None] * (pages - len(self._pages)))
+    
+    def release(self, doc_id: str) -> None:
+        """Forget a document so its passage ids no longer resolve, and free pages left empty"""
+        entry = self._slot_of.pop(doc_id, None)
+        if entry is None:
+            return
+        slot, passage_ids = entry
+        del self._doc_ids[slot]
+        
+        passage_id = passage_ids.start
+        while passage_id < passage_ids.stop:
+            number, offset = divmod(passage_id, PAGE_SIZE)
+            n = min(PAGE_SIZE - offset, passage_ids.stop - passage_id)
+            page = self._pages[number]
+            page.live -= n
+            if page.live == 0:
+                self._pages[number] = None
+            passage_id += n
+    
+    def lookup(self, passage_id: int) -> Optional[Tuple[str, int, int]]:
+        """
+        Resolve a passage id
+        
+        Returns:
+            Tuple of (doc_id, start_pos, end_pos), or None if the id is
+            unknown or its document was deleted
+        """
+        if not 0 <= passage_id < self._next_id:
+            return None
+        number, offset = divmod(passage_id, PAGE_SIZE)
+        page = self._pages[number]
+        if page is None:
+            return None
+        doc_id = self._doc_ids.get(page.doc_slots[offset])
+        if doc_id is None:
+            return None
+        return doc_id, page.starts[offset], page.ends[offset]
+    
+    def clear(self) -> None:
+        """Forget all documents (ids keep counting up so stale results never resolve)"""
+        self._doc_ids.clear()
+        self._slot_of.clear()
+        self._pages = [None] * len(self._pages)
+    
+    def get_statistics(self) -> Dict:
+        """Get table size"""
+        pages = sum(page is not None for page in self._pages)
+        return {
+            "passage_ids": self._next_id,
+            "documents": len(self._slot_of),
+            "pages": pages,
+            "table_bytes": pages * PAGE_SIZE * 3 * array('l').itemsize + 8 * len(self._pages)
+        }
@@ -1,34 +1,210 @@
 """
 Question Answering engine using Hugging Face transformers
 """
-from typing import List, Tuple, Dict
+import threading
+import time
+from typing import Callable, List, Optional, Tuple, Dict, Union
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from transformers import pipeline
+from app.services.cache import ReaderCache
+from app.services.onnx_reader import BACKENDS, OnnxReader
+from app.services.retrieval_index import create_index
 import warnings
 
 warnings.filterwarnings('ignore')
 
+# Span candidates considered per passage before merging word-aligned duplicates
+_SPAN_CANDIDATES = 12
+
+# Weights of retrieval similarity and reader score in an answer's confidence
+_SIMILARITY_WEIGHT = 0.2
+_QA_WEIGHT = 0.8
+
+# Dummy pair run through the reader once after loading
+_WARMUP_QUESTION = "What is this passage about?"
+_WARMUP_CONTEXT = "This passage warms up the question answering model before the first request."
+
 
 class QAEngine:
     """Handles question answering using pre-trained models"""
     
-    def __init__(self, model_name: str = "deepset/roberta-base-squad2"):
+    def __init__(
+        self,
+        model_name: str = "deepset/roberta-base-squad2",
+        retriever: str = "tfidf",
+        batch_size: int = 8,
+        max_seq_length: int = 384,
+        reader_cache: Optional[ReaderCache] = None,
+        load_model: bool = True,
+        backend: str = "pytorch",
+        onnx_dir: Optional[str] = None,
+        onnx_threads: int = 0,
+        early_exit: bool = False,
+        early_exit_threshold: float = 0.9,
+        early_exit_round_size: int = 1
+    ):
         """
         Initialize QA engine with a pre-trained model
         
         Args:
             model_name: HuggingFace model identifier
+            retriever: Retrieval backend for ad-hoc passages ("tfidf" or "bm25")
+            batch_size: Maximum (question, passage) pairs per reader forward pass
+            max_seq_length: Token budget for question + passage in the reader
+            reader_cache: Optional memo of reader outputs and passage tokenizations
+            load_model: Load the model now; False leaves it to load() or
+                load_in_background(), so constructing the engine stays cheap
+            backend: Reader forward pass: "pytorch", "onnx" (ONNX Runtime) or
+                "onnx-int8" (ONNX Runtime with int8-quantized weights)
+            onnx_dir: Directory for exported ONNX graphs (required for the onnx backends)
+            onnx_threads: ONNX Runtime threads per operator (0 lets it decide)
+            early_exit: Read passages in rounds, best retrieval score first, and
+                stop once the remaining ones cannot matter (see should_stop_reading)
+            early_exit_threshold: Reader score that ends reading early
+            early_exit_round_size: Passages read per round with early exit
         """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown reader backend: {backend}")
         self.model_name = model_name
-        try:
-            self.qa_pipeline = pipeline("question-answering", model=model_name)
-            print(f"Loaded QA model: {model_name}")
-        except Exception as e:
-            print(f"Error loading model {model_name}: {str(e)}")
-            # Fallback to a lighter model
-            self.qa_pipeline = pipeline("question-answering")
+        self.retriever = retriever
+        self.batch_size = batch_size
+        self.max_seq_length = max_seq_length
+        self.reader_cache = reader_cache
+        self.backend = backend
+        self.onnx_dir = onnx_dir
+        self.onnx_threads = onnx_threads
+        self.early_exit = early_exit
+        self.early_exit_threshold = early_exit_threshold
+        self.early_exit_round_size = max(early_exit_round_size, 1)
+        self.early_exits = 0
+        self.reader_calls_skipped = 0
+        self._stats_lock = threading.Lock()
+        
+        self.qa_pipeline = None
+        self.onnx_reader: Optional[OnnxReader] = None
+        self.status = "not_loaded"  # not_loaded -> loading -> warming_up -> ready, or failed
+        self.load_error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self._finished = threading.Event()  # set once loading succeeded or failed
+        self._load_lock = threading.Lock()
+        
+        if load_model:
+            self.load()
+    
+    @property
+    def is_ready(self) -> bool:
+        return self.status == "ready"
+    
+    def load(self, warmup: bool = True) -> bool:
+        """
+        Load the model and tokenizer, then optionally run a warmup inference
+        
+        transformers and torch are imported here rather than at module import,
+        so the API can start serving before they are in memory. Calling this
+        again after the model is loaded does nothing.
+        
+        Args:
+            warmup: Run one forward pass on a dummy pair after loading
+        
+        Returns:
+            True if the engine is ready
+        """
+        with self._load_lock:
+            if self.status in ("ready", "failed"):
+                return self.is_ready
+            
+            self.status = "loading"
+            start_time = time.time()
+            try:
+                from transformers import pipeline
+                try:
+                    self.qa_pipeline = pipeline("question-answering", model=self.model_name)
+                    print(f"Loaded QA model: {self.model_name}")
+                except Exception as e:
+                    print(f"Error loading model {self.model_name}: {str(e)}")
+                    # Fallback to a lighter model
+                    self.qa_pipeline = pipeline("question-answering")
+            except Exception as e:
+                print(f"Error loading QA model: {str(e)}")
+                self.status = "failed"
+                self.load_error = str(e)
+                self._finished.set()
+                return False
+            
+            if self.backend != "pytorch":
+                try:
+                    # The PyTorch model is still needed for the tokenizer and the first export
+                    self.onnx_reader = OnnxReader.from_model(
+                        self.qa_pipeline.model,
+                        self.model_name,
+                        self.onnx_dir,
+                        quantize=self.backend == "onnx-int8",
+                        intra_op_threads=self.onnx_threads
+                    )
+                    print(f"Using {self.backend} reader: {self.onnx_reader.path}")
+                except Exception as e:
+                    print(f"Error setting up {self.backend} reader, using pytorch: {str(e)}")
+                    self.backend = "pytorch"
+            self.load_seconds = time.time() - start_time
+            
+            if warmup:
+                self.status = "warming_up"
+                start_time = time.time()
+                try:
+                    self.warmup()
+                except Exception as e:
+                    # A failed warmup only means the first request pays for it
+                    print(f"Error in QA model warmup: {str(e)}")
+                self.warmup_seconds = time.time() - start_time
+            
+            self.status = "ready"
+            self._finished.set()
+            return True
+    
+    def load_in_background(self, warmup: bool = True) -> threading.Thread:
+        """Start load() on a daemon thread and return the thread"""
+        thread = threading.Thread(
+            target=self.load,
+            kwargs={"warmup": warmup},
+            name="qa-model-loader",
+            daemon=True
+        )
+        thread.start()
+        return thread
+    
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until the model is ready (or loading failed, or timeout seconds passed)"""
+        self._finished.wait(timeout)
+        return self.is_ready
+    
+    def warmup(self) -> None:
+        """
+        Run one reader forward pass on a dummy pair
+        
+        The first pass through a freshly loaded model pays for lazy kernel and
+        allocator setup; doing it here keeps that off the first real request.
+        The warmup bypasses the reader cache.
+        """
+        input_ids, _, _ = self._encode_pair(_WARMUP_QUESTION, _WARMUP_CONTEXT)
+        self._forward([input_ids])
+    
+    def get_status(self) -> Dict:
+        """Get the model loading state"""
+        return {
+            "status": self.status,
+            "model": self.model_name,
+            "backend": self.backend,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "warmup_seconds": round(self.warmup_seconds, 3) if self.warmup_seconds is not None else None,
+            "error": self.load_error,
+            "early_exit": {
+                "enabled": self.early_exit,
+                "threshold": self.early_exit_threshold,
+                "round_size": self.early_exit_round_size,
+                "early_exits": self.early_exits,
+                "reader_calls_skipped": self.reader_calls_skipped
+            }
+        }
     
     def retrieve_relevant_passages(
         self,
@@ -37,13 +213,16 @@ class QAEngine:
         top_k: int = 3
     ) -> List[Tuple[str, float, int]]:
         """
-        Retrieve most relevant passages for a question using TF-IDF similarity
+        Retrieve most relevant passages for a question with the engine's retriever
+        
+        Builds a throwaway index over the given passages. Document uploads are
+        indexed once by DocumentIndexer and searched with DocumentIndexer.search.
         
         Args:
             question: User's question
             passages: List of document passages
             top_k: Number of top passages to return
-            
+        
         Returns:
             List of (passage, similarity_score, index) tuples
         """
@@ -51,32 +230,14 @@ class QAEngine:
             return []
         
         try:
-            # Create TF-IDF vectors
-            vectorizer = TfidfVectorizer(
-                max_features=500,
-                stop_words='english',
-                lowercase=True
-            )
-            
-            # Combine question and passages for vectorization
-            all_texts = [question] + passages
-            tfidf_matrix = vectorizer.fit_transform(all_texts)
-            
-            # Calculate similarity between question and each passage
-            question_vector = tfidf_matrix[0]
-            passage_vectors = tfidf_matrix[1:]
-            
-            similarities = cosine_similarity(question_vector, passage_vectors)[0]
+            index = create_index(self.retriever, background_compaction=False)
+            index.add(range(len(passages)), passages)
             
             # Get top k passages (even if similarity is low, we need at least some passages to work with)
-            top_k_indices = np.argsort(similarities)[::-1][:top_k]
-            
-            results = [
-                (passages[idx], float(similarities[idx]), idx)
-                for idx in top_k_indices
+            return [
+                (passages[idx], score, idx)
+                for idx, score in index.search(question, top_k)
             ]
-            
-            return results
         
         except Exception as e:
             print(f"Error in passage retrieval: {str(e)}")
@@ -95,7 +256,7 @@ class QAEngine:
             question: User's question
             context: Document context/passage
             max_answer_length: Maximum length of answer
-            
+        
         Returns:
             Dictionary with answer, score, and positions
         """
@@ -108,10 +269,7 @@ class QAEngine:
             }
         
         try:
-            # Ensure context is not too long
-            if len(context) > 512:
-                context = context[:512]
-            
+            # The pipeline splits contexts longer than the model's sequence length itself
             result = self.qa_pipeline(
                 question=question,
                 context=context,
@@ -134,6 +292,229 @@ class QAEngine:
                 "end": 0
             }
     
+    def answer_batch(
+        self,
+        pairs: List[Tuple[str, str]],
+        max_answer_length: int = 512,
+        passage_ids: Optional[List[Optional[int]]] = None,
+        lookup_cache: bool = True
+    ) -> List[Dict]:
+        """
+        Extract answers for many (question, context) pairs with batched forward passes
+        
+        Pairs are encoded once, grouped into batches of ``batch_size`` and
+        padded to the longest sequence in each batch, so a batch costs a single
+        forward pass through the model instead of one pipeline call per pair.
+        With a reader cache, pairs answered before skip the model entirely and
+        passages tokenized before skip the tokenizer.
+        
+        Args:
+            pairs: List of (question, context) tuples
+            max_answer_length: Maximum length of answer (in tokens)
+            passage_ids: Passage id of each context, if it comes from the index
+            lookup_cache: Check the reader cache first (False if the caller already did)
+        
+        Returns:
+            List of answer dictionaries (same shape as answer_question), one per pair
+        """
+        results = [
+            {"answer": "", "score": 0.0, "start": 0, "end": 0}
+            for _ in pairs
+        ]
+        
+        encoded = []
+        for i, (question, context) in enumerate(pairs):
+            if not context or not question:
+                continue
+            
+            # Long contexts are cut to the token budget in _encode_pair, not by characters
+            passage_key = None
+            if self.reader_cache is not None:
+                passage_key = ReaderCache.passage_key(context, passage_ids[i] if passage_ids else None)
+                if lookup_cache:
+                    cached = self.reader_cache.results.get(
+                        ReaderCache.result_key(question, passage_key, self.model_name, max_answer_length)
+                    )
+                    if cached is not None:
+                        results[i] = dict(cached)
+                        continue
+            encoded.append((i, question, context, passage_key) + self._encode_pair(question, context, passage_key))
+        
+        for batch_start in range(0, len(encoded), self.batch_size):
+            batch = encoded[batch_start:batch_start + self.batch_size]
+            try:
+                start_logits, end_logits = self._forward([item[4] for item in batch])
+                for row, (i, question, context, passage_key, _, context_start, offsets) in enumerate(batch):
+                    results[i] = self._decode_span(
+                        context,
+                        start_logits[row],
+                        end_logits[row],
+                        context_start,
+                        offsets,
+                        min(max_answer_length, len(context))
+                    )
+                    if self.reader_cache is not None:
+                        self.reader_cache.results.put(
+                            ReaderCache.result_key(question, passage_key, self.model_name, max_answer_length),
+                            dict(results[i])
+                        )
+            except Exception as e:
+                print(f"Error in batched QA processing: {str(e)}")
+        
+        return results
+    
+    def cached_answer(
+        self,
+        question: str,
+        context: str,
+        passage_id: Optional[int] = None,
+        max_answer_length: int = 512
+    ) -> Optional[Dict]:
+        """Get a memoized reader result for a pair, or None"""
+        if self.reader_cache is None or not context or not question:
+            return None
+        cached = self.reader_cache.results.get(ReaderCache.result_key(
+            question,
+            ReaderCache.passage_key(context, passage_id),
+            self.model_name,
+            max_answer_length
+        ))
+        return dict(cached) if cached is not None else None
+    
+    def _encode_context(self, context: str, passage_key: Optional[Union[int, str]] = None) -> Tuple[List[int], List[Tuple[int, int]]]:
+        """
+        Tokenize a passage on its own, reusing a cached tokenization when there is one
+        
+        Returns:
+            Tuple of (context_ids, word-aligned character offsets per token)
+        """
+        cache = self.reader_cache.encodings if self.reader_cache is not None and passage_key is not None else None
+        cache_key = (passage_key, self.model_name)
+        if cache is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        tokenizer = self.qa_pipeline.tokenizer
+        context_enc = tokenizer(context, add_special_tokens=False, return_offsets_mapping=True)
+        context_ids = context_enc["input_ids"]
+        
+        # Widen token offsets to whole words so answers never start or end mid-word
+        offsets = []
+        for token, word in enumerate(context_enc.word_ids()):
+            if word is None:
+                offsets.append(tuple(context_enc["offset_mapping"][token]))
+            else:
+                offsets.append(tuple(context_enc.word_to_chars(word)))
+        
+        if cache is not None:
+            cache.put(cache_key, (context_ids, offsets))
+        return context_ids, offsets
+    
+    def _encode_pair(
+        self,
+        question: str,
+        context: str,
+        passage_key: Optional[Union[int, str]] = None
+    ) -> Tuple[List[int], int, List[Tuple[int, int]]]:
+        """
+        Tokenize a (question, context) pair for the reader
+        
+        Returns:
+            Tuple of (input_ids, context_start_token, context_offsets)
+        """
+        tokenizer = self.qa_pipeline.tokenizer
+        question_ids = tokenizer(question, add_special_tokens=False)["input_ids"]
+        context_ids, offsets = self._encode_context(context, passage_key)
+        
+        # Keep the question whole and cut the context to the remaining token budget
+        budget = self.max_seq_length - len(question_ids) - tokenizer.num_special_tokens_to_add(pair=True)
+        context_ids = context_ids[:max(budget, 0)]
+        offsets = offsets[:len(context_ids)]
+        
+        input_ids = tokenizer.build_inputs_with_special_tokens(question_ids, context_ids)
+        special = tokenizer.get_special_tokens_mask(input_ids, already_has_special_tokens=True)
+        
+        # The context starts after the question tokens and the separators that follow them
+        seen = 0
+        context_start = len(input_ids) - len(context_ids)
+        for pos, is_special in enumerate(special):
+            if not is_special:
+                if seen == len(question_ids):
+                    context_start = pos
+                    break
+                seen += 1
+        
+        return input_ids, context_start, offsets
+    
+    def _forward(self, sequences: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Run one forward pass over token sequences padded to the longest one"""
+        tokenizer = self.qa_pipeline.tokenizer
+        longest = max(len(seq) for seq in sequences)
+        pad_id = tokenizer.pad_token_id or 0
+        
+        input_ids = np.full((len(sequences), longest), pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(sequences), longest), dtype=np.int64)
+        for row, seq in enumerate(sequences):
+            input_ids[row, :len(seq)] = seq
+            attention_mask[row, :len(seq)] = 1
+        
+        if self.onnx_reader is not None:
+            return self.onnx_reader.forward(input_ids, attention_mask)
+        
+        import torch
+        
+        model = self.qa_pipeline.model
+        with torch.no_grad():
+            outputs = model(
+                input_ids=torch.from_numpy(input_ids).to(model.device),
+                attention_mask=torch.from_numpy(attention_mask).to(model.device)
+            )
+        return outputs.start_logits.cpu().numpy(), outputs.end_logits.cpu().numpy()
+    
+    @staticmethod
+    def _decode_span(
+        context: str,
+        start_logits: np.ndarray,
+        end_logits: np.ndarray,
+        context_start: int,
+        offsets: List[Tuple[int, int]],
+        max_answer_length: int
+    ) -> Dict:
+        """Pick the best answer span within the context tokens of one sequence"""
+        if len(offsets) == 0:
+            return {"answer": "", "score": 0.0, "start": 0, "end": 0}
+        
+        # Normalize over the context tokens plus the leading CLS token, as the
+        # question-answering pipeline does; only context tokens can be picked
+        context_end = context_start + len(offsets)
+        start_logits = np.concatenate([start_logits[:1], start_logits[context_start:context_end]])
+        end_logits = np.concatenate([end_logits[:1], end_logits[context_start:context_end]])
+        start_probs = np.exp(start_logits - start_logits.max())
+        start_probs = start_probs[1:] / start_probs.sum()
+        end_probs = np.exp(end_logits - end_logits.max())
+        end_probs = end_probs[1:] / end_probs.sum()
+        
+        candidates = np.triu(np.outer(start_probs, end_probs))
+        candidates = np.tril(candidates, max(max_answer_length, 1) - 1).ravel()
+        
+        # Token spans that widen to the same words are one answer; add up their scores
+        num_best = min(_SPAN_CANDIDATES, len(candidates))
+        best = np.argpartition(-candidates, num_best - 1)[:num_best]
+        spans: Dict[Tuple[int, int], float] = {}
+        for flat in best[np.argsort(-candidates[best])]:
+            start_tok, end_tok = divmod(int(flat), len(offsets))
+            span = (int(offsets[start_tok][0]), int(offsets[end_tok][1]))
+            spans[span] = spans.get(span, 0.0) + float(candidates[flat])
+        
+        (start_char, end_char), score = max(spans.items(), key=lambda item: item[1])
+        return {
+            "answer": context[start_char:end_char],
+            "score": score,
+            "start": start_char,
+            "end": end_char
+        }
+    
     def process_question(
         self,
         question: str,
@@ -147,13 +528,33 @@ class QAEngine:
             question: User's question
             passages: List of (passage_text, start_pos, end_pos) tuples
             top_k: Number of top answers to return
-            
+        
         Returns:
             List of answer dictionaries sorted by confidence score
         """
         if not passages:
             return []
         
+        relevant = self.select_passages(question, passages, top_k)
+        return self.read_passages(question, relevant, top_k, indexed=False)
+    
+    def select_passages(
+        self,
+        question: str,
+        passages: List[Tuple[str, int, int]],
+        top_k: int = 3
+    ) -> List[Tuple[str, float, int]]:
+        """
+        Retrieve the passages the reader should look at for a question
+        
+        Args:
+            question: User's question
+            passages: List of (passage_text, start_pos, end_pos) tuples
+            top_k: Number of passages to select
+        
+        Returns:
+            List of (passage, similarity_score, index) tuples
+        """
         passage_texts = [p[0] for p in passages]
         
         # Retrieve relevant passages (now returns top_k without strict filtering)
@@ -163,21 +564,164 @@ class QAEngine:
             # Fallback: if no relevant passages found, try all passages
             relevant = [(p, 0.0, i) for i, p in enumerate(passage_texts[:top_k])]
         
+        return relevant
+    
+    def read_passages(
+        self,
+        question: str,
+        relevant: List[Tuple[str, float, int]],
+        top_k: int = 3,
+        indexed: bool = True
+    ) -> List[Dict]:
+        """
+        Run the reader over already retrieved passages and rank the answers
+        
+        Args:
+            question: User's question
+            relevant: List of (passage, similarity_score, index) tuples
+            top_k: Number of top answers to return
+            indexed: Whether the indexes are corpus passage ids (False for
+                positions in ad-hoc text, which are cached by text instead)
+        
+        Returns:
+            List of answer dictionaries sorted by confidence score
+        """
+        answers, _ = self.read_with_early_exit(question, relevant, top_k, indexed=indexed)
+        return answers
+    
+    def read_with_early_exit(
+        self,
+        question: str,
+        relevant: List[Tuple[str, float, int]],
+        top_k: int = 3,
+        reader: Optional[Callable[..., List[Dict]]] = None,
+        indexed: bool = True
+    ) -> Tuple[List[Dict], int]:
+        """
+        Run the reader round by round until the remaining passages cannot matter
+        
+        Args:
+            question: User's question
+            relevant: List of (passage, similarity_score, index) tuples
+            top_k: Number of top answers to return
+            reader: Called as ``reader(pairs, passage_ids=...)`` for each round
+                (defaults to answer_batch)
+            indexed: Whether the indexes are corpus passage ids; only those
+                are handed to the reader as cache keys
+        
+        Returns:
+            Tuple of (answers sorted by confidence score, reader calls skipped)
+        """
+        reader = reader or self.answer_batch
+        ordered = self.reading_order(relevant)
+        qa_results = []
         answers = []
-        for passage, similarity_score, idx in relevant:
-            # Get QA result
-            qa_result = self.answer_question(question, passage)
-            
+        while True:
+            batch = self.next_reading_round(ordered, answers, len(qa_results), top_k)
+            if not batch:
+                break
+            qa_results.extend(reader(
+                [(question, passage) for passage, _, _ in batch],
+                passage_ids=[passage_id for _, _, passage_id in batch] if indexed else None
+            ))
+            answers = self.rank_answers(ordered[:len(qa_results)], qa_results, len(qa_results))
+        return answers[:top_k], self.record_skipped(len(ordered) - len(qa_results))
+    
+    def reading_order(self, relevant: List[Tuple[str, float, int]]) -> List[Tuple[str, float, int]]:
+        """Passages in the order the reader sees them: best retrieval score first"""
+        return sorted(relevant, key=lambda item: item[1], reverse=True)
+    
+    def next_reading_round(
+        self,
+        ordered: List[Tuple[str, float, int]],
+        answers: List[Dict],
+        num_read: int,
+        top_k: int
+    ) -> List[Tuple[str, float, int]]:
+        """
+        Passages for the next reader round, or an empty list to stop reading
+        
+        Args:
+            ordered: Passages in reading order (see reading_order)
+            answers: Ranked answers from the passages read so far
+            num_read: How many of ``ordered`` have been read
+            top_k: Number of answers the caller returns
+        """
+        if num_read >= len(ordered):
+            return []
+        if not self.early_exit:
+            return ordered[num_read:]
+        if num_read > 0 and self.should_stop_reading(answers, ordered[num_read][1], top_k):
+            return []
+        return ordered[num_read:num_read + self.early_exit_round_size]
+    
+    def should_stop_reading(self, answers: List[Dict], next_similarity: float, top_k: int) -> bool:
+        """
+        Whether the passages not read yet can be skipped
+        
+        Reading only stops once top_k answers are in, so early exit never
+        returns fewer answers than requested. It then stops when an answer's
+        reader score reaches ``early_exit_threshold``, or when the weakest of
+        the top_k beats the best confidence any unread passage could reach (a
+        perfect reader score at the next passage's similarity, since unread
+        passages have lower similarity).
+        
+        Args:
+            answers: Ranked answers from the passages read so far
+            next_similarity: Retrieval score of the best unread passage
+            top_k: Number of answers the caller returns
+        """
+        if len(answers) < top_k:
+            return False
+        if any(answer["qa_score"] >= self.early_exit_threshold for answer in answers):
+            return True
+        best_unread = self.combined_score(next_similarity, 1.0)
+        return answers[top_k - 1]["confidence_score"] >= best_unread
+    
+    def record_skipped(self, skipped: int) -> int:
+        """Count reader calls skipped by one early exit; returns ``skipped``"""
+        if skipped > 0:
+            with self._stats_lock:
+                self.early_exits += 1
+                self.reader_calls_skipped += skipped
+        return skipped
+    
+    @staticmethod
+    def combined_score(similarity_score: float, qa_score: float) -> float:
+        """Confidence of an answer from its passage's retrieval score and its reader score"""
+        return similarity_score * _SIMILARITY_WEIGHT + qa_score * _QA_WEIGHT
+    
+    def rank_answers(
+        self,
+        relevant: List[Tuple[str, float, int]],
+        qa_results: List[Dict],
+        top_k: int = 3
+    ) -> List[Dict]:
+        """
+        Combine retrieval and reader scores into ranked answers
+        
+        Args:
+            relevant: List of (passage, similarity_score, index) tuples; the
+                index is the passage id for passages from DocumentIndexer.search
+            qa_results: Reader outputs, one per entry in ``relevant``
+            top_k: Number of top answers to return
+        
+        Returns:
+            List of answer dictionaries sorted by confidence score
+        """
+        answers = []
+        for (passage, similarity_score, idx), qa_result in zip(relevant, qa_results):
             if qa_result["answer"] and qa_result["score"] > 0:
                 # Combine similarity and QA scores
                 # Weight QA score more heavily since it's more reliable
-                combined_score = (similarity_score * 0.2 + qa_result["score"] * 0.8)
+                combined_score = self.combined_score(similarity_score, qa_result["score"])
                 
                 answers.append({
                     "answer": qa_result["answer"],
                     "confidence_score": combined_score,
                     "source_text": passage,
                     "source_position": idx,
+                    "passage_id": idx,
                     "qa_score": qa_result["score"],
                     "similarity_score": similarity_score
                 })
@@ -0,0 +1,567 @@
+"""
+Persistent TF-IDF retrieval index that is updated incrementally
+"""
+import pickle
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+
+# Same tokenization (lowercasing + English stop words) the per-query vectorizer used
+_analyzer = TfidfVectorizer(stop_words='english', lowercase=True).build_analyzer()
+
+# Dense (passages x queries) scores materialized at once by a batched search
+_MAX_BATCH_SCORES = 4_000_000
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into index terms"""
+    return _analyzer(text)
+
+
+def create_index(
+    retriever: str = "tfidf",
+    dense_options: Optional[Dict] = None,
+    shards: int = 1,
+    **kwargs
+):
+    """
+    Create an empty retrieval index
+    
+    Every backend exposes add(ids, texts), remove(ids),
+    search(query, top_k, id_ranges=None), search_batch(queries, top_k,
+    id_ranges=None), clear() and get_statistics().
+    ``id_ranges`` limits a search to passage ids in the given ranges (one
+    range per document, see DocumentIndexer.search).
+    
+    Args:
+        retriever: Backend name, "tfidf" or "bm25", optionally with a "+dense"
+            suffix to fuse it with a dense embedding index
+        dense_options: DenseIndex options plus "dense_weight" (for "+dense")
+        shards: Split the lexical index into this many shards searched in
+            parallel (the dense index is not sharded)
+        **kwargs: Backend-specific options for the lexical index
+    
+    Returns:
+        Index instance
+    """
+    lexical, _, extra = retriever.partition("+")
+    if extra == "dense":
+        from app.services.dense_index import DenseIndex, HybridIndex
+        options = dict(dense_options or {})
+        dense_weight = options.pop("dense_weight", 0.5)
+        return HybridIndex(
+            create_index(lexical, shards=shards, **kwargs),
+            DenseIndex(**options),
+            dense_weight=dense_weight
+        )
+    if extra:
+        raise ValueError(f"Unknown retriever: {retriever}")
+    if shards > 1:
+        from app.services.sharded_index import ShardedIndex
+        # Shards share one set of term statistics, so they score like a single index
+        first = create_index(retriever, **kwargs)
+        rest = [create_index(retriever, statistics=first.statistics, **kwargs) for _ in range(shards - 1)]
+        return ShardedIndex([first] + rest)
+    if retriever == "tfidf":
+        return TfidfIndex(**kwargs)
+    if retriever == "bm25":
+        from app.services.bm25_index import BM25Index
+        return BM25Index(**kwargs)
+    raise ValueError(f"Unknown retriever: {retriever}")
+
+
+class TermStatistics:
+    """
+    Vocabulary and document frequencies of a TF-IDF corpus
+    
+    Every TfidfIndex has one. The shards of a ShardedIndex share a single
+    instance (and its lock), so column ids and IDF weights are corpus-wide
+    and each shard scores passages exactly like one unsharded index would.
+    """
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+    
+    def clear(self) -> None:
+        """Forget every term"""
+        self.vocabulary: Dict[str, int] = {}
+        self.doc_freq = np.zeros(0, dtype=np.int64)
+        self.num_passages = 0
+        self.idf = np.zeros(0, dtype=np.float64)
+        self.version = 0
+    
+    def __getstate__(self) -> Dict:
+        state = dict(self.__dict__)
+        del state["lock"]
+        return state
+    
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+    
+    def refresh_idf(self) -> None:
+        """Recompute smoothed IDF weights after the corpus statistics changed"""
+        n = self.num_passages
+        self.idf = np.log((1 + n) / (1 + self.doc_freq)) + 1.0
+        self.version += 1
+
+
+class _Segment:
+    """An immutable block of passage rows plus a mutable tombstone mask"""
+    
+    def __init__(self, matrix: sparse.csr_matrix, ids: np.ndarray):
+        self.matrix = matrix
+        self.ids = ids
+        self.alive = np.ones(len(ids), dtype=bool)
+        self.norms: Optional[np.ndarray] = None
+        self.norms_version = -1
+
+
+class TfidfIndex:
+    """
+    TF-IDF index over passages that never refits a vectorizer
+    
+    The vocabulary only grows, so column ids are stable. New passages are
+    appended as raw term-count segments, deletes are tombstones, and document
+    frequencies are maintained incrementally. IDF weights are applied at query
+    time, so a search costs one question vectorization plus one sparse
+    matrix-vector product per segment. Segments are merged (and tombstoned
+    rows dropped) by compaction, which runs on a background thread.
+    """
+    
+    def __init__(
+        self,
+        max_segments: int = 8,
+        tombstone_ratio: float = 0.25,
+        background_compaction: bool = True,
+        statistics: Optional[TermStatistics] = None
+    ):
+        """
+        Initialize an empty index
+        
+        Args:
+            max_segments: Number of appended segments that triggers compaction
+            tombstone_ratio: Fraction of deleted rows that triggers compaction
+            background_compaction: Run compaction on a daemon thread instead of inline
+            statistics: Term statistics shared with other shards (None keeps private ones)
+        """
+        self.max_segments = max_segments
+        self.tombstone_ratio = tombstone_ratio
+        self.background_compaction = background_compaction
+        self.statistics = statistics or TermStatistics()
+        
+        self._compacting = False
+        self.clear()
+    
+    @property
+    def _lock(self) -> threading.RLock:
+        return self.statistics.lock
+    
+    @property
+    def vocabulary(self) -> Dict[str, int]:
+        return self.statistics.vocabulary
+    
+    def clear(self) -> None:
+        """Remove every passage and reset the vocabulary (of every shard sharing it)"""
+        with self._lock:
+            self.statistics.clear()
+            self._segments: Tuple[_Segment, ...] = ()
+            self._locations: Dict[int, Tuple[_Segment, int]] = {}
+            self._num_live = 0
+            self._num_dead = 0
+    
+    def __len__(self) -> int:
+        return self._num_live
+    
+    def __getstate__(self) -> Dict:
+        """Pickle everything except the lock (used for on-disk snapshots)"""
+        with self._lock:
+            state = dict(self.__dict__)
+        state["_compacting"] = False
+        return state
+    
+    def __setstate__(self, state: Dict) -> None:
+        if "statistics" not in state:
+            # Snapshot from before term statistics were split out
+            statistics = TermStatistics()
+            statistics.vocabulary = state.pop("vocabulary")
+            statistics.doc_freq = state.pop("_doc_freq")
+            statistics.idf = state.pop("_idf")
+            statistics.version = state.pop("_version")
+            statistics.num_passages = state["_num_live"]
+            state.pop("_lock", None)
+            state["statistics"] = statistics
+        self.__dict__.update(state)
+    
+    def dumps(self) -> bytes:
+        """Serialize a consistent snapshot of the index (restore with pickle.loads)"""
+        with self._lock:
+            return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    def add(self, ids: Sequence[int], texts: Sequence[str]) -> None:
+        """
+        Append passages to the index
+        
+        Args:
+            ids: Caller-assigned integer ids, one per passage
+            texts: Passage texts
+        """
+        if not texts:
+            return
+        
+        with self._lock:
+            stats = self.statistics
+            vocabulary = stats.vocabulary
+            indptr = [0]
+            indices: List[int] = []
+            data: List[int] = []
+            for text in texts:
+                counts = Counter(tokenize(text))
+                for term, count in counts.items():
+                    col = vocabulary.get(term)
+                    if col is None:
+                        col = len(vocabulary)
+                        vocabulary[term] = col
+                    indices.append(col)
+                    data.append(count)
+                indptr.append(len(indices))
+            
+            num_terms = len(vocabulary)
+            matrix = sparse.csr_matrix(
+                (np.asarray(data, dtype=np.float64),
+                 np.asarray(indices, dtype=np.int32),
+                 np.asarray(indptr, dtype=np.int64)),
+                shape=(len(texts), num_terms)
+            )
+            
+            if num_terms > len(stats.doc_freq):
+                stats.doc_freq = np.concatenate([
+                    stats.doc_freq,
+                    np.zeros(num_terms - len(stats.doc_freq), dtype=np.int64)
+                ])
+            np.add.at(stats.doc_freq, matrix.indices, 1)
+            
+            segment = _Segment(matrix, np.asarray(ids, dtype=np.int64))
+            self._segments = self._segments + (segment,)
+            for row, passage_id in enumerate(segment.ids):
+                self._locations[int(passage_id)] = (segment, row)
+            
+            self._num_live += len(texts)
+            stats.num_passages += len(texts)
+            stats.refresh_idf()
+            self._maybe_compact()
+    
+    def remove(self, ids: Iterable[int]) -> None:
+        """
+        Tombstone passages so they are no longer returned
+        
+        Args:
+            ids: Ids previously passed to add()
+        """
+        with self._lock:
+            removed = 0
+            for passage_id in ids:
+                location = self._locations.pop(int(passage_id), None)
+                if location is None:
+                    continue
+                segment, row = location
+                segment.alive[row] = False
+                start, end = segment.matrix.indptr[row], segment.matrix.indptr[row + 1]
+                np.subtract.at(self.statistics.doc_freq, segment.matrix.indices[start:end], 1)
+                removed += 1
+            
+            if removed:
+                self._num_live -= removed
+                self._num_dead += removed
+                self.statistics.num_passages -= removed
+                self.statistics.refresh_idf()
+                self._maybe_compact()
+    
+    def _maybe_compact(self) -> None:
+        """Schedule compaction when there are too many segments or tombstones"""
+        total = self._num_live + self._num_dead
+        too_many_segments = len(self._segments) > self.max_segments
+        too_many_dead = total > 0 and self._num_dead / total > self.tombstone_ratio
+        if not (too_many_segments or too_many_dead) or self._compacting:
+            return
+        
+        if self.background_compaction:
+            self._compacting = True
+            threading.Thread(target=self.compact, daemon=True).start()
+        else:
+            self.compact()
+    
+    def compact(self) -> None:
+        """
+        Merge all segments into one and drop tombstoned rows
+        
+        The merged segment is built from a snapshot of the segments without
+        holding the lock, which shards share, so searches on every shard go
+        on meanwhile. It is swapped in under the lock: rows deleted since the
+        snapshot are tombstoned in it, segments appended since are kept after
+        it, and a clear() since discards it.
+        """
+        try:
+            with self._lock:
+                segments = self._segments
+                if not segments:
+                    return
+                num_terms = len(self.vocabulary)
+                keep = [segment.alive.copy() for segment in segments]
+            
+            blocks = []
+            ids = []
+            for segment, alive in zip(segments, keep):
+                m = segment.matrix
+                widened = sparse.csr_matrix(
+                    (m.data, m.indices, m.indptr), shape=(m.shape[0], num_terms)
+                )
+                blocks.append(widened[alive])
+                ids.append(segment.ids[alive])
+            merged = _Segment(
+                sparse.vstack(blocks, format='csr'),
+                np.concatenate(ids)
+            )
+            locations = {
+                int(passage_id): (merged, row)
+                for row, passage_id in enumerate(merged.ids)
+            }
+            
+            with self._lock:
+                if self._segments[:len(segments)] != segments:
+                    return
+                merged.alive = np.concatenate([
+                    segment.alive[alive] for segment, alive in zip(segments, keep)
+                ])
+                for passage_id in merged.ids[~merged.alive]:
+                    del locations[int(passage_id)]
+                appended = self._segments[len(segments):]
+                for segment in appended:
+                    for row in np.flatnonzero(segment.alive):
+                        locations[int(segment.ids[row])] = (segment, int(row))
+                
+                self._segments = ((merged,) if len(merged.ids) else ()) + appended
+                self._locations = locations
+                self._num_dead = sum(int((~segment.alive).sum()) for segment in self._segments)
+        finally:
+            self._compacting = False
+    
+    def _query_terms(self, query: str) -> Tuple[List[int], List[float], float]:
+        """Columns and IDF-weighted values of a query's terms, plus the query norm (caller holds the lock)"""
+        stats = self.statistics
+        idf = stats.idf
+        cols = []
+        values = []
+        norm_sq = 0.0
+        unseen_idf = np.log(1 + stats.num_passages) + 1.0
+        for term, count in Counter(tokenize(query)).items():
+            col = stats.vocabulary.get(term)
+            if col is None:
+                # Terms outside the corpus match nothing but still count towards the norm
+                norm_sq += (count * unseen_idf) ** 2
+                continue
+            weight = count * idf[col]
+            cols.append(col)
+            values.append(weight * idf[col])
+            norm_sq += weight ** 2
+        return cols, values, float(np.sqrt(norm_sq))
+    
+    def _query_vector(self, query: str) -> Tuple[np.ndarray, float, np.ndarray, int, Tuple[_Segment, ...]]:
+        """Build the IDF-weighted query vector and snapshot the segments under the lock"""
+        with self._lock:
+            idf = self.statistics.idf
+            cols, values, norm = self._query_terms(query)
+            query_vec = np.zeros(len(idf), dtype=np.float64)
+            query_vec[cols] = values
+            return query_vec, norm, idf, self.statistics.version, self._segments
+    
+    def _query_matrix(self, queries: Sequence[str]) -> Tuple[sparse.csr_matrix, np.ndarray, np.ndarray, int, Tuple[_Segment, ...]]:
+        """Stack the IDF-weighted query vectors into a sparse (queries x terms) matrix"""
+        with self._lock:
+            idf = self.statistics.idf
+            indptr = [0]
+            indices = []
+            data = []
+            norms = np.zeros(len(queries), dtype=np.float64)
+            for i, query in enumerate(queries):
+                cols, values, norms[i] = self._query_terms(query)
+                indices.extend(cols)
+                data.extend(values)
+                indptr.append(len(indices))
+            matrix = sparse.csr_matrix(
+                (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), indptr),
+                shape=(len(queries), len(idf))
+            )
+            return matrix, norms, idf, self.statistics.version, self._segments
+    
+    def _segment_norms(self, segment: _Segment, idf: np.ndarray, version: int) -> np.ndarray:
+        """L2 norms of the IDF-weighted rows, cached until the IDF changes"""
+        with self._lock:
+            if segment.norms_version == version:
+                return segment.norms
+        m = segment.matrix
+        norms = np.sqrt(m.multiply(m) @ idf[:m.shape[1]] ** 2)
+        # The norms and their version are replaced together, so another search
+        # never pairs this IDF version with norms computed for a different one
+        with self._lock:
+            segment.norms = norms
+            segment.norms_version = version
+        return norms
+    
+    def _scoped_rows(self, id_ranges: Sequence[range]) -> List[Tuple[_Segment, np.ndarray]]:
+        """Rows of the live passages whose ids fall in the ranges, grouped by segment"""
+        by_segment: Dict[int, Tuple[_Segment, List[int]]] = {}
+        with self._lock:
+            for id_range in id_ranges:
+                for passage_id in id_range:
+                    location = self._locations.get(passage_id)
+                    if location is None:
+                        continue
+                    segment, row = location
+                    by_segment.setdefault(id(segment), (segment, []))[1].append(row)
+        return [(segment, np.asarray(rows, dtype=np.int64)) for segment, rows in by_segment.values()]
+    
+    def _blocks(self, segments: Tuple[_Segment, ...], id_ranges: Optional[Sequence[range]]) -> List[Tuple[_Segment, Optional[np.ndarray]]]:
+        """Segments to score, each with its scoped rows (None scores every row)"""
+        if id_ranges is None:
+            return [(segment, None) for segment in segments]
+        return self._scoped_rows(id_ranges)
+    
+    def _block_rows(
+        self,
+        segment: _Segment,
+        rows: Optional[np.ndarray],
+        idf: np.ndarray,
+        version: int
+    ) -> Tuple[sparse.csr_matrix, np.ndarray, np.ndarray, np.ndarray]:
+        """Matrix, tombstone mask, passage ids and row norms of a block to score"""
+        if rows is None:
+            return segment.matrix, segment.alive, segment.ids, self._segment_norms(segment, idf, version)
+        # Only the scoped rows are multiplied; their norms are computed on the spot
+        m = segment.matrix[rows]
+        norms = np.sqrt(m.multiply(m) @ idf[:m.shape[1]] ** 2)
+        return m, segment.alive[rows], segment.ids[rows], norms
+    
+    @staticmethod
+    def _top_k(scores: np.ndarray, ids: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        """Best-scoring live passages, best first"""
+        k = min(top_k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [
+            (int(ids[i]), float(scores[i]))
+            for i in top
+            if np.isfinite(scores[i])
+        ]
+    
+    def search(
+        self,
+        query: str,
+        top_k: int = 3,
+        id_ranges: Optional[Sequence[range]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Rank live passages by cosine similarity to the query
+        
+        Args:
+            query: Question text
+            top_k: Number of results to return
+            id_ranges: Only rank passages whose ids fall in these ranges
+        
+        Returns:
+            List of (passage_id, similarity_score) tuples, best first
+        """
+        if top_k <= 0:
+            return []
+        
+        with self._lock:
+            query_vec, query_norm, idf, version, segments = self._query_vector(query)
+            blocks = self._blocks(segments, id_ranges)
+        
+        scores = []
+        ids = []
+        for segment, rows in blocks:
+            m, alive, block_ids, norms = self._block_rows(segment, rows, idf, version)
+            dots = m @ query_vec[:m.shape[1]]
+            denom = norms * query_norm
+            sims = np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
+            sims[~alive] = -np.inf
+            scores.append(sims)
+            ids.append(block_ids)
+        
+        if not scores:
+            return []
+        return self._top_k(np.concatenate(scores), np.concatenate(ids), top_k)
+    
+    def search_batch(
+        self,
+        queries: Sequence[str],
+        top_k: int = 3,
+        id_ranges: Optional[Sequence[range]] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Rank live passages for several queries with one matrix product per segment
+        
+        The queries are stacked into a sparse (queries x terms) matrix, so each
+        segment is multiplied once for the whole batch (sparse matrix x
+        matrix) instead of once per query. Large batches are split so the
+        dense score matrix stays under ``_MAX_BATCH_SCORES`` entries.
+        
+        Args:
+            queries: Question texts
+            top_k: Number of results per query
+            id_ranges: Only rank passages whose ids fall in these ranges
+        
+        Returns:
+            One list of (passage_id, similarity_score) tuples per query, as
+            search() returns them
+        """
+        if top_k <= 0 or not queries:
+            return [[] for _ in queries]
+        rows_scored = max(self._num_live + self._num_dead, 1)
+        per_batch = max(_MAX_BATCH_SCORES // rows_scored, 1)
+        if len(queries) > per_batch:
+            return [
+                results
+                for start in range(0, len(queries), per_batch)
+                for results in self.search_batch(queries[start:start + per_batch], top_k, id_ranges)
+            ]
+        
+        with self._lock:
+            query_matrix, query_norms, idf, version, segments = self._query_matrix(queries)
+            blocks = self._blocks(segments, id_ranges)
+        
+        scores = []
+        ids = []
+        for segment, rows in blocks:
+            m, alive, block_ids, norms = self._block_rows(segment, rows, idf, version)
+            dots = (m @ query_matrix[:, :m.shape[1]].T).toarray()
+            denom = np.outer(norms, query_norms)
+            sims = np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
+            sims[~alive] = -np.inf
+            scores.append(sims)
+            ids.append(block_ids)
+        
+        if not scores:
+            return [[] for _ in queries]
+        # One contiguous row of scores per query
+        scores = np.ascontiguousarray(np.concatenate(scores).T)
+        ids = np.concatenate(ids)
+        return [self._top_k(scores[i], ids, top_k) for i in range(len(queries))]
+    
+    def get_statistics(self) -> Dict:
+        """Get index size and maintenance statistics"""
+        return {
+            "live_passages": self._num_live,
+            "tombstones": self._num_dead,
+            "segments": len(self._segments),
+            "vocabulary_size": len(self.vocabulary)
+        }
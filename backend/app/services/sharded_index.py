@@ -0,0 +1,321 @@
+"""
+Retrieval index split into shards that are searched in parallel
+"""
+import heapq
+import pickle
+import threading
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class _Block:
+    """Consecutive passage ids added in one call and the shard that holds them"""
+    
+    __slots__ = ("start", "stop", "shard", "live")
+    
+    def __init__(self, start: int, stop: int, shard: int):
+        self.start = start
+        self.stop = stop
+        self.shard = shard
+        self.live = stop - start
+
+
+class ShardedIndex:
+    """
+    N retrieval indexes of the same backend behind the single-index interface
+    
+    Every add() call (one chunk of one document's passages, with consecutive
+    ids) becomes a block that goes to the shard with the fewest live passages.
+    A search is scattered to the shards on a thread pool, each shard computes
+    its local top-k, and the local lists are merged with a heap. The shards
+    share their term statistics (see create_index), so scores are comparable
+    across shards and the merged top-k is the one a single index would return.
+    TF-IDF shards score in scipy/numpy kernels that release the GIL, so they
+    run on several cores at once.
+    
+    Deletes can leave the shards uneven. rebalance() moves whole live blocks
+    from the largest to the smallest shard until they are within
+    ``rebalance_tolerance`` of the mean.
+    """
+    
+    def __init__(
+        self,
+        shards: List,
+        max_workers: int = 0,
+        rebalance_tolerance: float = 0.25
+    ):
+        """
+        Initialize the sharded index
+        
+        Args:
+            shards: Empty indexes of one backend, one per shard
+            max_workers: Search threads (0 uses one per shard)
+            rebalance_tolerance: Allowed gap between the largest and the
+                smallest shard, as a fraction of the mean shard size
+        """
+        self.shards = shards
+        self.max_workers = max_workers or len(shards)
+        self.rebalance_tolerance = rebalance_tolerance
+        self._lock = threading.RLock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._reset_blocks()
+    
+    def _reset_blocks(self) -> None:
+        self._blocks: List[_Block] = []  # sorted by start id
+        self._starts: List[int] = []
+        self._live = [0] * len(self.shards)
+        self.rebalances = 0
+        self.passages_moved = 0
+    
+    def clear(self) -> None:
+        """Remove every passage from every shard"""
+        with self._lock:
+            for shard in self.shards:
+                shard.clear()
+            self._reset_blocks()
+    
+    def __len__(self) -> int:
+        return sum(self._live)
+    
+    def __getstate__(self) -> Dict:
+        """Pickle the shards and their blocks, not the lock or the thread pool"""
+        with self._lock:
+            state = dict(self.__dict__)
+        del state["_lock"]
+        state["_pool"] = None
+        return state
+    
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+    
+    def dumps(self) -> bytes:
+        """Serialize a consistent snapshot of the index (restore with pickle.loads)"""
+        with self._lock:
+            return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    def _get_pool(self) -> ThreadPoolExecutor:
+        """Search thread pool, created on first use"""
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="qa-shard"
+                    )
+        return self._pool
+    
+    def add(self, ids: Sequence[int], texts: Sequence[str]) -> None:
+        """
+        Append passages to the least loaded shard
+        
+        Args:
+            ids: Consecutive passage ids, usually above every id added so
+                far (a range reserved earlier by another worker can come later)
+            texts: Passage texts
+        """
+        if not texts:
+            return
+        with self._lock:
+            shard = min(range(len(self.shards)), key=lambda i: self._live[i])
+            self.shards[shard].add(ids, texts)
+            block = _Block(int(ids[0]), int(ids[-1]) + 1, shard)
+            position = bisect_left(self._starts, block.start)
+            self._blocks.insert(position, block)
+            self._starts.insert(position, block.start)
+            self._live[shard] += block.live
+    
+    def _find_block(self, passage_id: int) -> Optional[_Block]:
+        """Block holding a passage id, if any"""
+        position = bisect_right(self._starts, passage_id) - 1
+        if position >= 0 and passage_id < self._blocks[position].stop:
+            return self._blocks[position]
+        return None
+    
+    def remove(self, ids: Iterable[int]) -> None:
+        """
+        Tombstone passages in the shards that hold them
+        
+        Args:
+            ids: Ids previously passed to add()
+        """
+        with self._lock:
+            by_shard: Dict[int, List[int]] = {}
+            for passage_id in ids:
+                block = self._find_block(int(passage_id))
+                if block is None or block.live == 0:
+                    continue
+                by_shard.setdefault(block.shard, []).append(int(passage_id))
+                block.live -= 1
+                self._live[block.shard] -= 1
+            for shard, shard_ids in by_shard.items():
+                self.shards[shard].remove(shard_ids)
+            
+            # Forget blocks whose passages are all gone
+            if any(block.live == 0 for block in self._blocks):
+                self._blocks = [block for block in self._blocks if block.live > 0]
+                self._starts = [block.start for block in self._blocks]
+    
+    def rebalance(self, passage_texts: Callable[[range], List[str]]) -> int:
+        """
+        Move whole blocks from the largest to the smallest shard until balanced
+        
+        Only blocks whose passages are all live are moved, so their texts can
+        be re-read and indexed in the target shard as they are.
+        
+        Args:
+            passage_texts: Returns the texts of a range of live passage ids
+        
+        Returns:
+            Number of passages moved
+        """
+        moved = 0
+        with self._lock:
+            sources = set()
+            while True:
+                mean = sum(self._live) / len(self.shards)
+                largest = max(range(len(self.shards)), key=lambda i: self._live[i])
+                smallest = min(range(len(self.shards)), key=lambda i: self._live[i])
+                gap = self._live[largest] - self._live[smallest]
+                if gap <= self.rebalance_tolerance * mean:
+                    break
+                
+                # The biggest block that narrows the gap without reversing it
+                movable = [
+                    block for block in self._blocks
+                    if block.shard == largest and block.live == block.stop - block.start
+                    and block.live <= gap // 2
+                ]
+                if not movable:
+                    break
+                block = max(movable, key=lambda b: b.live)
+                
+                ids = range(block.start, block.stop)
+                self.shards[smallest].add(ids, passage_texts(ids))
+                self.shards[largest].remove(ids)
+                sources.add(largest)
+                block.shard = smallest
+                self._live[largest] -= block.live
+                self._live[smallest] += block.live
+                moved += block.live
+            
+            # Drop the moved rows' tombstones so a block can later move back cleanly
+            for shard in sources:
+                self.shards[shard].compact()
+            if moved:
+                self.rebalances += 1
+                self.passages_moved += moved
+        return moved
+    
+    def _scoped_ranges(self, id_ranges: Sequence[range]) -> Dict[int, List[range]]:
+        """Split id ranges into the parts each shard holds"""
+        by_shard: Dict[int, List[range]] = {}
+        with self._lock:
+            for id_range in id_ranges:
+                position = max(bisect_right(self._starts, id_range.start) - 1, 0)
+                stop_position = bisect_left(self._starts, id_range.stop)
+                for block in self._blocks[position:stop_position]:
+                    start = max(block.start, id_range.start)
+                    stop = min(block.stop, id_range.stop)
+                    if start < stop:
+                        by_shard.setdefault(block.shard, []).append(range(start, stop))
+        return by_shard
+    
+    def search(
+        self,
+        query: str,
+        top_k: int = 3,
+        id_ranges: Optional[Sequence[range]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Search every shard in parallel and merge their top-k lists
+        
+        Args:
+            query: Question text
+            top_k: Number of results to return
+            id_ranges: Only rank passages whose ids fall in these ranges
+        
+        Returns:
+            List of (passage_id, score) tuples, best first
+        """
+        if top_k <= 0:
+            return []
+        targets = self._targets(id_ranges)
+        if not targets:
+            return []
+        
+        if len(targets) == 1:
+            shard, ranges = targets[0]
+            return shard.search(query, top_k, ranges)
+        
+        pool = self._get_pool()
+        futures = [pool.submit(shard.search, query, top_k, ranges) for shard, ranges in targets]
+        return self._merge([future.result() for future in futures], top_k)
+    
+    def search_batch(
+        self,
+        queries: Sequence[str],
+        top_k: int = 3,
+        id_ranges: Optional[Sequence[range]] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Search every shard for all queries at once and merge per query
+        
+        Each shard runs its own search_batch (one matrix product per segment
+        for TF-IDF) on the thread pool.
+        
+        Returns:
+            One list of (passage_id, score) tuples per query, best first
+        """
+        if top_k <= 0 or not queries:
+            return [[] for _ in queries]
+        targets = self._targets(id_ranges)
+        if not targets:
+            return [[] for _ in queries]
+        
+        if len(targets) == 1:
+            shard, ranges = targets[0]
+            return shard.search_batch(queries, top_k, ranges)
+        
+        pool = self._get_pool()
+        futures = [pool.submit(shard.search_batch, queries, top_k, ranges) for shard, ranges in targets]
+        shard_results = [future.result() for future in futures]
+        return [
+            self._merge([results[i] for results in shard_results], top_k)
+            for i in range(len(queries))
+        ]
+    
+    def _targets(self, id_ranges: Optional[Sequence[range]]) -> List[Tuple[object, Optional[List[range]]]]:
+        """Shards to search, each with the id ranges it holds (None searches all of it)"""
+        if id_ranges is None:
+            return [(shard, None) for shard in self.shards]
+        return [(self.shards[i], ranges) for i, ranges in self._scoped_ranges(id_ranges).items()]
+    
+    @staticmethod
+    def _merge(local_results: List[List[Tuple[int, float]]], top_k: int) -> List[Tuple[int, float]]:
+        """Merge per-shard top-k lists into the global top-k"""
+        return heapq.nlargest(
+            top_k,
+            chain.from_iterable(local_results),
+            key=lambda result: (result[1], -result[0])
+        )
+    
+    def compact(self) -> None:
+        """Compact every shard"""
+        for shard in self.shards:
+            shard.compact()
+    
+    def get_statistics(self) -> Dict:
+        """Get per-shard sizes and rebalancing counters"""
+        with self._lock:
+            return {
+                "shards": len(self.shards),
+                "live_passages": sum(self._live),
+                "shard_passages": list(self._live),
+                "blocks": len(self._blocks),
+                "rebalances": self.rebalances,
+                "passages_moved": self.passages_moved,
+                "shard_statistics": [shard.get_statistics() for shard in self.shards]
+            }
@@ -0,0 +1,296 @@
+"""
+Memory-mapped storage for document text
+"""
+import mmap
+import os
+import threading
+from array import array
+from typing import Dict, Optional, Tuple, Union
+
+# Characters between stored char -> byte checkpoints of non-ASCII text
+CHECKPOINT_INTERVAL = 1024
+
+
+class MmapText:
+    """
+    Read-only view of one document's text inside a segment file
+    
+    Behaves like the ``str`` it replaces for what the indexer needs:
+    ``len()``, slicing (decoded on demand) and ``str()`` for the whole text.
+    ASCII text maps characters to bytes one to one. Other text keeps the byte
+    offset of every ``CHECKPOINT_INTERVAL``-th character, so a slice decodes
+    at most one interval beyond the bytes it returns.
+    """
+    
+    __slots__ = ("_segments", "byte_offset", "byte_length", "char_length", "checkpoints")
+    
+    def __init__(
+        self,
+        segments: "_Segment",
+        byte_offset: int,
+        byte_length: int,
+        char_length: int,
+        checkpoints: array
+    ):
+        self._segments = segments
+        self.byte_offset = byte_offset
+        self.byte_length = byte_length
+        self.char_length = char_length
+        self.checkpoints = checkpoints
+    
+    @property
+    def generation(self) -> int:
+        """Segment file generation the text is read from"""
+        return self._segments.generation
+    
+    @property
+    def location(self) -> Tuple[int, int, int, array]:
+        """(byte_offset, byte_length, char_length, checkpoints) for reopening the text"""
+        return self.byte_offset, self.byte_length, self.char_length, self.checkpoints
+    
+    def __len__(self) -> int:
+        return self.char_length
+    
+    def _byte_at(self, char_index: int) -> int:
+        """Byte offset (relative to the text) of a character offset"""
+        if self.byte_length == self.char_length:
+            return char_index
+        if char_index >= self.char_length:
+            return self.byte_length
+        block, skip = divmod(char_index, CHECKPOINT_INTERVAL)
+        start = self.checkpoints[block]
+        if skip == 0:
+            return start
+        end = self.checkpoints[block + 1] if block + 1 < len(self.checkpoints) else self.byte_length
+        chunk = self._segments.read(self.byte_offset + start, self.byte_offset + end).decode("utf-8")
+        return start + len(chunk[:skip].encode("utf-8"))
+    
+    def __getitem__(self, index: Union[int, slice]) -> str:
+        if isinstance(index, int):
+            if index < 0:
+                index += self.char_length
+            return self[index:index + 1]
+        start, stop, step = index.indices(self.char_length)
+        if step != 1:
+            return str(self)[index]
+        if start >= stop:
+            return ""
+        byte_start = self.byte_offset + self._byte_at(start)
+        byte_stop = self.byte_offset + self._byte_at(stop)
+        return self._segments.read(byte_start, byte_stop).decode("utf-8")
+    
+    def __str__(self) -> str:
+        return self._segments.read(self.byte_offset, self.byte_offset + self.byte_length).decode("utf-8")
+    
+    def __repr__(self) -> str:
+        return f"MmapText(bytes={self.byte_length}, chars={self.char_length})"
+
+
+class _Segment:
+    """One generation of the segment file: an open file and its memory map"""
+    
+    def __init__(self, path: str, generation: int, mode: str = "a+b"):
+        self.path = path
+        self.generation = generation
+        self._file = open(path, mode)
+        self._lock = threading.Lock()
+        self._map = None
+        self._mapped_size = 0
+    
+    def read(self, start: int, stop: int) -> bytes:
+        """Read bytes [start, stop) through the memory map, remapping if the file grew"""
+        if start >= stop:
+            return b""
+        buffer = self._map
+        if buffer is None or stop > self._mapped_size:
+            with self._lock:
+                if self._map is None or stop > self._mapped_size:
+                    size = os.fstat(self._file.fileno()).st_size
+                    # Reads already holding the old map finish on it; it is released afterwards
+                    self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+                    self._mapped_size = size
+                buffer = self._map
+        return buffer[start:stop]
+    
+    def write(self, data: bytes, sync: bool = True) -> int:
+        """Append bytes and return the offset they were written at"""
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            offset = self._file.tell()
+            self._file.write(data)
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+        return offset
+    
+    def sync(self) -> None:
+        with self._lock:
+            os.fsync(self._file.fileno())
+    
+    def size(self) -> int:
+        return os.fstat(self._file.fileno()).st_size
+    
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class TextSegmentFile:
+    """
+    Append-only file of UTF-8 document text, read through ``mmap``
+    
+    Each document's cleaned text is appended once and addressed by its byte
+    offset. Views read through one memory map of the whole file (replaced by
+    a larger one as the file grows), so text is paged in by the OS on demand
+    and every process that maps the file shares the same page cache.
+    
+    A file is never rewritten in place: other processes may have it mapped,
+    and reading a mapped page past the end of a truncated file kills the
+    process. Deleted documents leave their bytes behind until compact()
+    copies the live text into the next generation's file. Generation 0 is
+    ``path`` and generation ``n`` is ``path.n``. Views keep the generation
+    they were opened on, so they stay readable after a compaction (the old
+    file is unlinked, and the OS frees it once the last view is gone).
+    """
+    
+    def __init__(self, path: str, generation: Optional[int] = None):
+        """
+        Open (or create) a segment file
+        
+        Args:
+            path: File to append text to (generation 0)
+            generation: Generation to append to (None picks the latest one on disk)
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        if generation is None:
+            generation = self._latest_generation()
+        self._segment = _Segment(self.generation_path(generation), generation)
+        self.compactions = 0
+    
+    @property
+    def generation(self) -> int:
+        return self._segment.generation
+    
+    def _latest_generation(self) -> int:
+        directory, name = os.path.split(os.path.abspath(self.path))
+        generations = [0]
+        for entry in os.listdir(directory):
+            suffix = entry[len(name) + 1:]
+            if entry.startswith(name + ".") and suffix.isdigit():
+                generations.append(int(suffix))
+        return max(generations)
+    
+    def generation_path(self, generation: int) -> str:
+        """File holding a generation of the text"""
+        return self.path if generation == 0 else f"{self.path}.{generation}"
+    
+    def switch(self, generation: int) -> None:
+        """
+        Append to another generation from now on (after another process compacted)
+        
+        Views opened on the previous generation keep reading it.
+        """
+        with self._lock:
+            if generation != self._segment.generation:
+                self._segment = _Segment(self.generation_path(generation), generation)
+    
+    def append(self, text: str) -> MmapText:
+        """
+        Write a document's text and return a view of it
+        
+        Args:
+            text: Cleaned document text
+        
+        Returns:
+            MmapText backed by the file
+        """
+        data = text.encode("utf-8")
+        checkpoints = array('l')
+        if len(data) != len(text):
+            position = 0
+            for start in range(0, len(text), CHECKPOINT_INTERVAL):
+                checkpoints.append(position)
+                position += len(text[start:start + CHECKPOINT_INTERVAL].encode("utf-8"))
+        
+        segment = self._segment
+        offset = segment.write(data)
+        return MmapText(segment, offset, len(data), len(text), checkpoints)
+    
+    def open(
+        self,
+        byte_offset: int,
+        byte_length: int,
+        char_length: int,
+        checkpoints: array,
+        generation: Optional[int] = None
+    ) -> MmapText:
+        """
+        Get a view of text appended earlier
+        
+        Args:
+            byte_offset, byte_length, char_length, checkpoints: MmapText.location
+            generation: Generation the location refers to (None for the current one)
+        """
+        segment = self._segment
+        if generation is not None and generation != segment.generation:
+            # Text of a generation this process does not append to (yet)
+            segment = _Segment(self.generation_path(generation), generation, "rb")
+        return MmapText(segment, byte_offset, byte_length, char_length, checkpoints)
+    
+    def compact(self, locations: Dict[str, Tuple[int, int, int, array]]) -> Dict[str, MmapText]:
+        """
+        Copy live text into a new generation and append to it from now on
+        
+        The caller must keep other writers out (the corpus store's write
+        lock), record the new locations, and call remove_generations() once
+        they are committed.
+        
+        Args:
+            locations: Location in the current generation of every live text
+        
+        Returns:
+            View of every text in the new generation
+        """
+        with self._lock:
+            source = self._segment
+            target = _Segment(self.generation_path(source.generation + 1), source.generation + 1, "w+b")
+            views = {}
+            # Copy in file order so the old file is read sequentially
+            for key, (byte_offset, byte_length, char_length, checkpoints) in sorted(
+                locations.items(), key=lambda item: item[1][0]
+            ):
+                offset = target.write(source.read(byte_offset, byte_offset + byte_length), sync=False)
+                views[key] = MmapText(target, offset, byte_length, char_length, checkpoints)
+            target.sync()
+            self._segment = target
+            self.compactions += 1
+        return views
+    
+    def remove_generations(self) -> None:
+        """Unlink the files of every generation before the current one"""
+        for generation in range(self.generation):
+            try:
+                os.remove(self.generation_path(generation))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error removing text segment file generation {generation}: {str(e)}")
+    
+    def file_bytes(self) -> int:
+        """Size of the current generation's file"""
+        return self._segment.size()
+    
+    def get_statistics(self) -> Dict:
+        """Get the segment file size"""
+        return {
+            "path": self.generation_path(self.generation),
+            "generation": self.generation,
+            "file_bytes": self.file_bytes(),
+            "compactions": self.compactions
+        }
+    
+    def close(self) -> None:
+        """Close the file (views keep their maps until they are released)"""
+        self._segment.close()
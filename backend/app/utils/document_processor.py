@@ -2,11 +2,14 @@
 Document processing utilities for handling PDF, DOCX, and TXT files
 """
 import os
+from concurrent.futures import Executor, as_completed
 from pathlib import Path
-from typing import Tuple, List
+from typing import Callable, List, Optional, Tuple
 import PyPDF2
 from docx import Document as DocxDocument
 import re
+from app.utils.passages import PassageSpans
+from app.utils.sentence_segmenter import SentenceSegmenter
 
 
 class DocumentProcessor:
@@ -20,18 +23,129 @@ class DocumentProcessor:
         return Path(filename).suffix.lower() in DocumentProcessor.ALLOWED_EXTENSIONS
     
     @staticmethod
-    def extract_text_from_pdf(file_path: str) -> str:
-        """Extract text from PDF file"""
-        text = ""
+    def extract_text_from_pdf(
+        file_path: str,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> str:
+        """
+        Extract text from PDF file
+        
+        Args:
+            file_path: Path to the PDF
+            progress: Optional callback receiving (pages_done, pages_total)
+        """
+        pages = []
         try:
             with open(file_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    text += page.extract_text()
+                num_pages = len(pdf_reader.pages)
+                for page_num in range(num_pages):
+                    pages.append(pdf_reader.pages[page_num].extract_text())
+                    if progress:
+                        progress(page_num + 1, num_pages)
+        except Exception as e:
+            raise ValueError(f"Error reading PDF file: {str(e)}")
+        return "".join(pages)
+    
+    @staticmethod
+    def count_pdf_pages(file_path: str) -> int:
+        """Get the number of pages in a PDF file"""
+        try:
+            with open(file_path, 'rb') as file:
+                return len(PyPDF2.PdfReader(file).pages)
         except Exception as e:
             raise ValueError(f"Error reading PDF file: {str(e)}")
-        return text
+    
+    @staticmethod
+    def extract_pdf_page_range(file_path: str, start: int, end: int) -> List[str]:
+        """
+        Extract and clean the text of pages [start, end) of a PDF file
+        
+        Runs inside process pool workers, so it only takes picklable arguments.
+        """
+        try:
+            with open(file_path, 'rb') as file:
+                pdf_reader = PyPDF2.PdfReader(file)
+                return [
+                    DocumentProcessor.clean_text(pdf_reader.pages[page_num].extract_text())
+                    for page_num in range(start, end)
+                ]
+        except Exception as e:
+            raise ValueError(f"Error reading PDF file: {str(e)}")
+    
+    @staticmethod
+    def extract_text_with_pages(
+        file_path: str,
+        progress: Optional[Callable[[int, int], None]] = None,
+        executor: Optional[Executor] = None,
+        pages_per_task: int = 16
+    ) -> Tuple[str, List[int]]:
+        """
+        Extract cleaned text together with the character offset of each page
+        
+        PDF page ranges are spread over ``executor`` (a process pool) and
+        stitched back together in page order. Pages are cleaned separately and
+        joined with a single space, so the offsets stay exact in the cleaned
+        text. DOCX and TXT files are a single page.
+        
+        Args:
+            file_path: Path to the document
+            progress: Optional callback receiving (pages_done, pages_total)
+            executor: Pool to run extraction in; None extracts in the calling thread
+            pages_per_task: PDF pages handled by one pool task
+        
+        Returns:
+            Tuple of (cleaned_text, page_start_offsets)
+        """
+        if Path(file_path).suffix.lower() != '.pdf':
+            if executor is None:
+                text = DocumentProcessor.extract_text(file_path)
+            else:
+                text = executor.submit(DocumentProcessor.extract_text, file_path).result()
+            if progress:
+                progress(1, 1)
+            return DocumentProcessor.clean_text(text), [0]
+        
+        num_pages = DocumentProcessor.count_pdf_pages(file_path)
+        ranges = [
+            (start, min(start + pages_per_task, num_pages))
+            for start in range(0, num_pages, pages_per_task)
+        ]
+        
+        page_texts: List[Optional[List[str]]] = [None] * len(ranges)
+        pages_done = 0
+        if executor is None:
+            for i, (start, end) in enumerate(ranges):
+                page_texts[i] = DocumentProcessor.extract_pdf_page_range(file_path, start, end)
+                pages_done += end - start
+                if progress:
+                    progress(pages_done, num_pages)
+        else:
+            futures = {
+                executor.submit(DocumentProcessor.extract_pdf_page_range, file_path, start, end): i
+                for i, (start, end) in enumerate(ranges)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                page_texts[i] = future.result()
+                pages_done += ranges[i][1] - ranges[i][0]
+                if progress:
+                    progress(pages_done, num_pages)
+        
+        # Stitch pages in order, recording where each one starts
+        parts = []
+        page_starts = []
+        offset = 0
+        for chunk in page_texts:
+            for page_text in chunk:
+                if parts and page_text:
+                    parts.append(" ")
+                    offset += 1
+                page_starts.append(offset)
+                parts.append(page_text)
+                offset += len(page_text)
+        
+        return "".join(parts), page_starts
     
     @staticmethod
     def extract_text_from_docx(file_path: str) -> str:
@@ -65,18 +179,32 @@ class DocumentProcessor:
         return text
     
     @staticmethod
-    def extract_text(file_path: str) -> str:
-        """Extract text from document based on file type"""
+    def extract_text(
+        file_path: str,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> str:
+        """
+        Extract text from document based on file type
+        
+        Args:
+            file_path: Path to the document
+            progress: Optional callback receiving (pages_done, pages_total);
+                DOCX and TXT files count as a single page
+        """
         file_ext = Path(file_path).suffix.lower()
         
         if file_ext == '.pdf':
-            return DocumentProcessor.extract_text_from_pdf(file_path)
+            return DocumentProcessor.extract_text_from_pdf(file_path, progress)
         elif file_ext == '.docx':
-            return DocumentProcessor.extract_text_from_docx(file_path)
+            text = DocumentProcessor.extract_text_from_docx(file_path)
         elif file_ext == '.txt':
-            return DocumentProcessor.extract_text_from_txt(file_path)
+            text = DocumentProcessor.extract_text_from_txt(file_path)
         else:
             raise ValueError(f"Unsupported file format: {file_ext}")
+        
+        if progress:
+            progress(1, 1)
+        return text
     
     @staticmethod
     def clean_text(text: str) -> str:
@@ -91,22 +219,15 @@ class DocumentProcessor:
     def split_into_sentences(text: str) -> List[str]:
         """Split text into sentences"""
         # Simple sentence splitting based on common delimiters
-        sentences = re.split(r'(?<=[.!?])\s+', text)
-        # Filter out empty sentences
-        sentences = [s.strip() for s in sentences if s.strip()]
-        return sentences
+        return SentenceSegmenter.segment(text).sentences(text)
     
     @staticmethod
-    def split_into_passages(text: str, window_size: int = 3) -> List[Tuple[str, int, int]]:
-        """Split text into passages (sentence windows) with position tracking"""
-        sentences = DocumentProcessor.split_into_sentences(text)
-        passages = []
-        
-        for i in range(len(sentences) - window_size + 1):
-            passage = " ".join(sentences[i:i + window_size])
-            # Calculate approximate start and end positions
-            start_pos = sum(len(s) + 1 for s in sentences[:i])
-            end_pos = start_pos + len(passage)
-            passages.append((passage, start_pos, end_pos))
+    def split_into_passages(text: str, window_size: int = 3) -> PassageSpans:
+        """
+        Split text into passages (sentence windows) with position tracking
         
-        return passages
+        The passages are stored as sentence offsets into ``text`` and behave
+        like a list of (passage_text, start_pos, end_pos) tuples. Sentences,
+        their count and the passages all come from one segmentation pass.
+        """
+        return SentenceSegmenter.segment(text).passages(text, window_size)
@@ -0,0 +1,83 @@
+"""
+Compact passage storage as character offsets into a document's text
+"""
+from array import array
+from collections import abc
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+
+class PassageSpans(abc.Sequence):
+    """
+    Sliding sentence-window passages stored as offsets into a single text
+    
+    Only the start and end offset of every sentence are kept, in two int
+    arrays. Passage ``i`` covers sentences ``i`` to ``i + window_size - 1`` and
+    its string is sliced out of the text when it is asked for, so the
+    overlapping windows never hold copies of the same sentence.
+    
+    Indexing and iteration yield (passage_text, start_pos, end_pos) tuples,
+    the same shape DocumentProcessor.split_into_passages always returned.
+    """
+    
+    def __init__(
+        self,
+        text: str,
+        sentence_starts: Sequence[int],
+        sentence_ends: Sequence[int],
+        window_size: int = 3
+    ):
+        """
+        Initialize the passage view
+        
+        Args:
+            text: Text the offsets point into
+            sentence_starts: Offset of the first character of each sentence
+            sentence_ends: Offset just past the last character of each sentence
+            window_size: Sentences per passage
+        """
+        self.text = text
+        self.sentence_starts = array('l', sentence_starts)
+        self.sentence_ends = array('l', sentence_ends)
+        self.window_size = window_size
+        self._count = max(len(self.sentence_starts) - window_size + 1, 0)
+    
+    @property
+    def num_sentences(self) -> int:
+        return len(self.sentence_starts)
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def span(self, index: int) -> Tuple[int, int]:
+        """Get the (start_pos, end_pos) of a passage without building its text"""
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("passage index out of range")
+        return self.sentence_starts[index], self.sentence_ends[index + self.window_size - 1]
+    
+    def passage_text(self, index: int) -> str:
+        """Get the text of a passage"""
+        start, end = self.span(index)
+        return self.text[start:end]
+    
+    def texts(self, start: int = 0, end: Optional[int] = None) -> List[str]:
+        """Get the texts of passages [start, end)"""
+        return [self.passage_text(i) for i in range(*slice(start, end).indices(self._count))]
+    
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        start, end = self.span(index)
+        return self.text[start:end], start, end
+    
+    def __iter__(self) -> Iterator[Tuple[str, int, int]]:
+        for i in range(self._count):
+            yield self[i]
+    
+    def nbytes(self) -> int:
+        """Bytes used by the offset arrays (the text itself is shared)"""
+        return (
+            self.sentence_starts.itemsize * len(self.sentence_starts)
+            + self.sentence_ends.itemsize * len(self.sentence_ends)
+        )
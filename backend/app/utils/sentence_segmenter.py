@@ -0,0 +1,122 @@
+"""
+Single-pass sentence segmentation with exact character offsets
+"""
+import re
+from array import array
+from typing import List
+
+from app.utils.passages import PassageSpans
+
+# Sentence boundary: whitespace following terminal punctuation
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+
+class SentenceSegmenter:
+    """
+    Splits text into sentences in one left-to-right pass
+    
+    Text can be fed in chunks. Each completed sentence is recorded as the
+    offsets of its first and one-past-last character in the concatenated
+    input, with surrounding whitespace excluded. Only the unfinished tail
+    sentence is kept between chunks. The split matches
+    DocumentProcessor.split_into_sentences exactly.
+    """
+    
+    def __init__(self):
+        """Initialize an empty segmenter"""
+        self.sentence_starts = array('l')
+        self.sentence_ends = array('l')
+        self._pending = ""          # Text after the last boundary seen
+        self._pending_offset = 0    # Offset of _pending in the full input
+        self._scan_from = 0         # Position in _pending to resume boundary search
+        self._finished = False
+    
+    @classmethod
+    def segment(cls, text: str) -> "SentenceSegmenter":
+        """Segment a complete text"""
+        segmenter = cls()
+        segmenter.feed(text)
+        segmenter.finish()
+        return segmenter
+    
+    @property
+    def num_sentences(self) -> int:
+        return len(self.sentence_starts)
+    
+    def feed(self, chunk: str) -> List[str]:
+        """
+        Add the next chunk of text
+        
+        Args:
+            chunk: Text continuing the input so far
+        
+        Returns:
+            Sentences completed by this chunk
+        """
+        if self._finished:
+            raise ValueError("Segmenter already finished")
+        self._pending += chunk
+        return self._consume(final=False)
+    
+    def finish(self) -> List[str]:
+        """
+        Mark the end of the input
+        
+        Returns:
+            The last sentence, if the input did not end on a boundary
+        """
+        if self._finished:
+            return []
+        self._finished = True
+        return self._consume(final=True)
+    
+    def _consume(self, final: bool) -> List[str]:
+        """Emit every sentence whose end is known"""
+        pending = self._pending
+        sentences = []
+        position = 0
+        for boundary in SENTENCE_BOUNDARY.finditer(pending, self._scan_from):
+            if not final and boundary.end() == len(pending):
+                # The whitespace run may continue in the next chunk
+                break
+            self._emit(pending, position, boundary.start(), sentences)
+            position = boundary.end()
+        
+        if final:
+            self._emit(pending, position, len(pending), sentences)
+            position = len(pending)
+        
+        self._pending = pending[position:]
+        self._pending_offset += position
+        # Resume where trailing whitespace starts, one character early for the lookbehind
+        tail = self._pending
+        self._scan_from = max(len(tail.rstrip()) - 1, 0) if tail else 0
+        return sentences
+    
+    def _emit(self, pending: str, start: int, end: int, sentences: List[str]) -> None:
+        """Record pending[start:end] as a sentence unless it is blank"""
+        raw = pending[start:end]
+        sentence = raw.strip()
+        if not sentence:
+            return
+        begin = self._pending_offset + start + len(raw) - len(raw.lstrip())
+        self.sentence_starts.append(begin)
+        self.sentence_ends.append(begin + len(sentence))
+        sentences.append(sentence)
+    
+    def sentences(self, text: str) -> List[str]:
+        """Get the sentence strings from the text that was fed in"""
+        return [text[start:end] for start, end in zip(self.sentence_starts, self.sentence_ends)]
+    
+    def passages(self, text: str, window_size: int = 3) -> PassageSpans:
+        """
+        Build sliding-window passages over the segmented sentences
+        
+        Args:
+            text: The full text that was fed in
+            window_size: Sentences per passage
+        
+        Returns:
+            PassageSpans sharing ``text``
+        """
+        return PassageSpans(text, self.sentence_starts, self.sentence_ends, window_size)
@@ -0,0 +1,157 @@
+"""
+Token-aware passage chunking with the reader model's tokenizer
+"""
+import threading
+from array import array
+
+import numpy as np
+
+from app.utils.passages import PassageSpans
+
+# Characters tokenized per call; blocks are cut at a space so no word is split
+_BLOCK_CHARS = 100_000
+
+
+class TokenChunker:
+    """
+    Splits text into passages that fill the reader's token budget
+    
+    The text is tokenized once with the reader's tokenizer. Passages are
+    consecutive runs of ``max_tokens`` tokens; each one starts
+    ``max_tokens - overlap_tokens`` tokens after the previous one (the
+    stride), so an answer near a chunk edge also appears whole in the next
+    chunk. Chunk edges are moved back to the nearest word start, so no word
+    is split between chunks and every character of the text is covered.
+    
+    The token budget defaults to what is left of the reader's
+    ``max_seq_length`` after the special tokens and ``question_tokens`` for
+    the question. Questions longer than that still work; the reader then cuts
+    off the end of the passage as it always has.
+    
+    Passages come back as PassageSpans with one span per chunk
+    (``window_size`` 1), so passage ids, the corpus store and the text stores
+    handle them like sentence windows.
+    """
+    
+    def __init__(
+        self,
+        model_name: str,
+        max_seq_length: int = 384,
+        question_tokens: int = 64,
+        overlap_tokens: int = 64,
+        max_tokens: int = 0
+    ):
+        """
+        Initialize the chunker (the tokenizer is loaded on first use)
+        
+        Args:
+            model_name: HuggingFace model whose tokenizer counts tokens
+            max_seq_length: Reader token budget for question + passage
+            question_tokens: Tokens reserved for the question
+            overlap_tokens: Tokens shared by consecutive chunks
+            max_tokens: Tokens per chunk (0 derives it from the budget above)
+        """
+        self.model_name = model_name
+        self.max_seq_length = max_seq_length
+        self.question_tokens = question_tokens
+        self.overlap_tokens = overlap_tokens
+        self._max_tokens = max_tokens
+        self._tokenizer = None
+        self._lock = threading.Lock()
+    
+    @property
+    def tokenizer(self):
+        """The model's (fast) tokenizer, loaded once"""
+        if self._tokenizer is None:
+            with self._lock:
+                if self._tokenizer is None:
+                    from transformers import AutoTokenizer
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.model_name, use_fast=True)
+        return self._tokenizer
+    
+    @property
+    def max_tokens(self) -> int:
+        """Passage tokens per chunk"""
+        if self._max_tokens <= 0:
+            special = self.tokenizer.num_special_tokens_to_add(pair=True)
+            self._max_tokens = max(self.max_seq_length - self.question_tokens - special, 1)
+        return self._max_tokens
+    
+    @property
+    def stride(self) -> int:
+        """Tokens between the starts of consecutive chunks"""
+        return max(self.max_tokens - self.overlap_tokens, 1)
+    
+    def _tokenize(self, text: str):
+        """
+        Token character offsets and word-start flags for the whole text
+        
+        A token starts a word if whitespace separates it from the previous
+        token, so punctuation attached to a word stays in the word's chunk.
+        
+        Returns:
+            Tuple of (token starts, token ends, word-start flag per token)
+        """
+        tokenizer = self.tokenizer.backend_tokenizer
+        starts, ends = [], []
+        
+        position = 0
+        while position < len(text):
+            stop = min(position + _BLOCK_CHARS, len(text))
+            if stop < len(text):
+                cut = text.rfind(" ", position + 1, stop)
+                if cut > position:
+                    stop = cut
+            
+            # The Rust tokenizer is not safe to call from several threads at once
+            with self._lock:
+                encoding = tokenizer.encode(text[position:stop], add_special_tokens=False)
+            offsets = np.array(encoding.offsets, dtype=np.int64).reshape(-1, 2) + position
+            starts.append(offsets[:, 0])
+            ends.append(offsets[:, 1])
+            position = stop
+        
+        starts = np.concatenate(starts) if starts else np.zeros(0, dtype=np.int64)
+        ends = np.concatenate(ends) if ends else np.zeros(0, dtype=np.int64)
+        # A gap after the previous token (whitespace) means a new word starts
+        word_starts = np.ones(len(starts), dtype=bool)
+        word_starts[1:] = starts[1:] > ends[:-1]
+        return starts, ends, word_starts
+    
+    def chunk(self, text: str) -> PassageSpans:
+        """
+        Split text into token-budget passages
+        
+        Args:
+            text: Cleaned document text
+        
+        Returns:
+            PassageSpans with one span per chunk
+        """
+        starts, ends, word_starts = self._tokenize(text)
+        chunk_starts = array('l')
+        chunk_ends = array('l')
+        
+        num_tokens = len(starts)
+        first = 0
+        while first < num_tokens:
+            stop = min(first + self.max_tokens, num_tokens)
+            if stop < num_tokens:
+                # End before the word that would be cut in two
+                edge = stop
+                while edge > first + 1 and not word_starts[edge]:
+                    edge -= 1
+                if word_starts[edge]:
+                    stop = edge
+            chunk_starts.append(int(starts[first]))
+            chunk_ends.append(int(ends[stop - 1]))
+            if stop == num_tokens:
+                break
+            
+            # Next chunk starts one stride later, at a word start, always moving forward
+            following = max(min(first + self.stride, stop), first + 1)
+            while following > first + 1 and not word_starts[following]:
+                following -= 1
+            first = following
+        
+        return PassageSpans(text, chunk_starts, chunk_ends, window_size=1)
@@ -0,0 +1,149 @@
+"""
+Streaming storage of uploaded files
+"""
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Sequence, Tuple
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured size limit"""
+
+
+async def save_upload(
+    file: UploadFile,
+    upload_dir: str,
+    max_bytes: int,
+    chunk_size: int = 1024 * 1024
+) -> Tuple[str, int, str]:
+    """
+    Stream an upload to a unique temporary file in fixed-size chunks
+    
+    The file is hashed and size-checked while it streams, so only one chunk
+    is held in memory at a time and oversized uploads stop at the first chunk
+    past the limit. Hashing and writing run in the thread pool so the event
+    loop keeps serving other requests. The temporary file keeps the original
+    extension so DocumentProcessor can pick a parser.
+    
+    The form (and so the file) has been received in full by the time the
+    route runs; UploadSizeLimit caps the request body while it arrives.
+    
+    Args:
+        file: Uploaded file
+        upload_dir: Directory for the temporary file
+        max_bytes: Largest accepted upload
+        chunk_size: Bytes read per chunk
+    
+    Returns:
+        Tuple of (file_path, size_in_bytes, sha256_hex)
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    suffix = Path(file.filename or "").suffix.lower()
+    fd, file_path = tempfile.mkstemp(dir=upload_dir, suffix=suffix)
+    
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"File exceeds the {max_bytes} byte upload limit")
+                await run_in_threadpool(_append, out, digest, chunk)
+    except BaseException:
+        os.remove(file_path)
+        raise
+    
+    return file_path, size, digest.hexdigest()
+
+
+def _append(out, digest, chunk: bytes) -> None:
+    """Hash a chunk and write it to the temporary file"""
+    digest.update(chunk)
+    out.write(chunk)
+
+
+class UploadSizeLimit:
+    """
+    ASGI middleware that rejects oversized request bodies on upload paths
+    
+    FastAPI parses a multipart form, spooling the file to disk, before the
+    route runs. This middleware answers 413 as soon as the Content-Length
+    header, or the body received so far for requests without one (chunked
+    transfer encoding), exceeds ``max_bytes``. The application then sees a
+    client disconnect, and anything it sends afterwards is dropped.
+    """
+    
+    def __init__(self, app: ASGIApp, paths: Sequence[str], max_bytes: int):
+        """
+        Initialize the middleware
+        
+        Args:
+            app: Wrapped ASGI application
+            paths: Request paths the limit applies to
+            max_bytes: Largest accepted request body, form overhead included
+        """
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(send)
+            return
+        
+        received = 0
+        rejected = False
+        response_started = False
+        
+        async def limited_receive() -> Message:
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    rejected = True
+                    if not response_started:
+                        await self._reject(send)
+                    return {"type": "http.disconnect"}
+            return message
+        
+        async def guarded_send(message: Message) -> None:
+            nonlocal response_started
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+        
+        await self.app(scope, limited_receive, guarded_send)
+    
+    async def _reject(self, send: Send) -> None:
+        body = json.dumps({"detail": f"Request body exceeds the {self.max_bytes} byte upload limit"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close")
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Parity and latency check of the ONNX reader backends against PyTorch
+
+Usage:
+    python compare_readers.py [--model NAME] [--text FILE] [--runs N]
+
+Runs the same (question, passage) pairs through the pytorch, onnx and
+onnx-int8 backends of QAEngine and prints, per backend, how many answers
+match the PyTorch answer exactly, the largest logit and score differences,
+and the median time per batched forward pass.
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from app import config
+from app.services.qa_engine import QAEngine
+from app.utils.document_processor import DocumentProcessor
+
+SAMPLE_TEXT = (
+    "The Amazon rainforest covers much of the Amazon basin of South America. "
+    "The basin spans about seven million square kilometres, of which five and a half "
+    "million are covered by the rainforest. The majority of the forest lies within Brazil, "
+    "with 60 percent of the rainforest, followed by Peru with 13 percent and Colombia "
+    "with 10 percent. The rainforest likely formed during the Eocene era. "
+    "Deforestation is the conversion of forested areas to non-forested areas. "
+    "The main sources of deforestation in the Amazon are human settlement and "
+    "development of the land. Cattle ranching accounts for most of the cleared land. "
+    "Scientists estimate that the forest holds around 390 billion individual trees "
+    "divided into 16,000 species."
+)
+
+SAMPLE_QUESTIONS = [
+    "Which country holds most of the rainforest?",
+    "How large is the Amazon basin?",
+    "When did the rainforest form?",
+    "What is the main cause of cleared land?",
+    "How many tree species are there?",
+    "What is deforestation?"
+]
+
+
+def time_forward(engine: QAEngine, sequences, runs: int) -> float:
+    """Median seconds for one forward pass over the sequences"""
+    engine._forward(sequences)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        engine._forward(sequences)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    """Compare reader backends"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--model", default=config.MODEL_NAME, help="Reader model")
+    parser.add_argument("--onnx-dir", default=config.ONNX_DIR, help="Directory for exported graphs")
+    parser.add_argument("--text", help="Text file to ask the sample questions about")
+    parser.add_argument("--runs", type=int, default=20, help="Timed forward passes per backend")
+    args = parser.parse_args()
+    
+    text = SAMPLE_TEXT
+    if args.text:
+        with open(args.text, encoding="utf-8") as f:
+            text = DocumentProcessor.clean_text(f.read())
+    passages = DocumentProcessor.split_into_passages(text, window_size=3)
+    pairs = [(question, passage[0]) for question in SAMPLE_QUESTIONS for passage in passages]
+    
+    engines = {}
+    for backend in ("pytorch", "onnx", "onnx-int8"):
+        engine = QAEngine(
+            model_name=args.model,
+            backend=backend,
+            onnx_dir=args.onnx_dir,
+            load_model=False
+        )
+        engine.load(warmup=False)
+        if engine.backend != backend:
+            print(f"{backend}: not available, skipped")
+            continue
+        engines[backend] = engine
+    
+    reference = engines["pytorch"]
+    sequences = [reference._encode_pair(question, context)[0] for question, context in pairs]
+    batch = sequences[:reference.batch_size]
+    reference_answers = reference.answer_batch(pairs)
+    reference_logits = reference._forward(batch)
+    
+    print("=" * 60)
+    print(f"Model: {args.model}")
+    print(f"Pairs: {len(pairs)}, timed batch: {len(batch)} sequences, runs: {args.runs}")
+    print("-" * 60)
+    print(f"{'backend':<10} {'same answer':>12} {'max |dlogit|':>13} {'max |dscore|':>13} {'ms/batch':>9} {'speedup':>8}")
+    
+    baseline = None
+    for backend, engine in engines.items():
+        answers = engine.answer_batch(pairs)
+        logits = engine._forward(batch)
+        same = sum(a["answer"] == b["answer"] for a, b in zip(answers, reference_answers))
+        logit_diff = max(float(np.abs(x - y).max()) for x, y in zip(logits, reference_logits))
+        score_diff = max(abs(a["score"] - b["score"]) for a, b in zip(answers, reference_answers))
+        seconds = time_forward(engine, batch, args.runs)
+        baseline = baseline or seconds
+        print(
+            f"{backend:<10} {same:>5}/{len(pairs):<6} {logit_diff:>13.4f} {score_diff:>13.4f}"
+            f" {seconds * 1000:>9.1f} {baseline / seconds:>7.2f}x"
+        )
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Shared test setup
+
+Configuration is read from the environment when app.config is imported, so
+it is set here first: no durable store, and the reader model from
+QA_TEST_MODEL (tests that need a model are skipped if it cannot be loaded).
+"""
+import os
+import threading
+
+os.environ["QA_CORPUS_STORE"] = ""
+os.environ.setdefault("QA_TEXT_STORE", "memory")
+if os.getenv("QA_TEST_MODEL"):
+    os.environ["QA_MODEL_NAME"] = os.environ["QA_TEST_MODEL"]
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def client():
+    """API client with the QA model loaded"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.routes import qa
+    
+    with TestClient(app) as test_client:
+        if not qa.qa_engine.wait_until_ready(300):
+            pytest.skip(f"QA model {qa.qa_engine.model_name} could not be loaded: {qa.qa_engine.load_error}")
+        yield test_client
+
+
+class StubReader:
+    """
+    Stands in for the QA engine behind the scheduler
+    
+    Every passage is answered with its first word and the question, and the
+    pairs read are recorded. Clearing ``release`` holds reader batches until
+    it is set again.
+    """
+    
+    def __init__(self, indexer):
+        self.indexer = indexer
+        self.pairs = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+    
+    def cached_answer(self, question, context, passage_id=None):
+        return None
+    
+    def answer_batch(self, pairs, passage_ids=None, lookup_cache=True):
+        self.started.set()
+        self.release.wait(10)
+        self.pairs.extend(pairs)
+        return [
+            {"answer": f"{context.split()[0]} ({question})", "score": 0.9, "start": 0, "end": 0}
+            for question, context in pairs
+        ]
+
+
+@pytest.fixture
+def stub_reader(monkeypatch):
+    """QA routes over a fresh in-memory indexer, answered by a StubReader instead of the model"""
+    from app.routes import qa
+    from app.services.cache import AnswerCache
+    from app.services.document_indexer import DocumentIndexer
+    from app.services.inference_scheduler import InferenceScheduler
+    
+    reader = StubReader(DocumentIndexer())
+    monkeypatch.setattr(qa, "get_indexer", lambda: reader.indexer)
+    monkeypatch.setattr(qa, "require_model", lambda: None)
+    monkeypatch.setattr(qa, "answer_cache", AnswerCache())
+    monkeypatch.setattr(qa, "scheduler", InferenceScheduler(reader, max_wait_ms=1))
+    return reader
@@ -0,0 +1,57 @@
+"""
+/api/qa/ask-batch answers each distinct question once, in request order and within its scope
+"""
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+ALPHA = "Alpha rivers run north. Alpha mountains are tall. Alpha towns are small. Alpha roads are long."
+BETA = "Beta rivers run south. Beta mountains are low. Beta towns are large. Beta roads are short."
+
+
+def ask_batch(questions, **options):
+    response = TestClient(app).post("/api/qa/ask-batch", json={"questions": questions, **options})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_repeated_questions_are_read_once_and_answered_in_order(stub_reader):
+    stub_reader.indexer.add_text(ALPHA, "alpha.txt")
+    stub_reader.indexer.add_text(BETA, "beta.txt")
+    questions = ["Where do rivers run?", "How tall are mountains?", "Where do rivers run?"]
+    
+    data = ask_batch(questions)
+    
+    assert [result["question"] for result in data["results"]] == questions
+    assert data["results"][0]["answers"] == data["results"][2]["answers"]
+    for result in data["results"]:
+        assert result["answers"]
+        assert all(answer["answer"].endswith(f"({result['question']})") for answer in result["answers"])
+    # Every (question, passage) pair reached the reader once
+    assert len(stub_reader.pairs) == len(set(stub_reader.pairs))
+    assert {question for question, _ in stub_reader.pairs} == set(questions)
+    assert data["cached_count"] == 0
+
+
+def test_scope_applies_to_every_question(stub_reader):
+    stub_reader.indexer.add_text(ALPHA, "alpha.txt")
+    beta_id, _, _ = stub_reader.indexer.add_text(BETA, "beta.txt")
+    
+    data = ask_batch(["Where do rivers run?", "Alpha mountains?"], doc_ids=[beta_id])
+    
+    for result in data["results"]:
+        assert result["answers"]
+        assert {answer["source_document"] for answer in result["answers"]} == {"beta.txt"}
+    assert all(context.startswith("Beta") for _, context in stub_reader.pairs)
+
+
+def test_second_batch_is_served_from_the_answer_cache(stub_reader):
+    stub_reader.indexer.add_text(ALPHA, "alpha.txt")
+    first = ask_batch(["Where do rivers run?"])
+    read = len(stub_reader.pairs)
+    
+    second = ask_batch(["How tall are mountains?", "Where do rivers run?"])
+    
+    assert [result["cached"] for result in second["results"]] == [False, True]
+    assert second["results"][1]["answers"] == first["results"][0]["answers"]
+    assert {question for question, _ in stub_reader.pairs[read:]} == {"How tall are mountains?"}
@@ -0,0 +1,92 @@
+"""
+/api/qa/ask-stream reports progress as events and stops reading when the client leaves
+"""
+import asyncio
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models.schemas import QuestionRequest
+from app.routes import qa
+from app.services.inference_scheduler import InferenceScheduler
+
+TEXT = " ".join(f"Person{i} took the train to city {i}." for i in range(12))
+
+
+class _Request:
+    """Enough of a Starlette request for stream_answers"""
+    
+    def __init__(self, disconnected=False):
+        self.disconnected = disconnected
+    
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def test_events_arrive_as_ndjson_in_order(stub_reader):
+    stub_reader.indexer.add_text(TEXT, "trains.txt")
+    
+    response = TestClient(app).post(
+        "/api/qa/ask-stream",
+        json={"question": "Where did Person3 go?", "top_k": 2, "use_cache": False}
+    )
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    
+    assert events[0]["event"] == "retrieval"
+    retrieved = len(events[0]["passages"])
+    assert retrieved > 0
+    answers = events[1:-1]
+    assert [event["event"] for event in answers] == ["answer"] * retrieved
+    assert [event["passages_read"] for event in answers] == list(range(1, retrieved + 1))
+    assert events[-1]["event"] == "done"
+    assert events[-1]["answers"] == answers[-1]["answers"]
+    assert len(events[-1]["answers"]) == 2
+
+
+def test_disconnect_before_reading_skips_the_reader(stub_reader):
+    stub_reader.indexer.add_text(TEXT, "trains.txt")
+    request = QuestionRequest(question="Where did Person3 go?", use_cache=False)
+    
+    async def collect():
+        events = qa.stream_answers(_Request(disconnected=True), request, stub_reader.indexer, None)
+        return [event["event"] async for event in events]
+    
+    assert asyncio.run(collect()) == ["retrieval"]
+    assert stub_reader.pairs == []
+
+
+def test_closed_stream_cancels_queued_pairs(stub_reader, monkeypatch):
+    stub_reader.indexer.add_text(TEXT, "trains.txt")
+    # One pair per batch, so the rest of the round waits in the queue
+    scheduler = InferenceScheduler(stub_reader, max_batch_size=1, max_wait_ms=1)
+    monkeypatch.setattr(qa, "scheduler", scheduler)
+    stub_reader.release.clear()
+    request = QuestionRequest(question="Where did Person3 go?", use_cache=False)
+    
+    async def read_then_leave():
+        events = qa.stream_answers(_Request(), request, stub_reader.indexer, None)
+        retrieval = await events.__anext__()
+        # The stream is cancelled while it waits for the first reader result
+        waiting = asyncio.ensure_future(events.__anext__())
+        while not stub_reader.started.is_set():
+            await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        await events.aclose()
+        return len(retrieval["passages"])
+    
+    retrieved = asyncio.run(read_then_leave())
+    assert retrieved > 1
+    stub_reader.release.set()
+    deadline = time.time() + 10
+    while scheduler.get_statistics()["queue_depth"] and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    
+    # Only the pair the reader had already started on was read
+    assert len(stub_reader.pairs) == 1
+    assert scheduler.get_statistics()["batches_run"] == 1
@@ -0,0 +1,80 @@
+"""
+BM25 shards score and compact without holding the shared statistics lock
+"""
+import threading
+
+from app.services import bm25_index
+from app.services.bm25_index import BM25Index
+from app.services.retrieval_index import create_index
+
+TEXTS = [f"passage {i} mentions topic{i % 7} and word{i}" for i in range(60)]
+
+
+def is_free(lock):
+    """Whether another thread could take the lock right now"""
+    result = []
+    
+    def probe():
+        result.append(lock.acquire(blocking=False))
+        if result[0]:
+            lock.release()
+    
+    thread = threading.Thread(target=probe)
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def ranking(index, query):
+    return [passage_id for passage_id, _ in index.search(query, top_k=60)]
+
+
+def test_shard_search_runs_while_another_shard_is_busy():
+    index = create_index("bm25", shards=2, background_compaction=False)
+    index.add(list(range(0, 30)), TEXTS[0:30])
+    index.add(list(range(30, 60)), TEXTS[30:60])
+    busy, idle = index.shards
+    results = []
+    
+    with busy._postings_lock:
+        searcher = threading.Thread(target=lambda: results.append(idle.search("word40 topic5", 5)))
+        searcher.start()
+        searcher.join(timeout=10)
+        assert not searcher.is_alive()
+    assert results[0][0][0] == 40
+
+
+def test_changes_during_compaction_are_kept(monkeypatch):
+    index = BM25Index(tombstone_ratio=1.0, background_compaction=False)
+    index.add(list(range(0, 50)), TEXTS[0:50])
+    index.remove([1, 2, 3])
+    posting_list = bm25_index._PostingList
+    changed = []
+    
+    def posting_list_with_changes():
+        # The first list built by compact(): no lock may be held
+        if not changed:
+            changed.append(True)
+            assert is_free(index._lock)
+            assert is_free(index._postings_lock)
+            index.remove([4, 25])
+            index.add(list(range(50, 60)), TEXTS[50:60])
+        return posting_list()
+    
+    monkeypatch.setattr(bm25_index, "_PostingList", posting_list_with_changes)
+    index.compact()
+    monkeypatch.setattr(bm25_index, "_PostingList", posting_list)
+    
+    live = [i for i in range(60) if i not in (1, 2, 3, 4, 25)]
+    reference = BM25Index(background_compaction=False)
+    reference.add(live, [TEXTS[i] for i in live])
+    
+    assert changed
+    assert index.get_statistics()["tombstones"] == 2
+    # Scores are scaled by bounds that still count the tombstones, so compare rankings
+    for query in ("word4 topic4", "word25", "word55 topic6", "passage topic3"):
+        assert ranking(index, query) == ranking(reference, query)
+    
+    index.compact()
+    assert index.get_statistics()["tombstones"] == 0
+    assert index.search("word55 topic6", top_k=60) == reference.search("word55 topic6", top_k=60)
@@ -0,0 +1,81 @@
+"""
+BM25 MaxScore pruning returns the same top-k as exhaustive BM25 scoring
+"""
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from app.services.bm25_index import BM25Index
+from app.services.retrieval_index import tokenize
+
+WORDS = [f"w{i}" for i in range(40)]
+# Zipf-like term frequencies, so some posting lists are long and some short
+WEIGHTS = [1 / (i + 1) for i in range(len(WORDS))]
+
+
+def random_text(rng):
+    return " ".join(rng.choices(WORDS, weights=WEIGHTS, k=rng.randint(1, 20)))
+
+
+def brute_force(texts, live, query, k1=1.5, b=0.75):
+    """Scores of every live passage with a positive BM25 score, best first"""
+    counts = {i: Counter(tokenize(texts[i])) for i in live}
+    num_passages = len(live)
+    avg_len = sum(sum(c.values()) for c in counts.values()) / max(num_passages, 1) or 1.0
+    scores = {}
+    for term, qtf in Counter(tokenize(query)).items():
+        df = sum(1 for i in live if term in counts[i])
+        if not df:
+            continue
+        idf = math.log(1 + (num_passages - df + 0.5) / (df + 0.5))
+        for i in live:
+            tf = counts[i][term]
+            if tf:
+                norm = k1 * (1 - b + b * sum(counts[i].values()) / avg_len)
+                scores[i] = scores.get(i, 0.0) + qtf * idf * (k1 + 1) * tf / (tf + norm)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def assert_same_top_k(index, texts, live, query, top_k):
+    results = index.search(query, top_k)
+    every_score = brute_force(texts, live, query)
+    expected = every_score[:top_k]
+    assert len(results) == min(top_k, len(live))
+    matched = results[:len(expected)]
+    assert all(score > 0 for _, score in matched)
+    assert all(score == 0 for _, score in results[len(expected):])
+    # Scores are normalized by a corpus-wide bound, so compare up to one scale factor
+    scale = matched[0][1] / expected[0][1] if expected else 1.0
+    for (passage_id, score), (expected_id, expected_score) in zip(matched, expected):
+        assert score == pytest.approx(expected_score * scale, rel=1e-9)
+        # Ids can only differ between passages with equal scores
+        if passage_id != expected_id:
+            assert dict(every_score).get(passage_id, 0.0) == pytest.approx(expected_score, rel=1e-9)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_maxscore_matches_brute_force(seed):
+    rng = random.Random(seed)
+    count = rng.randint(1, 150)
+    texts = [random_text(rng) for _ in range(count)]
+    index = BM25Index(tombstone_ratio=1.0, background_compaction=False)
+    index.add(list(range(count)), texts)
+    live = set(range(count))
+    queries = [" ".join(rng.choices(WORDS, k=rng.randint(1, 5))) for _ in range(5)]
+    
+    def check():
+        for query in queries:
+            assert_same_top_k(index, texts, sorted(live), query, rng.randint(1, 12))
+    
+    check()
+    
+    removed = set(rng.sample(sorted(live), rng.randint(0, count // 2)))
+    index.remove(removed)
+    live -= removed
+    check()
+    
+    index.compact()
+    assert index.get_statistics()["tombstones"] == 0
+    check()
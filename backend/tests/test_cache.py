@@ -0,0 +1,95 @@
+"""
+AnswerCache and ReaderCache invalidation, expiry and size limits
+"""
+from app.services import cache
+from app.services.cache import AnswerCache, ReaderCache
+
+ANSWERS = [{"answer": "Paris", "context": "Paris is the capital of France."}]
+
+
+class _Clock:
+    """Stand-in for time.monotonic that only moves when told to"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+
+def test_answers_of_older_corpus_versions_are_dropped():
+    answers = AnswerCache()
+    answers.put("What is the capital?", 3, 1, ANSWERS)
+    answers.put("Who wrote it?", 3, 1, ANSWERS, scope=("doc-a",))
+    assert answers.get("  what is the CAPITAL? ", 3, 1) == ANSWERS
+    assert answers.get("What is the capital?", 3, 1, scope=("doc-a",)) is None
+    
+    # The first lookup at a newer version drops every older entry
+    assert answers.get("What is the capital?", 3, 2) is None
+    assert answers.get_statistics()["entries"] == 0
+    assert answers.get("What is the capital?", 3, 1) is None
+    
+    # Answers computed against a corpus that has changed since are not stored
+    answers.put("What is the capital?", 3, 1, ANSWERS)
+    assert answers.get_statistics()["entries"] == 0
+    answers.put("What is the capital?", 3, 2, ANSWERS)
+    assert answers.get("What is the capital?", 3, 2) == ANSWERS
+
+
+def test_answers_expire_after_the_ttl(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    answers = AnswerCache(ttl_seconds=60)
+    answers.put("What is the capital?", 3, 1, ANSWERS)
+    
+    clock.now += 59
+    assert answers.get("What is the capital?", 3, 1) == ANSWERS
+    clock.now += 1
+    assert answers.get("What is the capital?", 3, 1) is None
+    statistics = answers.get_statistics()
+    assert statistics["expirations"] == 1
+    assert statistics["entries"] == 0
+
+
+def test_answers_are_evicted_least_recently_used_first_past_the_byte_cap():
+    # Each entry is 256 bytes of overhead plus the length of its strings
+    size = 256 + len("Paris") + len(ANSWERS[0]["context"])
+    answers = AnswerCache(max_bytes=3 * size)
+    for question in ("q1", "q2", "q3"):
+        answers.put(question, 3, 1, ANSWERS)
+    assert answers.get("q1", 3, 1) == ANSWERS
+    
+    answers.put("q4", 3, 1, ANSWERS)
+    assert answers.get("q2", 3, 1) is None
+    assert all(answers.get(question, 3, 1) == ANSWERS for question in ("q1", "q3", "q4"))
+    statistics = answers.get_statistics()
+    assert statistics["bytes"] == 3 * size
+    assert statistics["evictions"] == 1
+    
+    # Entries bigger than the whole cache are not stored
+    answers.put("q5", 3, 1, ANSWERS * 4)
+    assert answers.get("q5", 3, 1) is None
+    assert answers.get_statistics()["entries"] == 3
+
+
+def test_reader_results_never_expire_and_respect_their_byte_cap(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    reader = ReaderCache(max_result_bytes=2 * (200 + len("Paris")))
+    keys = [
+        ReaderCache.result_key("What is the capital?", ReaderCache.passage_key("text", passage_id), "model", 30)
+        for passage_id in (1, 2, 3)
+    ]
+    reader.results.put(keys[0], {"answer": "Paris"})
+    clock.now += 10 ** 6
+    assert reader.results.get(keys[0]) == {"answer": "Paris"}
+    
+    reader.results.put(keys[1], {"answer": "Paris"})
+    reader.results.put(keys[2], {"answer": "Paris"})
+    assert reader.results.get(keys[0]) is None
+    assert reader.results.get(keys[2]) == {"answer": "Paris"}
+    assert reader.get_statistics()["results"]["evictions"] == 1
+    
+    # Passages without an id are keyed by their text
+    assert ReaderCache.passage_key("text") == ReaderCache.passage_key("text")
+    assert ReaderCache.passage_key("text") != ReaderCache.passage_key("other text")
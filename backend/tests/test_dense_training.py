@@ -0,0 +1,93 @@
+"""
+IVF training of DenseIndex runs off the add path
+"""
+import threading
+import time
+
+import numpy as np
+
+from app.services.dense_index import DenseIndex
+
+
+class _HashEmbedder:
+    """Deterministic unit vectors, one per text"""
+    
+    def embed(self, texts):
+        vectors = np.stack([
+            np.random.default_rng(abs(hash(text)) % 2 ** 32).standard_normal(16)
+            for text in texts
+        ]).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class _TestIndex(DenseIndex):
+    embedder = _HashEmbedder()
+
+
+def fill(index, count, first=0):
+    for start in range(first, first + count, 100):
+        ids = list(range(start, min(start + 100, first + count)))
+        index.add(ids, [f"passage {i}" for i in ids])
+
+
+def wait_for_training(index):
+    deadline = time.time() + 30
+    while index.get_statistics()["ivf_training"] and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_background_training_builds_lists_over_every_row():
+    exact = _TestIndex("test", ivf_min_rows=10 ** 9)
+    background = _TestIndex("test", ivf_min_rows=500, nprobe=10 ** 6)
+    fill(exact, 800)
+    fill(background, 800)
+    wait_for_training(background)
+    
+    statistics = background.get_statistics()
+    assert statistics["ivf_lists"] > 0
+    assert sum(len(rows) for rows in background._lists) == 800
+    query = _HashEmbedder().embed(["passage 123"])[0]
+    assert background.search_vector(query, 5) == exact.search_vector(query, 5)
+    assert background.search_vector(query, 1)[0][0] == 123
+
+
+def test_rows_added_during_training_are_searchable():
+    index = _TestIndex("test", ivf_min_rows=500, nprobe=1)
+    fill(index, 500)
+    # Training is running (or done); these rows land in the lists either way
+    fill(index, 300, first=500)
+    wait_for_training(index)
+    
+    for passage_id in (10, 650, 799):
+        query = _HashEmbedder().embed([f"passage {passage_id}"])[0]
+        assert index.search_vector(query, 1)[0][0] == passage_id
+
+
+def test_search_while_adding():
+    index = _TestIndex("test", ivf_min_rows=200, nprobe=10 ** 6, background_training=False)
+    fill(index, 200)
+    query = _HashEmbedder().embed(["passage 7"])[0]
+    stop = threading.Event()
+    errors = []
+    
+    def search():
+        while not stop.is_set():
+            try:
+                index.search_vector(query, 5)
+            except Exception as e:
+                errors.append(e)
+    
+    searcher = threading.Thread(target=search)
+    searcher.start()
+    try:
+        for start in range(200, 2200, 5):
+            index.add(list(range(start, start + 5)), [f"passage {i}" for i in range(start, start + 5)])
+    finally:
+        stop.set()
+        searcher.join()
+    
+    assert not errors
+    assert sum(len(rows) for rows in index._lists) == 2200
+    for passage_id in (7, 1000, 2199):
+        query = _HashEmbedder().embed([f"passage {passage_id}"])[0]
+        assert index.search_vector(query, 1)[0][0] == passage_id
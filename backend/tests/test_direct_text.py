@@ -0,0 +1,47 @@
+"""
+/api/qa/ask-direct must not share reader cache entries between texts
+"""
+from app.routes import qa
+
+FIRST_TEXT = (
+    "Marie Curie was born in Warsaw in 1867. She moved to Paris to study physics. "
+    "She won the Nobel Prize twice. Her daughter also became a scientist."
+)
+SECOND_TEXT = (
+    "Alan Turing was born in London in 1912. He studied mathematics at Cambridge. "
+    "He designed early computers. His work shaped computer science."
+)
+QUESTION = "Where was this person born?"
+
+
+def ask_direct(client, text):
+    response = client.post(
+        "/api/qa/ask-direct",
+        json={"text": text, "question": QUESTION, "top_k": 3}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_same_question_on_two_texts_is_read_twice(client):
+    qa.reader_cache.clear()
+    ask_direct(client, FIRST_TEXT)
+    hits = qa.reader_cache.results.get_statistics()["hits"]
+    
+    data = ask_direct(client, SECOND_TEXT)
+    
+    # Positions 0..n of the second text are not cache keys for the first text's results
+    assert qa.reader_cache.results.get_statistics()["hits"] == hits
+    for answer in data["answers"]:
+        assert answer["answer"] in SECOND_TEXT
+        assert answer["source_text"] in SECOND_TEXT
+        assert SECOND_TEXT[answer["start_position"]:answer["end_position"]] == answer["source_text"]
+
+
+def test_same_text_is_served_from_the_cache(client):
+    qa.reader_cache.clear()
+    first = ask_direct(client, FIRST_TEXT)
+    second = ask_direct(client, FIRST_TEXT)
+    
+    assert second["answers"] == first["answers"]
+    assert qa.reader_cache.results.get_statistics()["hits"] > 0
@@ -0,0 +1,27 @@
+"""
+Early exit never returns fewer answers than requested
+"""
+from app.services.qa_engine import QAEngine
+
+
+def make_engine():
+    return QAEngine(load_model=False, early_exit=True, early_exit_threshold=0.9, early_exit_round_size=1)
+
+
+def answer(qa_score, similarity=0.5):
+    return {"qa_score": qa_score, "confidence_score": QAEngine.combined_score(similarity, qa_score)}
+
+
+def test_confident_answer_does_not_stop_before_top_k():
+    engine = make_engine()
+    
+    assert not engine.should_stop_reading([answer(0.95)], next_similarity=0.4, top_k=3)
+    assert engine.should_stop_reading([answer(0.95), answer(0.3), answer(0.2)], next_similarity=0.4, top_k=3)
+
+
+def test_reading_continues_until_top_k_answers():
+    engine = make_engine()
+    ordered = [(f"passage {i}", 1.0 - i / 10, i) for i in range(5)]
+    
+    assert engine.next_reading_round(ordered, [answer(0.99)], 1, top_k=3) == ordered[1:2]
+    assert engine.next_reading_round(ordered, [answer(0.99)] * 3, 3, top_k=3) == []
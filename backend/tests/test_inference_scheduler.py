@@ -0,0 +1,86 @@
+"""
+InferenceScheduler batches pairs across requests and skips cached and cancelled ones
+"""
+import threading
+import time
+
+from app.services.inference_scheduler import InferenceScheduler
+
+
+class _FakeEngine:
+    """Records reader batches; the first batch can be held until released"""
+    
+    def __init__(self, hold_first=False, cached=()):
+        self.batches = []
+        self.cached = set(cached)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not hold_first:
+            self.release.set()
+    
+    def cached_answer(self, question, context, passage_id=None):
+        if question in self.cached:
+            return {"answer": f"cached {question}"}
+        return None
+    
+    def answer_batch(self, pairs, passage_ids=None, lookup_cache=True):
+        assert not lookup_cache
+        self.started.set()
+        self.release.wait(10)
+        self.batches.append([question for question, _ in pairs])
+        return [{"answer": f"read {question}"} for question, _ in pairs]
+
+
+def test_batches_are_capped_at_max_batch_size():
+    engine = _FakeEngine(hold_first=True)
+    scheduler = InferenceScheduler(engine, max_batch_size=4, max_wait_ms=200)
+    first = scheduler.submit([("q0", "context")])
+    assert engine.started.wait(10)
+    # Queued while the first batch is being read
+    rest = scheduler.submit([(f"q{i}", "context") for i in range(1, 11)])
+    engine.release.set()
+    
+    results = [future.result(10) for future in first + rest]
+    assert [result["answer"] for result in results] == [f"read q{i}" for i in range(11)]
+    assert [len(batch) for batch in engine.batches] == [1, 4, 4, 2]
+    assert scheduler.get_statistics()["batches_run"] == 4
+
+
+def test_partial_batch_is_flushed_when_the_wait_expires():
+    engine = _FakeEngine()
+    scheduler = InferenceScheduler(engine, max_batch_size=16, max_wait_ms=50)
+    started = time.monotonic()
+    futures = scheduler.submit([(f"q{i}", "context") for i in range(3)])
+    
+    assert [future.result(10)["answer"] for future in futures] == ["read q0", "read q1", "read q2"]
+    assert time.monotonic() - started >= 0.05
+    assert engine.batches == [["q0", "q1", "q2"]]
+
+
+def test_cached_pairs_are_answered_on_submit():
+    engine = _FakeEngine(hold_first=True, cached={"q1"})
+    scheduler = InferenceScheduler(engine, max_batch_size=16, max_wait_ms=1)
+    futures = scheduler.submit([("q0", "context"), ("q1", "context")])
+    
+    # Resolved before the reader has run anything
+    assert futures[1].done()
+    assert futures[1].result() == {"answer": "cached q1"}
+    engine.release.set()
+    assert futures[0].result(10) == {"answer": "read q0"}
+    assert engine.batches == [["q0"]]
+    assert scheduler.get_statistics()["pairs_from_cache"] == 1
+
+
+def test_cancelled_pairs_are_never_read():
+    engine = _FakeEngine(hold_first=True)
+    scheduler = InferenceScheduler(engine, max_batch_size=16, max_wait_ms=1)
+    first = scheduler.submit([("q0", "context")])
+    assert engine.started.wait(10)
+    kept, dropped = scheduler.submit([("q1", "context"), ("q2", "context")])
+    assert dropped.cancel()
+    engine.release.set()
+    
+    assert first[0].result(10) == {"answer": "read q0"}
+    assert kept.result(10) == {"answer": "read q1"}
+    assert dropped.cancelled()
+    assert engine.batches == [["q0"], ["q1"]]
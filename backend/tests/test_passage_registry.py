@@ -0,0 +1,44 @@
+"""
+PassageRegistry frees the table of deleted documents without reusing ids
+"""
+from array import array
+
+from app.services.passage_registry import PAGE_SIZE, PassageRegistry
+
+
+def restore(registry, doc_id, count, first_id):
+    starts = array('l', range(0, 10 * count, 10))
+    ends = array('l', range(5, 10 * count, 10))
+    return registry.restore(doc_id, starts, ends, 1, first_id)
+
+
+def test_release_frees_pages_and_keeps_ids_unique():
+    registry = PassageRegistry()
+    first = restore(registry, "a", PAGE_SIZE + 10, 0)
+    second = restore(registry, "b", 2 * PAGE_SIZE, len(registry))
+    assert registry.get_statistics()["pages"] == 4
+    
+    registry.release("b")
+    assert registry.get_statistics()["pages"] == 2
+    assert registry.lookup(second.start) is None
+    assert registry.lookup(first.stop - 1) == ("a", 10 * (first.stop - 1), 10 * (first.stop - 1) + 5)
+    
+    third = restore(registry, "c", 5, len(registry))
+    assert third.start == second.stop
+    assert registry.lookup(third.start) == ("c", 0, 5)
+
+
+def test_clear_frees_everything_and_ranges_fill_in_out_of_order():
+    registry = PassageRegistry()
+    restore(registry, "a", 3 * PAGE_SIZE, 0)
+    registry.clear()
+    assert registry.get_statistics()["pages"] == 0
+    assert registry.lookup(5) is None
+    
+    # A range reserved earlier can be filled in after a later one
+    registry.reserve(len(registry) + 100)
+    late = restore(registry, "late", 10, len(registry))
+    early = restore(registry, "early", 100, late.start - 100)
+    assert registry.lookup(early.start)[0] == "early"
+    assert registry.lookup(late.start)[0] == "late"
+    assert registry.lookup(3 * PAGE_SIZE - 1) is None
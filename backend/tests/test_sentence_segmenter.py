@@ -0,0 +1,45 @@
+"""
+Incremental sentence segmentation matches a regex split of the whole text
+"""
+import random
+import re
+
+import pytest
+
+from app.utils.sentence_segmenter import SentenceSegmenter
+
+TEXT = "  First one. Second?!  Third \n\t fourth... e.g. fifth!\n\nLast one without end "
+
+
+def reference_split(text):
+    """The split the segmenter replaced: regex over the whole text"""
+    return [sentence.strip() for sentence in re.split(r'(?<=[.!?])\s+', text) if sentence.strip()]
+
+
+def segment_in_chunks(text, split_points):
+    segmenter = SentenceSegmenter()
+    emitted = []
+    bounds = [0] + list(split_points) + [len(text)]
+    for start, stop in zip(bounds, bounds[1:]):
+        emitted += segmenter.feed(text[start:stop])
+    emitted += segmenter.finish()
+    return segmenter, emitted
+
+
+@pytest.mark.parametrize("split", range(len(TEXT) + 1))
+def test_two_chunks_split_anywhere(split):
+    segmenter, emitted = segment_in_chunks(TEXT, [split])
+    expected = reference_split(TEXT)
+    assert emitted == expected
+    # Offsets point at the sentences in the concatenated input
+    assert segmenter.sentences(TEXT) == expected
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_random_chunks(seed):
+    rng = random.Random(seed)
+    text = "".join(rng.choice("ab .!?  \n\t") for _ in range(rng.randint(0, 60)))
+    split_points = sorted(rng.sample(range(len(text) + 1), min(rng.randint(0, 8), len(text) + 1)))
+    segmenter, emitted = segment_in_chunks(text, split_points)
+    assert emitted == reference_split(text)
+    assert segmenter.sentences(text) == reference_split(text)
@@ -0,0 +1,92 @@
+"""
+Two indexers (as in two uvicorn workers) sharing one corpus store
+"""
+from app.services.corpus_store import CorpusStore
+from app.services.document_indexer import DocumentIndexer
+from app.services.text_store import TextSegmentFile
+
+
+def make_indexer(tmp_path, retriever="bm25"):
+    return DocumentIndexer(
+        retriever=retriever,
+        store=CorpusStore(str(tmp_path / "corpus.db")),
+        text_store=TextSegmentFile(str(tmp_path / "text.seg")),
+        index_options={"shards": 2}
+    )
+
+
+def text(topic, sentences=8):
+    return " ".join(f"The {topic} report covers item {i} about {topic}." for i in range(sentences))
+
+
+def view(indexer):
+    """Documents with their passage ids and text, as a worker sees them"""
+    return {
+        doc_id: (indexer.documents[doc_id]["passage_ids"], indexer.get_document_text(doc_id))
+        for doc_id in indexer.documents
+    }
+
+
+def test_changes_from_either_side_reach_the_other(tmp_path):
+    first = make_indexer(tmp_path)
+    second = make_indexer(tmp_path)
+    
+    a, _, _ = first.add_text(text("apple"), "apple.txt")
+    b, _, _ = second.add_text(text("banana"), "banana.txt")
+    c, _, _ = first.add_text(text("cherry"), "cherry.txt")
+    second.sync()
+    first.sync()
+    assert set(first.documents) == set(second.documents) == {a, b, c}
+    assert view(first) == view(second)
+    assert second.search("cherry report", top_k=1)[0][0].startswith("The cherry")
+    
+    second.delete_document(a)
+    first.delete_document(b)
+    first.sync()
+    second.sync()
+    assert set(first.documents) == set(second.documents) == {c}
+    assert first.search("apple report", top_k=5) == second.search("apple report", top_k=5)
+    
+    restarted = make_indexer(tmp_path)
+    assert view(restarted) == view(first)
+    
+    cleared_ids = first.documents[c]["passage_ids"]
+    second.clear_all()
+    first.sync()
+    assert first.documents == {}
+    d, _, _ = first.add_text(text("date"), "date.txt")
+    second.sync()
+    assert view(second) == view(first)
+    
+    restarted = make_indexer(tmp_path)
+    assert view(restarted) == view(first)
+    # Passage ids are not handed out again after a clear
+    assert restarted.documents[d]["passage_ids"].start >= cleared_ids.stop
+
+
+def test_other_worker_writes_while_a_document_is_indexed(tmp_path):
+    first = make_indexer(tmp_path)
+    second = make_indexer(tmp_path)
+    old, _, _ = second.add_text(text("old"), "old.txt")
+    first.sync()
+    written = []
+    
+    def progress(done, total):
+        # Runs between the two short store transactions of first.add_text
+        if not written:
+            second.clear_all()
+            written.append(second.add_text(text("kiwi"), "kiwi.txt")[0])
+    
+    mango, _, _ = first.add_text(text("mango", 2000), "mango.txt", progress=progress)
+    kiwi = written[0]
+    second.sync()
+    
+    assert set(first.documents) == set(second.documents) == {mango, kiwi}
+    assert view(first) == view(second)
+    assert first.get_document_text(mango) == text("mango", 2000)
+    # The range reserved for mango comes before kiwi's, which was indexed first
+    assert first.documents[mango]["passage_ids"].stop <= first.documents[kiwi]["passage_ids"].start
+    for indexer in (first, second, make_indexer(tmp_path)):
+        assert indexer.search("mango report item 1500", top_k=1)[0][0].startswith("The mango")
+        assert indexer.search("kiwi report", top_k=1)[0][0].startswith("The kiwi")
+        assert indexer.get_document_text(mango) == text("mango", 2000)
@@ -0,0 +1,90 @@
+"""
+Segment file space is reclaimed after deletes and clear_all
+"""
+import os
+
+from app.services.corpus_store import CorpusStore
+from app.services.document_indexer import DocumentIndexer
+from app.services.text_store import TextSegmentFile
+
+TEXTS = [
+    "Alpha particles are helium nuclei. They are stopped by paper. " * 20,
+    "Beta decay emits electrons. Über-fast electrons pass through paper. " * 20,
+    "Gamma rays are photons. Lead shields against them. " * 20
+]
+
+
+def make_indexer(tmp_path, store=True):
+    return DocumentIndexer(
+        store=CorpusStore(str(tmp_path / "corpus.db")) if store else None,
+        text_store=TextSegmentFile(str(tmp_path / "text.seg"))
+    )
+
+
+def segment_bytes(tmp_path):
+    return sum(entry.stat().st_size for entry in tmp_path.iterdir() if entry.name.startswith("text.seg"))
+
+
+def test_clear_all_empties_the_segment_file(tmp_path):
+    indexer = make_indexer(tmp_path)
+    for i, text in enumerate(TEXTS):
+        indexer.add_text(text, f"doc{i}.txt")
+    assert segment_bytes(tmp_path) > 0
+    
+    indexer.clear_all()
+    assert segment_bytes(tmp_path) == 0
+    
+    restarted = make_indexer(tmp_path)
+    doc_id, _, _ = restarted.add_text(TEXTS[0], "again.txt")
+    assert restarted.get_document_text(doc_id) == TEXTS[0].strip()
+    assert segment_bytes(tmp_path) == len(TEXTS[0].strip())
+
+
+def test_delete_compacts_and_keeps_the_remaining_text(tmp_path):
+    indexer = make_indexer(tmp_path)
+    doc_ids = [indexer.add_text(text, f"doc{i}.txt")[0] for i, text in enumerate(TEXTS)]
+    expected = {doc_id: indexer.get_document_text(doc_id) for doc_id in doc_ids}
+    before = segment_bytes(tmp_path)
+    
+    indexer.delete_document(doc_ids[0])
+    indexer.delete_document(doc_ids[1])
+    assert indexer.text_store.compactions == 1
+    assert segment_bytes(tmp_path) == len(expected[doc_ids[2]].encode("utf-8"))
+    assert segment_bytes(tmp_path) < before
+    assert indexer.get_document_text(doc_ids[2]) == expected[doc_ids[2]]
+    assert "Lead shields" in indexer.search("lead shields", top_k=1)[0][0]
+    
+    restarted = make_indexer(tmp_path)
+    assert restarted.get_document_text(doc_ids[2]) == expected[doc_ids[2]]
+    new_id, _, _ = restarted.add_text(TEXTS[1], "beta.txt")
+    assert restarted.get_document_text(new_id) == TEXTS[1].strip()
+
+
+def test_other_worker_follows_a_compaction(tmp_path):
+    first = make_indexer(tmp_path)
+    doc_ids = [first.add_text(text, f"doc{i}.txt")[0] for i, text in enumerate(TEXTS)]
+    second = make_indexer(tmp_path)
+    # One text loaded before the compaction, one after
+    assert second.get_document_text(doc_ids[1]) == TEXTS[1].strip()
+    
+    first.delete_document(doc_ids[0])
+    first.compact_text(force=True)
+    assert not os.path.exists(tmp_path / "text.seg")
+    
+    second.sync()
+    assert second.text_store.generation == first.text_store.generation
+    assert second.get_document_text(doc_ids[1]) == TEXTS[1].strip()
+    assert second.get_document_text(doc_ids[2]) == TEXTS[2].strip()
+    new_id, _, _ = second.add_text("Neutrons are uncharged. Water slows them down.", "neutron.txt")
+    first.sync()
+    assert first.get_document_text(new_id) == "Neutrons are uncharged. Water slows them down."
+
+
+def test_compaction_without_a_store(tmp_path):
+    indexer = make_indexer(tmp_path, store=False)
+    doc_ids = [indexer.add_text(text, f"doc{i}.txt")[0] for i, text in enumerate(TEXTS)]
+    
+    indexer.delete_document(doc_ids[1])
+    indexer.delete_document(doc_ids[2])
+    assert segment_bytes(tmp_path) == len(TEXTS[0].strip())
+    assert [passage for passage, _, _ in indexer.get_document_passages(doc_ids[0])][0].startswith("Alpha")
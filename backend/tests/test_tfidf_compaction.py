@@ -0,0 +1,47 @@
+"""
+TfidfIndex compaction builds the merged segment outside the lock
+"""
+from scipy import sparse
+
+from app.services import retrieval_index
+from app.services.retrieval_index import TfidfIndex
+
+TEXTS = [f"passage {i} mentions topic{i % 7} and word{i}" for i in range(60)]
+
+
+def make_index():
+    index = TfidfIndex(max_segments=100, tombstone_ratio=1.0, background_compaction=False)
+    for start in range(0, 50, 10):
+        index.add(list(range(start, start + 10)), TEXTS[start:start + 10])
+    index.remove([1, 2, 3])
+    return index
+
+
+def test_changes_during_compaction_are_kept(monkeypatch):
+    index = make_index()
+    vstack = sparse.vstack
+    
+    def vstack_with_changes(blocks, format=None):
+        # Runs while the merged segment is built, so the lock must be free
+        assert index._lock.acquire(blocking=False)
+        index._lock.release()
+        index.remove([4, 25])
+        index.add(list(range(50, 60)), TEXTS[50:60])
+        return vstack(blocks, format=format)
+    
+    monkeypatch.setattr(retrieval_index.sparse, "vstack", vstack_with_changes)
+    index.compact()
+    monkeypatch.setattr(retrieval_index.sparse, "vstack", vstack)
+    
+    reference = TfidfIndex(background_compaction=False)
+    live = [i for i in range(60) if i not in (1, 2, 3, 4, 25)]
+    reference.add(live, [TEXTS[i] for i in live])
+    
+    assert len(index) == len(live)
+    assert len(index._segments) == 2
+    for query in ("word4 topic4", "word25", "word55 topic6", "passage topic3"):
+        results = index.search(query, top_k=60)
+        assert sorted(results) == sorted(reference.search(query, top_k=60))
+        assert not {1, 2, 3, 4, 25} & {passage_id for passage_id, _ in results}
+    scoped = index.search("word4 word25", top_k=60, id_ranges=[range(0, 60)])
+    assert sorted(passage_id for passage_id, _ in scoped) == live
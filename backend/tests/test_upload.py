@@ -0,0 +1,91 @@
+"""
+Background uploads the ingestion queue does not accept leave no temporary file
+"""
+import os
+
+import pytest
+
+from app import config
+from app.routes import documents
+from app.services.ingestion_queue import IngestionQueueFull
+
+
+def upload_files():
+    return set(os.listdir(config.UPLOAD_DIR)) if os.path.isdir(config.UPLOAD_DIR) else set()
+
+
+@pytest.mark.parametrize("error, status_code", [
+    (IngestionQueueFull("2 ingestion jobs are already waiting"), 503),
+    (RuntimeError("cannot schedule new futures after shutdown"), 500)
+])
+def test_rejected_background_upload_removes_its_file(client, monkeypatch, error, status_code):
+    def submit(*args, **kwargs):
+        raise error
+    
+    monkeypatch.setattr(documents.ingestion, "submit", submit)
+    before = upload_files()
+    response = client.post(
+        "/api/documents/upload",
+        params={"background": "true"},
+        files={"file": ("notes.txt", b"Some notes about the project.", "text/plain")}
+    )
+    assert response.status_code == status_code
+    assert upload_files() == before
+
+
+def multipart_body(content):
+    boundary = b"limit-test-boundary"
+    body = (
+        b"--" + boundary + b"\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="notes.txt"\r\n'
+        b"Content-Type: text/plain\r\n\r\n" + content + b"\r\n"
+        b"--" + boundary + b"--\r\n"
+    )
+    return body, {"content-type": "multipart/form-data; boundary=limit-test-boundary"}
+
+
+def chunks(body, size=1024):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_oversized_upload_is_rejected_while_it_arrives(monkeypatch, chunked):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.utils.uploads import UploadSizeLimit
+    
+    def save_upload(*args, **kwargs):
+        raise AssertionError("the route must not run")
+    
+    monkeypatch.setattr(documents, "save_upload", save_upload)
+    body, headers = multipart_body(b"x" * 64 * 1024)
+    limited = TestClient(UploadSizeLimit(app, paths=["/api/documents/upload"], max_bytes=16 * 1024))
+    # A generator body is sent with chunked transfer encoding and no Content-Length
+    response = limited.post(
+        "/api/documents/upload",
+        content=chunks(body) if chunked else body,
+        headers=headers
+    )
+    assert response.status_code == 413
+    assert "upload limit" in response.json()["detail"]
+
+
+def test_upload_within_the_limit_reaches_the_route(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.utils.uploads import UploadSizeLimit
+    
+    saved = []
+    
+    async def save_upload(file, *args, **kwargs):
+        saved.append(await file.read())
+        raise documents.UploadTooLarge("stop here")
+    
+    monkeypatch.setattr(documents, "save_upload", save_upload)
+    body, headers = multipart_body(b"Some notes about the project.")
+    limited = TestClient(UploadSizeLimit(app, paths=["/api/documents/upload"], max_bytes=16 * 1024))
+    response = limited.post("/api/documents/upload", content=chunks(body, 16), headers=headers)
+    assert response.status_code == 413
+    assert response.json()["detail"] == "stop here"
+    assert saved == [b"Some notes about the project."]
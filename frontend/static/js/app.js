@@ -137,6 +137,9 @@ async function deleteDocument(docId, filename) {
 
 // ==================== Question Answering ====================
 
+// Stream of the question being answered; asking again cancels it
+let activeQuestion = null;
+
 async function askQuestion() {
     const question = document.getElementById('questionInput').value.trim();
     const topK = parseInt(document.getElementById('topK').value);
@@ -146,12 +149,21 @@ async function askQuestion() {
         return;
     }
 
+    if (activeQuestion) {
+        activeQuestion.abort();
+    }
+    const controller = new AbortController();
+    activeQuestion = controller;
+    const startTime = performance.now();
+    const elapsed = () => ((performance.now() - startTime) / 1000).toFixed(2);
+
     try {
         showLoading(true);
-        const response = await fetch(`${API_BASE_URL}/qa/ask`, {
+        const response = await fetch(`${API_BASE_URL}/qa/ask-stream`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ question, top_k: topK })
+            body: JSON.stringify({ question, top_k: topK }),
+            signal: controller.signal
         });
 
         if (!response.ok) {
@@ -159,12 +171,51 @@ async function askQuestion() {
             throw new Error(error.detail || 'Failed to get answer');
         }
 
-        const data = await response.json();
-        displayResults(data);
+        // Show answers as each reader pass completes, then the final ranking
+        await readEvents(response, event => {
+            if (event.event === 'retrieval') {
+                displayResults({ question, answers: [], processing_time: elapsed() }, true);
+            } else if (event.event === 'answer') {
+                displayResults({ question, answers: event.answers, processing_time: elapsed() }, true);
+            } else if (event.event === 'done') {
+                displayResults(event);
+            } else if (event.event === 'error') {
+                throw new Error(event.detail || 'Failed to get answer');
+            }
+        });
         showLoading(false);
     } catch (error) {
-        showError(error.message);
-        showLoading(false);
+        // A newer question took over; its own request manages the loading state
+        if (error.name !== 'AbortError') {
+            showError(error.message);
+            showLoading(false);
+        }
+    } finally {
+        if (activeQuestion === controller) {
+            activeQuestion = null;
+        }
+    }
+}
+
+async function readEvents(response, onEvent) {
+    // The stream is newline-delimited JSON; a chunk can end mid-line
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+    }
+
+    if (buffered.trim()) {
+        onEvent(JSON.parse(buffered));
     }
 }
 
@@ -200,13 +251,20 @@ async function askQuestionDirect() {
     }
 }
 
-function displayResults(data) {
+function displayResults(data, streaming = false) {
     document.getElementById('welcomeMessage').style.display = 'none';
     document.getElementById('resultsSection').style.display = 'block';
 
     document.getElementById('questionDisplay').textContent = data.question;
-    document.getElementById('processingTime').textContent = 
-        `Processing time: ${data.processing_time}s`;
+    document.getElementById('processingTime').textContent = streaming
+        ? `Reading passages... ${data.processing_time}s`
+        : `Processing time: ${data.processing_time}s`;
+
+    if (data.answers.length === 0 && streaming) {
+        document.getElementById('answersContainer').innerHTML =
+            '<p class="text-muted">Reading passages...</p>';
+        return;
+    }
 
     if (data.answers.length === 0) {
         document.getElementById('answersContainer').innerHTML = 